@@ -0,0 +1,219 @@
+"""
+Sonarr/Radarr custom script: process exactly the file that was just imported.
+
+Point a Custom Script connection (On Import / On Upgrade) at this file. The
+arr passes everything through environment variables, so no arguments are
+needed; for a manual run the same values can be given as options.
+
+For an episode the sidecar .srt is merged and the audio tracks relabelled
+(as merge_subtitles.py does), then the episode is tagged from TVDB (as
+update_tv_metadata.py does). A movie only gets the subtitle merge. Both steps
+consult the library manifest first, so a file that is already up to date costs
+a few stat calls. Nothing heavy is imported until a step actually needs it,
+and the TVDB login token is cached on disk, so the hook does not log in on
+every import.
+"""
+
+import argparse
+import functools
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+sys.path.insert(0, os.path.join(HERE, os.pardir, 'tv-show-subtitles'))
+sys.path.insert(0, os.path.join(HERE, os.pardir, 'tv-show-metadata'))
+from media_common import trace  # noqa: E402
+from media_common.manifest import Manifest  # noqa: E402
+
+
+def arr_event(environ):
+    """Map the Sonarr/Radarr environment to a dict describing the imported file, or None."""
+    if 'sonarr_eventtype' in environ:
+        episodes = environ.get('sonarr_episodefile_episodenumbers', '')
+        return {
+            'kind': 'test' if environ['sonarr_eventtype'] == 'Test' else 'episode',
+            'file_path': environ.get('sonarr_episodefile_path'),
+            'library_root': environ.get('sonarr_series_path'),
+            'series_id': environ.get('sonarr_series_tvdbid'),
+            'season': environ.get('sonarr_episodefile_seasonnumber'),
+            'episode': episodes.split(',')[0] if episodes else None,
+        }
+    if 'radarr_eventtype' in environ:
+        movie_path = environ.get('radarr_movie_path')
+        return {
+            'kind': 'test' if environ['radarr_eventtype'] == 'Test' else 'movie',
+            'file_path': environ.get('radarr_moviefile_path'),
+            # merge_subtitles.py keeps the movies manifest in the folder holding all movie folders
+            'library_root': os.path.dirname(movie_path) if movie_path else None,
+        }
+    return None
+
+
+def merge_episode(file_path, manifest, force, debug):
+    """Merge the episode's .srt into '<name>.output.mp4'. Returns the output path, or None."""
+    import merge_subtitles
+
+    merge_subtitles.DEBUG = debug
+    merge_subtitles.FORCE = force
+    merge_subtitles.MANIFEST = manifest
+    season_folder, video_file = os.path.split(file_path)
+    video_file_path, subtitle_file_path, output_file_path = merge_subtitles.episode_paths(season_folder, video_file)
+    if not os.path.isfile(subtitle_file_path):
+        print(f"No subtitles for {video_file}; nothing to merge.")
+        return None
+
+    inputs = [video_file_path, subtitle_file_path]
+    params = merge_subtitles.merge_params([subtitle_file_path], video_file)
+    if merge_subtitles.is_up_to_date(video_file_path, inputs, output_file_path, params):
+        print(f"Subtitles already merged into {output_file_path}.")
+        return output_file_path
+
+    from media_common.probe_cache import ProbeCache
+    merge_subtitles.PROBE_CACHE = ProbeCache()
+    try:
+        merge_subtitles.recorded(video_file_path, inputs, output_file_path,
+                                 functools.partial(merge_subtitles.merge_subtitles_in_episode, season_folder, video_file),
+                                 params)()
+    finally:
+        merge_subtitles.PROBE_CACHE.close()
+    return output_file_path
+
+
+def merge_movie(file_path, manifest, force, debug):
+    import merge_subtitles
+
+    merge_subtitles.DEBUG = debug
+    merge_subtitles.FORCE = force
+    merge_subtitles.MANIFEST = manifest
+    movie_folder = os.path.dirname(file_path)
+    video_file, subtitle_files = merge_subtitles.movie_folder_files(movie_folder)
+    if video_file is None or not subtitle_files:
+        print(f"No subtitles in {movie_folder}; nothing to merge.")
+        return None
+
+    inputs = [file_path] + [os.path.join(movie_folder, f) for f in subtitle_files]
+    output_file_path = merge_subtitles.movie_output_path(movie_folder, video_file)
+    params = merge_subtitles.merge_params(inputs[1:], video_file)
+    if merge_subtitles.is_up_to_date(file_path, inputs, output_file_path, params):
+        print(f"Subtitles already merged into {output_file_path}.")
+        return output_file_path
+
+    from media_common.probe_cache import ProbeCache
+    merge_subtitles.PROBE_CACHE = ProbeCache()
+    try:
+        merge_subtitles.recorded(file_path, inputs, output_file_path,
+                                 functools.partial(merge_subtitles.merge_subtitles_in_movie_folder, movie_folder), params)()
+    finally:
+        merge_subtitles.PROBE_CACHE.close()
+    return output_file_path
+
+
+def tag_episode(file_path, series_id, season, episode, api_key, manifest, force, debug):
+    """Tag one episode from TVDB. Returns 'tagged', 'current', or None when TVDB has no such episode."""
+    import update_tv_metadata as tagger
+    from media_common import faults
+    from media_common.artwork import ArtworkStore
+    from media_common.tvdb_client import CachedTVDB
+
+    # The same retries as the batch script, so a TVDB hiccup does not fail the import
+    retry = faults.RetryPolicy()
+    tvdb = CachedTVDB(api_key, offline=api_key is None, retry=retry)
+    series_metadata = tagger.get_series_metadata(tvdb, series_id, debug)
+    season_info = tvdb.get_season_info(series_id, season)
+    metadata = tvdb.get_episode(series_id, season, episode) if season_info else None
+    if not metadata:
+        print(f"No TVDB metadata for series {series_id} S{int(season):02d}E{int(episode):02d}.")
+        return None
+    season_metadata = tagger.get_season_metadata(tvdb, season_info, debug)
+
+    params = tagger.tag_params(metadata, series_metadata, season_metadata, False)
+    if not force and manifest.is_done(tagger.TAG_OPERATION, file_path, [file_path], params):
+        print(f"Tags already up to date for {file_path}.")
+        return 'current'
+
+    inputs = manifest.snapshot_inputs([file_path])
+    tagger.update_metadata(file_path, metadata, series_metadata, season_metadata, debug,
+                           artwork_store=ArtworkStore(retry=retry))
+    manifest.record(tagger.TAG_OPERATION, file_path, [file_path], params, input_identities=inputs)
+    print(f"Tagged {file_path}.")
+    if debug:
+        print(f"TVDB requests made: {tvdb.network_calls}")
+    return 'tagged'
+
+
+def refresh_merge_record(file_path, manifest):
+    """Tagging rewrote the merged copy; record its new identity so the merge still counts as done."""
+    import merge_subtitles
+
+    season_folder, video_file = os.path.split(file_path)
+    video_file_path, subtitle_file_path, output_file_path = merge_subtitles.episode_paths(season_folder, video_file)
+    manifest.record(merge_subtitles.MERGE_OPERATION, video_file_path, [video_file_path, subtitle_file_path],
+                    merge_subtitles.merge_params([subtitle_file_path], video_file), output_file_path)
+
+
+def main(argv=None, environ=os.environ):
+    started = time.monotonic()
+    parser = argparse.ArgumentParser(description="Merge subtitles into and tag the single file a Sonarr/Radarr import just produced.")
+    parser.add_argument("--file", help="Video file to process (default: from the arr environment)")
+    parser.add_argument("--library-root", help="Folder holding the manifest (default: the series folder, or the folder of movie folders)")
+    parser.add_argument("--series-id", help="TVDB series id (default: sonarr_series_tvdbid)")
+    parser.add_argument("--season", help="Season number (default: sonarr_episodefile_seasonnumber)")
+    parser.add_argument("--episode", help="Episode number (default: the first of sonarr_episodefile_episodenumbers)")
+    parser.add_argument("--movie", action="store_true", help="Treat --file as a movie")
+    parser.add_argument("--api-key", default=environ.get('TVDB_API_KEY'), help="TVDB API key (default: $TVDB_API_KEY)")
+    parser.add_argument("--no-tags", action="store_true", help="Only merge subtitles")
+    parser.add_argument("--force", action="store_true", help="Redo steps the manifest says are up to date")
+    parser.add_argument("--debug", action="store_true", help="Print every command and its output")
+    trace.add_arguments(parser)
+    args = parser.parse_args(argv)
+    trace.configure(args.trace, args.profile)
+
+    event = arr_event(environ) or {}
+    if args.movie or not event:
+        event['kind'] = 'movie' if args.movie else 'episode'
+    if event['kind'] == 'test':
+        print("Connection test received.")
+        return 0
+    file_path = args.file or event.get('file_path')
+    if not file_path or not os.path.isfile(file_path):
+        print(f"No imported file to process ({file_path!r}).")
+        return 1
+    if not file_path.lower().endswith('.mp4'):
+        print(f"Only MP4 files are processed; skipping {file_path}.")
+        return 0
+
+    root = args.library_root or event.get('library_root') or os.path.dirname(os.path.dirname(file_path))
+    manifest = Manifest(root)
+
+    if event['kind'] == 'movie':
+        merge_movie(file_path, manifest, args.force, args.debug)
+    else:
+        merged = merge_episode(file_path, manifest, args.force, args.debug)
+        series_id = args.series_id or event.get('series_id')
+        season = args.season or event.get('season')
+        episode = args.episode or event.get('episode')
+        if args.no_tags:
+            pass
+        elif not (series_id and season and episode):
+            print("Series id, season or episode unknown; not tagging.")
+        else:
+            # The merged copy is the file that is kept, so that is the one to tag
+            try:
+                result = tag_episode(merged or file_path, series_id, season, episode, args.api_key, manifest, args.force, args.debug)
+                if result is None:
+                    return 1
+                if result == 'tagged' and merged:
+                    refresh_merge_record(file_path, manifest)
+            except LookupError:
+                print("No TVDB API key (set TVDB_API_KEY) and no cached data for this series; not tagging.")
+                return 1
+
+    if args.debug:
+        print(f"Done in {time.monotonic() - started:.2f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
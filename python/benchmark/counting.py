@@ -0,0 +1,69 @@
+"""
+Run a script with its filesystem calls counted.
+
+    python counting.py <script.py> [args...]
+
+``os.stat``/``os.lstat`` (and with them ``os.path.exists``, ``isfile``, ...)
+are wrapped, and an audit hook counts opens, directory listings and spawned
+processes. At exit the counts, plus the read/write syscall counters from
+/proc/self/io, are written as JSON to ``$BENCH_COUNTS``.
+"""
+
+import atexit
+import json
+import os
+import runpy
+import sys
+
+
+COUNTS = {'stat': 0, 'open': 0, 'scandir': 0, 'listdir': 0, 'spawn': 0}
+_AUDIT_EVENTS = {'open': 'open', 'os.scandir': 'scandir', 'os.listdir': 'listdir',
+                 'subprocess.Popen': 'spawn', 'os.posix_spawn': 'spawn'}
+
+
+def _counted(func):
+    def wrapper(*args, **kwargs):
+        COUNTS['stat'] += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _audit(event, args):
+    name = _AUDIT_EVENTS.get(event)
+    if name is not None:
+        COUNTS[name] += 1
+
+
+def _proc_io():
+    try:
+        with open('/proc/self/io', 'r') as f:
+            return {k: int(v) for k, v in (line.split(': ', 1) for line in f.read().splitlines())}
+    except (OSError, ValueError):
+        return {}
+
+
+def _report():
+    path = os.environ.get('BENCH_COUNTS')
+    if not path:
+        return
+    io = _proc_io()
+    counts = dict(COUNTS)
+    counts['read_syscalls'] = io.get('syscr')
+    counts['write_syscalls'] = io.get('syscw')
+    with open(path, 'w') as f:
+        json.dump(counts, f)
+
+
+def main():
+    script = sys.argv[1]
+    sys.argv = sys.argv[1:]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    os.stat = _counted(os.stat)
+    os.lstat = _counted(os.lstat)
+    sys.addaudithook(_audit)
+    atexit.register(_report)
+    runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
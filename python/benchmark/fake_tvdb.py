@@ -0,0 +1,152 @@
+"""
+Local stand-in for the parts of the TVDB v4 API the scripts use.
+
+Serves /login, /series/<id>/extended, /seasons/<id>/extended and season
+artwork for one synthetic series whose titles match synth_library, and counts
+every request. Point the scripts at it with
+``TVDB_API_URL=http://127.0.0.1:<port>/v4/``.
+
+    python fake_tvdb.py --seasons 20 --per-season 50 --port 8765
+"""
+
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synth_library import EPISODES_PER_SEASON, SERIES_ID, episode_title
+
+
+ARTWORK = b'\xff\xd8\xff\xe0' + bytes(16 * 1024) + b'\xff\xd9'
+
+
+def _token():
+    claims = json.dumps({'exp': int(time.time()) + 30 * 24 * 3600}).encode('ascii')
+    return 'bench.' + base64.urlsafe_b64encode(claims).decode('ascii').rstrip('=') + '.sig'
+
+
+class FakeTVDB:
+    def __init__(self, seasons, per_season=EPISODES_PER_SEASON, series_id=SERIES_ID, port=0, latency=0.0):
+        self.seasons = seasons
+        self.per_season = per_season
+        self.series_id = series_id
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type='application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                with fake._lock:
+                    fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                path = self.path.split('?', 1)[0]
+                if path.startswith('/artwork/'):
+                    return self._send(200, ARTWORK, 'image/jpeg')
+                data = fake.route(path)
+                if data is None:
+                    return self._send(404, json.dumps({'status': 'failure', 'message': 'Not Found'}).encode())
+                return self._send(200, json.dumps({'status': 'success', 'data': data}).encode())
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self._handle()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v4/"
+
+    def route(self, path):
+        if path == '/v4/login':
+            return {'token': _token()}
+        match = re.match(r'^/v4/series/(\d+)/extended$', path)
+        if match and int(match.group(1)) == self.series_id:
+            return self.series()
+        match = re.match(r'^/v4/seasons/(\d+)/extended$', path)
+        if match:
+            return self.season(int(match.group(1)))
+        return None
+
+    def series(self):
+        return {
+            'id': self.series_id,
+            'name': 'Synthetic Show',
+            'year': '2001',
+            'contentRatings': [{'name': 'TV-14', 'country': 'usa'}],
+            'genres': [{'name': 'Drama'}, {'name': 'Mystery'}],
+            'originalNetwork': {'name': 'Synthetic Network'},
+            'characters': [{'personName': f'Actor {n}'} for n in range(1, 9)],
+            'seasons': [{'id': self.series_id * 1000 + n, 'number': n, 'type': {'name': 'Aired Order', 'type': 'official'}}
+                        for n in range(1, self.seasons + 1)],
+        }
+
+    def season(self, season_id):
+        number = season_id - self.series_id * 1000
+        if not 1 <= number <= self.seasons:
+            return None
+        port = self.server.server_address[1]
+        return {
+            'id': season_id,
+            'number': number,
+            'aired': f"{2000 + number}-01-01",
+            'overview': f"Season {number} overview.",
+            'image': f"http://127.0.0.1:{port}/artwork/season-{number}.jpg",
+            'episodes': [{'id': season_id * 1000 + e, 'number': e, 'seasonNumber': number, 'name': episode_title(number, e),
+                          'aired': f"{2000 + number}-01-{1 + e % 28:02d}", 'overview': 'Synthetic overview.'}
+                         for e in range(1, self.per_season + 1)],
+        }
+
+    def reset(self):
+        with self._lock:
+            count, self.requests = self.requests, 0
+        return count
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake TVDB v4 API for one synthetic series.")
+    parser.add_argument("--seasons", type=int, default=2)
+    parser.add_argument("--per-season", type=int, default=EPISODES_PER_SEASON)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to delay every response")
+    args = parser.parse_args(argv)
+
+    fake = FakeTVDB(args.seasons, args.per_season, port=args.port, latency=args.latency)
+    print(f"Serving series {fake.series_id} at {fake.base_url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Benchmark the media scripts against synthetic libraries.
+
+For every size a fresh library is generated, the stub ffprobe/ffmpeg/
+AtomicParsley are put first on PATH and a fake TVDB server is started; then
+each scenario runs the real script in a child process and records:
+
+    wall time, subprocesses spawned (stub calls), HTTP requests to TVDB,
+    stat/open/listing calls, read/write syscalls and peak RSS
+
+Results are saved as JSON (named after the current commit) so two runs can be
+compared with --compare:
+
+    python run_benchmarks.py --sizes 100 1000
+    python run_benchmarks.py --sizes 100 1000 --compare benchmark-results/<old>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = os.path.join(HERE, os.pardir)
+sys.path.insert(0, HERE)
+import stubs  # noqa: E402
+import synth_library  # noqa: E402
+from fake_tvdb import FakeTVDB  # noqa: E402
+
+
+MERGE = os.path.join(SCRIPTS, 'tv-show-subtitles', 'merge_subtitles.py')
+TAG = os.path.join(SCRIPTS, 'tv-show-metadata', 'update_tv_metadata.py')
+RENAME = os.path.join(SCRIPTS, 'tv-show-rename', 'rename-episode-files.py')
+
+DEFAULT_SIZES = (100, 1000, 10000)
+METRICS = ('wall_seconds', 'subprocesses', 'http_requests', 'stat', 'open', 'scandir', 'read_syscalls', 'peak_rss_kb')
+
+
+def scenarios(paths, series_id):
+    """(name, argv) pairs, run in order; '_warm' runs repeat the one before on an up-to-date library."""
+    return [
+        ('merge_tv', [MERGE, 'tv', paths['merge_show']]),
+        ('merge_tv_warm', [MERGE, 'tv', paths['merge_show']]),
+        ('merge_movies', [MERGE, 'movies', paths['movies']]),
+        ('tag', [TAG, paths['tag_show'], str(series_id), 'bench-key']),
+        ('tag_warm', [TAG, paths['tag_show'], str(series_id), 'bench-key']),
+        ('rename_dry_run', [RENAME, paths['rename_show'], '--dry-run']),
+        ('rename', [RENAME, paths['rename_show']]),
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_scenario(argv, env, work_dir, log):
+    record_path = os.path.join(work_dir, 'calls.txt')
+    counts_path = os.path.join(work_dir, 'counts.json')
+    for path in (record_path, counts_path):
+        if os.path.exists(path):
+            os.remove(path)
+    env = dict(env, BENCH_RECORD=record_path, BENCH_COUNTS=counts_path)
+
+    started = time.monotonic()
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, 'counting.py')] + argv, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    # wait4 gives this child's own rusage, unlike RUSAGE_CHILDREN which accumulates
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.monotonic() - started
+
+    calls = stubs.count_calls(record_path)
+    try:
+        with open(counts_path, 'r') as f:
+            counted = json.load(f)
+    except (OSError, ValueError):
+        counted = {}
+    result = {
+        'exit': process.returncode,
+        'wall_seconds': round(wall, 3),
+        'subprocesses': sum(calls.values()),
+        'tools': calls,
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        'peak_rss_kb': rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss,
+    }
+    result.update({k: counted.get(k) for k in ('stat', 'open', 'scandir', 'listdir', 'read_syscalls', 'write_syscalls')})
+    return result
+
+
+def run_size(size, latency, keep, selected):
+    work_dir = tempfile.mkdtemp(prefix=f'media-bench-{size}-')
+    try:
+        library_dir = os.path.join(work_dir, 'library')
+        paths = {
+            'merge_show': os.path.join(library_dir, 'merge', 'Synthetic Show'),
+            'tag_show': os.path.join(library_dir, 'tag', 'Synthetic Show'),
+            'rename_show': os.path.join(library_dir, 'rename', 'Synthetic Show'),
+            'movies': os.path.join(library_dir, 'Movies'),
+        }
+        per_season = synth_library.EPISODES_PER_SEASON
+        synth_library.generate_show(paths['merge_show'], size, per_season=per_season)
+        synth_library.generate_show(paths['rename_show'], size, per_season=per_season)
+        synth_library.generate_show(paths['tag_show'], size, naming='number', per_season=per_season, sidecars=False)
+        synth_library.generate_movies(paths['movies'], size)
+        seasons = -(-size // per_season)
+
+        bin_dir = stubs.write_stubs(os.path.join(work_dir, 'bin'), latency)
+        tvdb = FakeTVDB(seasons, per_season, latency=latency).start()
+        env = dict(os.environ,
+                   PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''),
+                   XDG_CACHE_HOME=os.path.join(work_dir, 'cache'),
+                   MEDIA_PROBE_CACHE=os.path.join(work_dir, 'cache', 'probe-cache.sqlite3'),
+                   TVDB_API_URL=tvdb.base_url)
+        env.pop('MEDIA_TRACE', None)
+
+        results = []
+        with open(os.path.join(work_dir, 'output.log'), 'w') as log:
+            try:
+                for name, argv in scenarios(paths, tvdb.series_id):
+                    if selected and name not in selected:
+                        continue
+                    tvdb.reset()
+                    result = run_scenario(argv, env, work_dir, log)
+                    result['http_requests'] = tvdb.reset()
+                    result.update(scenario=name, size=size)
+                    results.append(result)
+                    print(format_row(result))
+            finally:
+                tvdb.stop()
+        if any(r['exit'] != 0 for r in results):
+            print(f"  some scenarios failed; see {os.path.join(work_dir, 'output.log')}")
+            keep = True
+        return results
+    finally:
+        if keep:
+            print(f"  kept {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def format_row(r):
+    return (f"  {r['scenario']:<15} {r['size']:>6} {r['wall_seconds']:>8.2f}s {r['subprocesses']:>7} proc "
+            f"{r['http_requests']:>5} http {r['stat'] or 0:>8} stat {r['scandir'] or 0:>6} scandir "
+            f"{r['peak_rss_kb'] / 1024:>7.1f} MB  exit {r['exit']}")
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['scenario'], r['size']): r for r in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path} (new / old):")
+    for r in results:
+        old = baseline.get((r['scenario'], r['size']))
+        if old is None:
+            continue
+        ratios = []
+        for metric in METRICS:
+            if r.get(metric) is not None and old.get(metric):
+                ratios.append(f"{metric} {r[metric] / old[metric]:.2f}x")
+        print(f"  {r['scenario']:<15} {r['size']:>6}  " + ', '.join(ratios))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the media scripts on synthetic libraries.")
+    parser.add_argument("--sizes", type=int, nargs='+', default=list(DEFAULT_SIZES), help="Library sizes in episode files (default: 100 1000 10000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every stub tool and TVDB response takes (default: 0)")
+    parser.add_argument("--scenario", action='append', help="Only run the named scenario(s)")
+    parser.add_argument("--output", help="Results file (default: benchmark-results/<commit>-<time>.json)")
+    parser.add_argument("--compare", metavar="JSON", help="Print ratios against an earlier results file")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated libraries and logs")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    results = []
+    for size in args.sizes:
+        print(f"Size {size}:")
+        results.extend(run_size(size, args.latency, args.keep, args.scenario))
+
+    output = args.output or os.path.join('benchmark-results', f"{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'latency': args.latency,
+            'results': results,
+        }, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 1 if any(r['exit'] != 0 for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Recording stand-ins for ffprobe, ffmpeg and AtomicParsley.
+
+They are plain /bin/sh scripts so that spawning one costs about what the real
+tool's process start does, not a Python interpreter. Each call appends its
+name to ``$BENCH_RECORD`` and sleeps for the configured latency. ffprobe
+prints a fixed stream layout (one video, three audio tracks), ffmpeg copies
+its first input to its output, AtomicParsley does nothing.
+"""
+
+import json
+import os
+import stat
+
+
+PROBE_OUTPUT = {
+    'streams': [
+        {'index': 0, 'codec_type': 'video', 'codec_name': 'h264', 'tags': {'language': 'und'}, 'disposition': {'default': 1}},
+        {'index': 1, 'codec_type': 'audio', 'codec_name': 'aac', 'channels': 2, 'channel_layout': 'stereo',
+         'tags': {'language': 'eng'}, 'disposition': {'default': 1}},
+        {'index': 2, 'codec_type': 'audio', 'codec_name': 'ac3', 'channels': 6, 'channel_layout': '5.1',
+         'tags': {'language': 'eng', 'title': 'Commentary'}, 'disposition': {'default': 0}},
+        {'index': 3, 'codec_type': 'audio', 'codec_name': 'aac', 'channels': 2, 'channel_layout': 'stereo',
+         'tags': {'language': 'fre'}, 'disposition': {'default': 0}},
+    ],
+    'format': {'format_name': 'mov,mp4,m4a,3gp,3g2,mj2', 'duration': '1.000000', 'size': '4096', 'tags': {}},
+}
+
+_RECORD = '[ -n "$BENCH_RECORD" ] && echo {name} >> "$BENCH_RECORD"\n'
+
+
+def _sleep(latency):
+    return f"sleep {latency:g}\n" if latency else ''
+
+
+def write_stubs(bin_dir, latency=0.0):
+    """Write the stub executables into ``bin_dir``; put it first on PATH to use them."""
+    os.makedirs(bin_dir, exist_ok=True)
+    probe_json = os.path.join(bin_dir, 'ffprobe.json')
+    with open(probe_json, 'w') as f:
+        json.dump(PROBE_OUTPUT, f)
+
+    scripts = {
+        'ffprobe': f"#!/bin/sh\n{_RECORD.format(name='ffprobe')}{_sleep(latency)}cat '{probe_json}'\n",
+        'ffmpeg': (
+            "#!/bin/sh\n" + _RECORD.format(name='ffmpeg') + _sleep(latency)
+            + 'input=""; previous=""; output=""\n'
+            + 'for arg in "$@"; do\n'
+            + '  if [ "$previous" = "-i" ] && [ -z "$input" ]; then input="$arg"; fi\n'
+            + '  previous="$arg"; output="$arg"\n'
+            + 'done\n'
+            + 'cp "$input" "$output"\n'
+        ),
+        'AtomicParsley': f"#!/bin/sh\n{_RECORD.format(name='AtomicParsley')}{_sleep(latency)}",
+    }
+    for name, body in scripts.items():
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write(body)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
+
+
+def count_calls(record_path):
+    """Return {tool: calls} from a record file."""
+    counts = {}
+    try:
+        with open(record_path, 'r') as f:
+            for line in f:
+                name = line.strip()
+                if name:
+                    counts[name] = counts.get(name, 0) + 1
+    except OSError:
+        pass
+    return counts
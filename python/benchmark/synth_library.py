@@ -0,0 +1,149 @@
+"""
+Generate synthetic TV show and movie libraries for benchmarking.
+
+Every video is a tiny but well-formed MP4 (ftyp, mdat, moov with one video
+track), so the native tag writer and the remux path both accept it. Shows get
+SxxEyy names, a multi-episode file every few episodes, .srt sidecars with
+SDH/forced variants and an episode-names.txt per season; with
+``naming='number'`` episodes are named '01 Title.mp4' as
+update_tv_metadata.py expects.
+
+    python synth_library.py /tmp/lib --episodes 1000 --movies 100
+"""
+
+import argparse
+import json
+import os
+import struct
+
+
+SERIES_ID = 424242
+EPISODES_PER_SEASON = 50
+
+
+def episode_title(season, episode):
+    return f"Synthetic Episode {season}x{episode:02d}"
+
+
+def _box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _full_box(box_type, version_flags, payload):
+    return _box(box_type, struct.pack('>I', version_flags) + payload)
+
+
+def minimal_mp4(payload_size=4096):
+    """Bytes of a small MP4 with one video track and ``payload_size`` bytes of media data."""
+    ftyp = _box(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isomiso2mp41')
+    mdat = _box(b'mdat', bytes(payload_size))
+    mvhd = _full_box(b'mvhd', 0, struct.pack('>IIII', 0, 0, 1000, 1000) + struct.pack('>IH', 0x00010000, 0x0100)
+                     + bytes(10) + struct.pack('>9I', 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+                     + bytes(24) + struct.pack('>I', 2))
+    tkhd = _full_box(b'tkhd', 3, struct.pack('>IIIII', 0, 0, 1, 0, 1000) + bytes(8) + struct.pack('>HHHH', 0, 0, 0, 0)
+                     + struct.pack('>9I', 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+                     + struct.pack('>II', 1280 << 16, 720 << 16))
+    mdhd = _full_box(b'mdhd', 0, struct.pack('>IIIIHH', 0, 0, 1000, 1000, 0x55c4, 0))
+    hdlr = _full_box(b'hdlr', 0, struct.pack('>I4s', 0, b'vide') + bytes(12) + b'VideoHandler\0')
+    trak = _box(b'trak', tkhd + _box(b'mdia', mdhd + hdlr))
+    moov = _box(b'moov', mvhd + trak)
+    return ftyp + mdat + moov
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _sidecars(base, n):
+    names = [f"{base}.srt"]
+    if n % 5 == 0:
+        names.append(f"{base}.en.sdh.srt")
+    if n % 7 == 0:
+        names.append(f"{base}.en.forced.srt")
+    return names
+
+
+SRT = b"1\n00:00:01,000 --> 00:00:02,000\nHello.\n\n2\n00:00:03,000 --> 00:00:04,000\nWorld.\n"
+
+
+def generate_show(show_path, episodes, naming='sxxeyy', per_season=EPISODES_PER_SEASON, multi_every=10,
+                  sidecars=True, payload_size=4096):
+    """
+    Create one show with ``episodes`` episode files spread over seasons of
+    ``per_season``. Returns {'videos': n, 'subtitles': n, 'seasons': n}.
+    """
+    video = minimal_mp4(payload_size)
+    counts = {'videos': 0, 'subtitles': 0, 'seasons': 0}
+    season = 0
+    remaining = episodes
+    while remaining > 0:
+        season += 1
+        in_season = min(per_season, remaining)
+        remaining -= in_season
+        season_path = os.path.join(show_path, f"Season {season:02d}")
+        os.makedirs(season_path, exist_ok=True)
+        counts['seasons'] += 1
+
+        names = []
+        episode = 1
+        while episode <= in_season:
+            multi = naming == 'sxxeyy' and multi_every and episode % multi_every == 0 and episode < in_season
+            if naming == 'number':
+                base = f"{episode:02d} {episode_title(season, episode)}"
+            elif multi:
+                base = f"S{season:02d}E{episode:02d}-E{episode + 1:02d} Raw Release Name"
+            else:
+                base = f"S{season:02d}E{episode:02d} Raw Release Name"
+            _write(os.path.join(season_path, f"{base}.mp4"), video)
+            counts['videos'] += 1
+            if sidecars:
+                for name in _sidecars(base, episode):
+                    _write(os.path.join(season_path, name), SRT)
+                    counts['subtitles'] += 1
+            names.extend(f"S{season:02d}E{e:02d} {episode_title(season, e)}" for e in ((episode, episode + 1) if multi else (episode,)))
+            episode += 2 if multi else 1
+
+        with open(os.path.join(season_path, 'episode-names.txt'), 'w') as f:
+            f.write('\n'.join(names) + '\n')
+    return counts
+
+
+def generate_movies(movies_path, movies, sidecars=True, payload_size=4096):
+    """Create ``movies`` movie folders, each with one MP4 and its subtitles."""
+    video = minimal_mp4(payload_size)
+    counts = {'videos': 0, 'subtitles': 0}
+    for n in range(1, movies + 1):
+        name = f"Synthetic Movie {n:05d} ({1950 + n % 70})"
+        folder = os.path.join(movies_path, name)
+        os.makedirs(folder, exist_ok=True)
+        _write(os.path.join(folder, f"{name}.mp4"), video)
+        counts['videos'] += 1
+        if sidecars:
+            for subtitle in _sidecars(name, n):
+                _write(os.path.join(folder, subtitle), SRT)
+                counts['subtitles'] += 1
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic media library for benchmarks.")
+    parser.add_argument("root", help="Folder to create the library in")
+    parser.add_argument("--episodes", type=int, default=100, help="Episode files in the show (default: 100)")
+    parser.add_argument("--movies", type=int, default=0, help="Movie folders to create (default: 0)")
+    parser.add_argument("--naming", choices=['sxxeyy', 'number'], default='sxxeyy', help="Episode file naming (default: sxxeyy)")
+    parser.add_argument("--per-season", type=int, default=EPISODES_PER_SEASON, help=f"Episodes per season (default: {EPISODES_PER_SEASON})")
+    parser.add_argument("--no-sidecars", action="store_true", help="Do not create .srt files")
+    args = parser.parse_args(argv)
+
+    summary = {}
+    if args.episodes:
+        summary['show'] = generate_show(os.path.join(args.root, 'Synthetic Show'), args.episodes, args.naming,
+                                        args.per_season, sidecars=not args.no_sidecars)
+    if args.movies:
+        summary['movies'] = generate_movies(os.path.join(args.root, 'Movies'), args.movies, sidecars=not args.no_sidecars)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+"""
+Shared helpers for the media scripts in this repository.
+
+The scripts live in their own folders and are run directly, so each one adds
+the parent ``python`` folder to ``sys.path`` before importing from here.
+"""
@@ -0,0 +1,138 @@
+"""
+Content-addressed artwork store.
+
+Images are downloaded once through a pooled ``requests.Session``, streamed to
+disk in chunks (never buffered whole in memory) and stored by SHA-256 under
+``$XDG_CACHE_HOME/media-scripts/artwork``. A small JSON index maps each URL to
+its content hash, so a season poster is fetched once per cache lifetime and
+every episode of the season shares the same file. An index entry is trusted
+for ``max_age`` seconds (a week by default), after which the URL is fetched
+again, so artwork replaced on TVDB under the same URL is picked up.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from . import faults, trace
+
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def default_store_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'media-scripts', 'artwork')
+
+
+def make_session(pool_size=8):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class ArtworkStore:
+    """Maps artwork URLs to local files, downloading each URL at most once."""
+
+    def __init__(self, store_dir=None, session=None, max_age=DEFAULT_MAX_AGE, timeout=60, retry=None):
+        self.store_dir = store_dir or default_store_dir()
+        self.retry = retry or faults.RetryPolicy()
+        self.max_age = max_age
+        self.timeout = timeout
+        self._session = session
+        self._index_path = os.path.join(self.store_dir, 'index.json')
+        self._index = self._load_index()
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        self.downloads = 0
+        self.bytes_downloaded = 0
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = make_session()
+        return self._session
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_path = f"{self._index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _content_path(self, digest, extension):
+        return os.path.join(self.store_dir, digest[:2], f"{digest}{extension}")
+
+    def _cached(self, url):
+        entry = self._index.get(url)
+        if not entry:
+            return None
+        if self.max_age is not None and time.time() - entry.get('fetched_at', 0) > self.max_age:
+            return None
+        path = self._content_path(entry['sha256'], entry.get('ext', ''))
+        return path if os.path.isfile(path) else None
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def get(self, url):
+        """Return the local path of the image at ``url``, downloading it if needed."""
+        with self._url_lock(url):
+            with self._lock:
+                path = self._cached(url)
+            if path:
+                return path
+            return self.retry.call(self._download, url, label=f"artwork {url}")
+
+    def read(self, url):
+        with open(self.get(url), 'rb') as f:
+            return f.read()
+
+    def _download(self, url):
+        os.makedirs(self.store_dir, exist_ok=True)
+        extension = os.path.splitext(url.split('?', 1)[0])[1].lower()[:5]
+        tmp_path = os.path.join(self.store_dir, f".download.{os.getpid()}.{threading.get_ident()}")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with trace.span('artwork', url=url) as current, self.session.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                current.set(bytes=size)
+            sha256 = digest.hexdigest()
+            path = self._content_path(sha256, extension)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            self.downloads += 1
+            self.bytes_downloaded += size
+            self._index[url] = {'sha256': sha256, 'ext': extension, 'size': size, 'fetched_at': time.time()}
+            self._save_index()
+        return path
@@ -0,0 +1,228 @@
+"""
+Library audit.
+
+Probes every video of a library once (ffprobe through a bounded process pool,
+the probe cache answering unchanged files) and reports one row per file:
+codecs, audio languages/titles/channel layouts, embedded and sidecar
+subtitles, which of the tags update_tv_metadata.py writes are missing, size
+and duration. Two columns summarise what the batch scripts would do:
+
+    needs_merge    subtitles merge_subtitles.py would mux in are not there yet
+                   ('<episode>.srt', or a movie folder's subtitles for its
+                   first MP4)
+    needs_tags     an MP4 episode missing title, air date, ... or cover art
+                   (update_tv_metadata.py)
+
+Both scripts take the report back with ``--from-audit report.csv`` and then
+only touch the files it flags.
+
+Usage:
+    python -m media_common.audit /library -o audit.csv
+    python -m media_common.audit /library -o audit.json -j 16
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from . import faults, library, probe
+from .probe_cache import ProbeCache
+
+
+# Tags update_tv_metadata.py writes, as ffprobe names them in the format tags
+EXPECTED_TAGS = ('title', 'date', 'genre', 'description', 'network', 'episode_id')
+# Outputs of the scripts themselves, not sources to audit
+OUTPUT_SUFFIXES = ('.output.mp4', '_updated.mp4')
+COLUMNS = (
+    'path', 'kind', 'size', 'duration', 'container', 'video_codecs', 'audio_codecs', 'audio_languages',
+    'audio_titles', 'audio_layouts', 'subtitle_languages', 'sidecars', 'cover', 'missing_tags',
+    'non_english_audio', 'untitled_audio', 'commentary_audio', 'needs_merge', 'needs_tags', 'error',
+)
+LIST_SEPARATOR = '|'
+# ffprobe mostly waits on the disk (or the network share), so more processes than CPUs still pay off
+DEFAULT_JOBS = max(4, os.cpu_count() or 1)
+
+
+def merge_sidecars(folder, video, kind):
+    """The subtitles merge_subtitles.py muxes into ``video`` (see its episode_paths and movie_folder_files)."""
+    if not video.lower().endswith('.mp4'):
+        return []
+    if kind == 'episode':
+        name = f"{os.path.splitext(video)[0]}.srt"
+        return [name] if folder.has_file(name) else []
+    mp4s = folder.videos(('.mp4',))
+    return folder.subtitles() if mp4s and mp4s[0] == video else []
+
+
+def audit_targets(index):
+    """Yield (path, kind, sidecar paths, paths merge_subtitles.py would merge) for every source video, in path order."""
+    for path in sorted(index.folders):
+        folder = index.folders[path]
+        videos = [v for v in folder.videos() if not v.endswith(OUTPUT_SUFFIXES)]
+        for video in videos:
+            if folder.season_number is not None or library.parse_episode(video):
+                kind, sidecars = 'episode', folder.sidecars(video)
+            else:
+                kind, sidecars = 'movie', folder.subtitles()
+            yield (os.path.join(path, video), kind, [os.path.join(path, s) for s in sidecars],
+                   [os.path.join(path, s) for s in merge_sidecars(folder, video, kind)])
+
+
+def audit_row(path, kind, sidecars, merge, info):
+    """Build the report row for one probed file."""
+    audio = info.audio_streams
+    embedded = info.subtitle_streams
+    cover = any(s.disposition.get('attached_pic') for s in info.video_streams)
+    missing = [tag for tag in EXPECTED_TAGS if not str(info.tags.get(tag, '')).strip()]
+    if not cover:
+        missing.append('cover')
+    return {
+        'path': path,
+        'kind': kind,
+        'size': info.size or os.path.getsize(path),
+        'duration': round(info.duration, 3),
+        'container': info.format_name,
+        'video_codecs': [s.codec_name for s in info.video_streams if not s.disposition.get('attached_pic')],
+        'audio_codecs': [s.codec_name for s in audio],
+        'audio_languages': [s.language or 'und' for s in audio],
+        'audio_titles': [s.title for s in audio],
+        'audio_layouts': [s.channel_layout or f"{s.channels}ch" for s in audio],
+        'subtitle_languages': [s.language or 'und' for s in embedded],
+        'sidecars': [os.path.basename(s) for s in sidecars],
+        'cover': cover,
+        'missing_tags': missing,
+        'non_english_audio': sum(1 for s in audio if s.language not in ('eng', 'und', '')),
+        'untitled_audio': sum(1 for s in audio if not s.title),
+        'commentary_audio': sum(1 for s in audio if 'commentary' in s.title.lower()),
+        'needs_merge': len(merge) > len(embedded),
+        'needs_tags': kind == 'episode' and path.lower().endswith('.mp4') and bool(missing),
+        'error': '',
+    }
+
+
+def error_row(path, kind, sidecars, merge, error):
+    row = {column: '' for column in COLUMNS}
+    row.update(path=path, kind=kind, sidecars=[os.path.basename(s) for s in sidecars],
+               needs_merge=False, needs_tags=False, error=str(error))
+    return row
+
+
+def _probe_row(target):
+    """Pool worker: probe one file; returns (row, raw ffprobe data or None)."""
+    path, kind, sidecars, merge = target
+    try:
+        # A hung probe (a stale network mount, a damaged file) must not hold a pool worker for good
+        result = subprocess.run(probe.probe_command(path), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, check=True, timeout=faults.PROBE_TIMEOUT)
+        data = json.loads(result.stdout or '{}')
+        return audit_row(path, kind, sidecars, merge, probe.parse_probe_output(path, data)), data
+    except (OSError, ValueError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        return error_row(path, kind, sidecars, merge, faults.describe(e)), None
+
+
+def audit_library(root, jobs=DEFAULT_JOBS, cache=None, persist_index=True):
+    """Return the report rows for every video under ``root``."""
+    index = library.open_index(root, persist=persist_index)
+    targets = list(audit_targets(index))
+    rows = [None] * len(targets)
+    misses = {}
+    for i, (path, kind, sidecars, merge) in enumerate(targets):
+        data = st = None
+        if cache is not None:
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                rows[i] = error_row(path, kind, sidecars, merge, e)
+                continue
+            data = cache.get(path, st)
+        if data is not None:
+            rows[i] = audit_row(path, kind, sidecars, merge, probe.parse_probe_output(path, data))
+        else:
+            # The identity from before the probe, so a file changing meanwhile is not cached as probed
+            misses[i] = st
+
+    if misses:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            work = [targets[i] for i in misses]
+            for i, (row, data) in zip(misses, pool.map(_probe_row, work, chunksize=8)):
+                rows[i] = row
+                if cache is not None and data is not None:
+                    cache.put(row['path'], data, misses[i])
+    return rows
+
+
+def _cell(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(str(v) for v in value)
+    return value
+
+
+def write_report(rows, output, format_name):
+    if format_name == 'json':
+        json.dump(rows, output, indent=1)
+        output.write('\n')
+        return
+    writer = csv.DictWriter(output, fieldnames=COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({column: _cell(row[column]) for column in COLUMNS})
+
+
+def load_worklist(report_path, flag):
+    """Absolute paths of the files an audit report flags with ``flag`` ('needs_merge' or 'needs_tags')."""
+    with open(report_path, 'r', newline='') as f:
+        if report_path.lower().endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    return {os.path.abspath(row['path']) for row in rows if row.get(flag) in (True, 1, '1', 'true', 'True')}
+
+
+def summary(rows):
+    errors = sum(1 for r in rows if r['error'])
+    return (f"{len(rows)} file(s) audited: {sum(1 for r in rows if r['needs_merge'])} need subtitles merged, "
+            f"{sum(1 for r in rows if r['needs_tags'])} need tags, "
+            f"{sum(1 for r in rows if r['non_english_audio'])} have non-English audio, "
+            f"{sum(1 for r in rows if r['commentary_audio'])} have commentary tracks, {errors} could not be probed.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Probe a media library and report what each file is missing.')
+    parser.add_argument('folder_path', help='Library, show or movies folder to audit')
+    parser.add_argument('-o', '--output', help='Report file; .json writes JSON, anything else CSV (default: CSV on stdout)')
+    parser.add_argument('--format', choices=('csv', 'json'), help='Report format (default: from the --output extension)')
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS,
+                        help=f'ffprobe processes run at the same time (default: {DEFAULT_JOBS})')
+    parser.add_argument('--no-probe-cache', action='store_true', help='Always run ffprobe instead of using the probe cache')
+    parser.add_argument('--no-index-cache', action='store_true', help='Walk the whole library instead of reusing the saved directory index')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder_path):
+        print('Invalid folder path provided.', file=sys.stderr)
+        return 1
+
+    cache = None if args.no_probe_cache else ProbeCache()
+    try:
+        rows = audit_library(args.folder_path, jobs=args.jobs, cache=cache, persist_index=not args.no_index_cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    format_name = args.format or ('json' if (args.output or '').lower().endswith('.json') else 'csv')
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_report(rows, f, format_name)
+    else:
+        write_report(rows, sys.stdout, format_name)
+    print(summary(rows), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+Failure handling for long unattended runs.
+
+Errors are sorted into four kinds:
+
+    network    TVDB/artwork connection problems, timeouts, 5xx without a body
+    io         transient file-system errors (EIO, ESTALE, EAGAIN, ...), usual
+               on SMB/NFS shares that drop for a moment
+    timeout    a subprocess ran past ``subprocess_timeout(size)``
+    failed     everything else: ffmpeg rejecting a file, a bad subtitle, a
+               failed verification
+
+``RetryPolicy`` retries the first two with exponential backoff and gives up
+on the others immediately, since running ffmpeg again on a corrupt file only
+fails again later.
+
+Files that still fail go into a quarantine, ``.media-quarantine.json``,
+kept next to the manifest: in the show folder (or, for movies, the folder of
+movie folders), also when ``--library`` tags a whole TV root. It is the
+machine-readable failure report of the last runs, one section per operation. Files that failed with
+``timeout`` or ``failed`` are held back from that operation on later runs
+until they change. Network and io failures are only
+reported; the next run tries them again. ``--retry-failed`` runs exactly the
+quarantined files again.
+"""
+
+import asyncio
+import errno
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+
+
+QUARANTINE_NAME = '.media-quarantine.json'
+QUARANTINE_FORMAT = 2
+
+RETRYABLE = ('network', 'io')
+TRANSIENT_ERRNOS = frozenset({
+    errno.EIO, errno.EAGAIN, errno.EBUSY, errno.ETIMEDOUT, errno.ESTALE, errno.EPIPE, errno.ECONNRESET,
+    errno.ECONNREFUSED, errno.ECONNABORTED, errno.EHOSTUNREACH, errno.ENETUNREACH, errno.ENETDOWN,
+})
+
+# Remuxes copy streams, so even a slow share moves a couple of MiB per second
+TIMEOUT_BASE = 120
+TIMEOUT_THROUGHPUT = 2 * 1024 * 1024
+PROBE_TIMEOUT = 120
+
+_TRANSIENT_NAME = re.compile(r'Connection|Timeout|ChunkedEncoding|Protocol')
+
+
+def classify(error):
+    """Return 'network', 'io', 'timeout' or 'failed' for an exception."""
+    if isinstance(error, subprocess.TimeoutExpired):
+        return 'timeout'
+    if isinstance(error, subprocess.CalledProcessError):
+        return 'failed'
+    if isinstance(error, urllib.error.HTTPError):
+        return 'network' if error.code == 429 or error.code >= 500 else 'failed'
+    if isinstance(error, (urllib.error.URLError, ConnectionError, TimeoutError, http.client.HTTPException)):
+        return 'network'
+    if type(error).__module__.split('.')[0] in ('requests', 'urllib3'):
+        # requests/urllib3 (artwork downloads), without importing them here
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        if status is not None:
+            return 'network' if status == 429 or status >= 500 else 'failed'
+        return 'network' if _TRANSIENT_NAME.search(type(error).__name__) else 'failed'
+    if isinstance(error, ValueError) and 'UNKNOWN FAILURE' in str(error):
+        # tvdb_v4_official's message for an error response without a body (a 5xx from a proxy)
+        return 'network'
+    if isinstance(error, OSError) and error.errno in TRANSIENT_ERRNOS:
+        return 'io'
+    return 'failed'
+
+
+def describe(error):
+    """One line for a report: a failed command's last stderr line rather than its whole command line."""
+    stderr = getattr(error, 'stderr', None)
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode(errors='replace')
+    lines = (stderr or '').strip().splitlines() or str(error).strip().splitlines()
+    return lines[-1] if lines else type(error).__name__
+
+
+def subprocess_timeout(size):
+    """Seconds a remux of ``size`` bytes may take before it counts as hung."""
+    return TIMEOUT_BASE + size / TIMEOUT_THROUGHPUT
+
+
+class RetryPolicy:
+    """Retry network and transient I/O errors with exponential backoff and jitter."""
+
+    def __init__(self, attempts=3, base_delay=2.0, max_delay=60.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        return min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def should_retry(self, error, attempt):
+        # An error that carries ``attempts`` was already retried by an inner policy (a TVDB request)
+        return attempt < self.attempts and classify(error) in RETRYABLE and not hasattr(error, 'attempts')
+
+    def _note(self, error, attempt, label):
+        wait = self.delay(attempt)
+        print(f"Retrying{' ' + label if label else ''} in {wait:.0f}s after {classify(error)} error "
+              f"(attempt {attempt}/{self.attempts}): {error}")
+        return wait
+
+    def call(self, func, *args, label=None, **kwargs):
+        attempt = 1
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not self.should_retry(e, attempt):
+                    if not hasattr(e, 'attempts'):
+                        e.attempts = attempt
+                    raise
+                time.sleep(self._note(e, attempt, label))
+                attempt += 1
+
+    async def call_async(self, func, *args, label=None, **kwargs):
+        attempt = 1
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if not self.should_retry(e, attempt):
+                    if not hasattr(e, 'attempts'):
+                        e.attempts = attempt
+                    raise
+                await asyncio.sleep(self._note(e, attempt, label))
+                attempt += 1
+
+
+NO_RETRY = RetryPolicy(attempts=1)
+
+
+class Quarantine:
+    """
+    Failed files of a show, keyed by operation and path relative to the show
+    folder. Every script and mode uses the show folder as root, so they share
+    one file and each only sees, holds back and clears its own operation's
+    failures: a file that failed to tag is still merged, and a merge that
+    works does not clear the tagging failure.
+    """
+
+    def __init__(self, root, name=QUARANTINE_NAME):
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, name)
+        self._touched = set()
+        self._lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('format') != QUARANTINE_FORMAT:
+            return {}
+        return data.get('operations', {})
+
+    def save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock:
+            # The other script may have saved its own operations since this one loaded
+            operations = self._load()
+            for operation in self._touched:
+                operations[operation] = self.entries.get(operation, {})
+            for operation, files in list(operations.items()):
+                # Files deleted or renamed since they failed are nobody's problem any more
+                files = {key: entry for key, entry in files.items() if os.path.exists(os.path.join(self.root, key))}
+                if files:
+                    operations[operation] = files
+                else:
+                    del operations[operation]
+            self.entries = operations
+            self._touched.clear()
+            data = {'format': QUARANTINE_FORMAT, 'root': self.root, 'operations': operations}
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f, indent=1, sort_keys=True)
+                    f.write('\n')
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Could not write {self.path}: {e}")
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def _identity(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    def add(self, path, error, operation):
+        kind = classify(error)
+        entry = {
+            'kind': kind,
+            'error': describe(error),
+            'attempts': getattr(error, 'attempts', 1),
+            'failed_at': time.time(),
+            'identity': self._identity(path),
+            # Deterministic failures wait for the file to change; transient ones are simply tried again
+            'held': kind not in RETRYABLE,
+        }
+        with self._lock:
+            self.entries.setdefault(operation, {})[self._key(path)] = entry
+            self._touched.add(operation)
+        return entry
+
+    def clear(self, path, operation):
+        with self._lock:
+            if self.entries.get(operation, {}).pop(self._key(path), None) is None:
+                return False
+            self._touched.add(operation)
+            return True
+
+    def holds(self, path, operation):
+        """True if ``operation`` failed deterministically on ``path`` and the file has not changed since."""
+        with self._lock:
+            entry = self.entries.get(operation, {}).get(self._key(path))
+        return bool(entry) and entry['held'] and entry['identity'] == self._identity(path)
+
+    def paths(self, operation):
+        return _absolute(self.root, self.entries.get(operation, {}))
+
+    def summary(self, operation):
+        files = self.entries.get(operation, {})
+        held = sum(1 for entry in files.values() if entry['held'])
+        return (f"{len(files)} file(s) failed {operation} in {self.path} ({held} held back until they change); "
+                f"rerun them with --retry-failed.")
+
+
+def _absolute(root, files):
+    return {os.path.normpath(os.path.join(root, key)) for key in files}
+
+
+def load_failures(report_path, operation):
+    """Absolute paths a quarantine file (the failure report) lists as failed ``operation``."""
+    with open(report_path, 'r') as f:
+        data = json.load(f)
+    root = data.get('root') or os.path.dirname(os.path.abspath(report_path))
+    return _absolute(root, data.get('operations', {}).get(operation, {}))
+
+
+def quarantined_call(retry, quarantine, operation, path, func, *args):
+    """
+    Run one job outside a batch (the watchers' jobs) under ``retry``. Its
+    failure goes into ``quarantine`` straight away and is raised again for the
+    caller to report; a success clears an earlier failure of ``path``.
+    """
+    try:
+        value = retry.call(func, *args, label=path)
+    except Exception as e:
+        if quarantine is not None:
+            quarantine.add(path, e, operation)
+            quarantine.save()
+        raise
+    if quarantine is not None and quarantine.clear(path, operation):
+        quarantine.save()
+    return value
+
+
+def failed_paths(quarantines, operation, report=None):
+    """The files ``--retry-failed`` runs: from ``report`` if given, else from the shows' quarantines."""
+    if report is not None:
+        return load_failures(report, operation)
+    return set().union(*(quarantine.paths(operation) for quarantine in quarantines))
+
+
+def add_arguments(parser):
+    """The --retry-failed/--failure-report/--retries options shared by the batch scripts."""
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='Only process the files that failed before')
+    parser.add_argument('--failure-report', metavar='FILE',
+                        help=f"Failure report --retry-failed reads (default: each show's {QUARANTINE_NAME})")
+    parser.add_argument('--retries', type=int, default=3,
+                        help='Attempts per file for network and transient I/O errors (default: 3)')
@@ -0,0 +1,137 @@
+"""
+Filename grammar shared by the rename tools.
+
+``parse`` classifies a file (or episode-names.txt line) with one precompiled
+pattern, trying in order:
+
+    episode    Show.S01E02.Title, S01E01E02, S01E01-E03, S01E01-03, 1x01, 1x01-1x02
+    movie      Title (1999), Title.1999.1080p
+    absolute   Show - 101 - Title, Show E101, 101 Title
+
+and returns a ``FileName`` record, or None for anything else. Ranges expand to
+every episode in between (S01E01-E03 is 1, 2 and 3); a plain list
+(S01E01E02E05) is kept as written.
+"""
+
+import re
+
+from .library import SUBTITLE_EXTENSIONS, VIDEO_EXTENSIONS
+
+
+CONTAINER_EXTENSIONS = VIDEO_EXTENSIONS + ('.ts', '.m2ts', '.mts', '.webm', '.ogv', '.3gp', '.divx', '.vob')
+SIDECAR_EXTENSIONS = SUBTITLE_EXTENSIONS + ('.ass', '.ssa', '.vtt', '.sub', '.idx', '.nfo', '.jpg', '.png')
+_EXTENSIONS = frozenset(CONTAINER_EXTENSIONS + SIDECAR_EXTENSIONS)
+
+_NAME = re.compile(r"""
+    (?P<lead>.*?)(?<![A-Za-z0-9])[Ss](?P<season>\d{1,3})[ ._-]?[Ee](?P<episode>\d{1,4})
+        (?P<more>(?:[ ._]?-?[ ._]?[Ee]\d{1,4}|-\d{1,4}(?![0-9pPiIxX]))*)(?![0-9])
+  | (?P<xlead>.*?)(?<![A-Za-z0-9])(?P<xseason>\d{1,2})[xX](?P<xepisode>\d{2,3})
+        (?P<xmore>(?:-?\d{1,2}[xX]\d{2,3}|-?[xX]\d{2,3}|-\d{2,3})*)(?![0-9pP])
+  | (?P<ylead>.+)[ ._(\[-]+(?P<year>(?:19|20)\d\d)(?=[)\] ._-]|$)
+  | (?P<alead>(?:.*?(?:[ ._]-[ ._]|(?<![A-Za-z0-9])[Ee][Pp]?[ ._]?))?)(?P<absolute>\d{2,4})(?=[ ._\[(-]|$)
+""", re.VERBOSE)
+_PARTS = re.compile(r'(-?)[ ._]*(?:\d{1,2}[xX]|[EeXx])?(\d+)')
+
+
+class FileName:
+    """A parsed file name; ``kind`` is 'episode', 'movie' or 'absolute'."""
+
+    __slots__ = ('name', 'extension', 'kind', 'season', 'episodes', 'absolute', 'year', '_show', '_title')
+
+    def __init__(self, name, extension, kind, show='', season=None, episodes=(), absolute=None, year=None, title=''):
+        self.name = name
+        self.extension = extension
+        self.kind = kind
+        self.season = season
+        self.episodes = episodes
+        self.absolute = absolute
+        self.year = year
+        # Kept raw and cleaned on access; most callers only look at the numbers
+        self._show = show
+        self._title = title
+
+    @property
+    def show(self):
+        return _clean(self._show)
+
+    @property
+    def title(self):
+        return _clean(self._title)
+
+    @property
+    def key(self):
+        """'s01e02' for the first episode."""
+        return f"s{self.season:02d}e{self.episodes[0]:02d}" if self.episodes else None
+
+    @property
+    def keys(self):
+        """One 'sXXeYY' key per episode in the file."""
+        return [f"s{self.season:02d}e{e:02d}" for e in self.episodes]
+
+    @property
+    def tag(self):
+        """Canonical episode tag: 's01e01', 's01e01-e03' for a run, 's01e01e05' otherwise."""
+        if not self.episodes:
+            return None
+        first, last = self.episodes[0], self.episodes[-1]
+        if len(self.episodes) > 1 and list(self.episodes) == list(range(first, last + 1)):
+            return f"s{self.season:02d}e{first:02d}-e{last:02d}"
+        return f"s{self.season:02d}" + ''.join(f"e{e:02d}" for e in self.episodes)
+
+    @property
+    def is_video(self):
+        return self.extension.lower() in CONTAINER_EXTENSIONS
+
+    def __repr__(self):
+        return (f"FileName({self.name!r}, kind={self.kind!r}, season={self.season!r}, episodes={self.episodes!r}, "
+                f"absolute={self.absolute!r}, year={self.year!r}, title={self.title!r})")
+
+
+def _clean(text):
+    text = text.strip(' ._-')
+    if ' ' not in text:
+        # Scene-style 'The.Episode.Title'
+        text = text.replace('.', ' ').replace('_', ' ')
+    return text
+
+
+def _episodes(first, more):
+    episodes = [first]
+    if more:
+        for dash, number in _PARTS.findall(more):
+            number = int(number)
+            if dash and number > episodes[-1]:
+                episodes.extend(range(episodes[-1] + 1, number + 1))
+            elif number != episodes[-1]:
+                episodes.append(number)
+    return tuple(episodes)
+
+
+def split_extension(name):
+    """('Show S01E01', '.mkv'); only containers and known sidecars count, so 'S01E01 Dr. No' keeps its title."""
+    stem, dot, extension = name.rpartition('.')
+    if dot and stem and '.' + extension.lower() in _EXTENSIONS:
+        return stem, '.' + extension
+    return name, ''
+
+
+def parse(name):
+    """Return a FileName for ``name``, or None when it holds no episode, year or absolute number."""
+    # split_extension, inlined: this runs once per entry of a listing
+    stem, dot, extension = name.rpartition('.')
+    if dot and stem and '.' + extension.lower() in _EXTENSIONS:
+        extension = '.' + extension
+    else:
+        stem, extension = name, ''
+    match = _NAME.match(stem)
+    if match is None:
+        return None
+    lead, season, episode, more, xlead, xseason, xepisode, xmore, ylead, year, alead, absolute = match.groups()
+    rest = stem[match.end():]
+    if season is not None:
+        return FileName(name, extension, 'episode', lead, int(season), _episodes(int(episode), more), None, None, rest)
+    if xseason is not None:
+        return FileName(name, extension, 'episode', xlead, int(xseason), _episodes(int(xepisode), xmore), None, None, rest)
+    if year is not None:
+        return FileName(name, extension, 'movie', '', None, (), None, int(year), ylead)
+    return FileName(name, extension, 'absolute', alead, None, (), int(absolute), None, rest)
@@ -0,0 +1,307 @@
+"""
+Single-walk media library index.
+
+One ``os.scandir`` pass over a library records every folder's file and
+sub-folder names (no per-file ``stat``), and classification happens on top of
+that listing: shows, seasons, episodes (SxxEyy, multi-episode and ranges),
+movies, ``.srt`` sidecars and Synology ``@eaDir`` junk.
+
+The listing can be saved to ``.media-index.json`` in the library root. On the
+next run only directories whose mtime changed are listed again, so a refresh
+costs one ``stat`` per directory instead of a full re-walk; on SMB every
+avoided call is a network round-trip. A directory's mtime only changes when
+entries are added, removed or renamed, which is exactly what the listing
+holds; file sizes and contents are never cached here.
+"""
+
+import json
+import os
+import re
+import threading
+
+from . import trace
+
+
+INDEX_NAME = '.media-index.json'
+INDEX_FORMAT = 1
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.m4v', '.avi', '.mov', '.flv', '.wmv', '.mpeg', '.mpg')
+SUBTITLE_EXTENSIONS = ('.srt',)
+JUNK_DIRS = ('@eaDir', '#recycle', '.AppleDouble')
+JUNK_FILES = ('.DS_Store', 'Thumbs.db', 'desktop.ini')
+
+SEASON_FOLDER = re.compile(r'^(?:season|series)[ ._-]*(\d+)$', re.IGNORECASE)
+SPECIALS_FOLDER = re.compile(r'^specials?$', re.IGNORECASE)
+EPISODE_TAG = re.compile(r'[Ss](\d{1,3})[Ee](\d{1,4})((?:-?[Ee]\d{1,4})*)')
+EPISODE_PART = re.compile(r'(-?)[Ee](\d{1,4})')
+
+
+def is_junk(name):
+    return name in JUNK_DIRS or name in JUNK_FILES or name.startswith('._')
+
+
+def is_video(name):
+    return name.lower().endswith(VIDEO_EXTENSIONS) and not is_junk(name)
+
+
+def is_subtitle(name):
+    return name.lower().endswith(SUBTITLE_EXTENSIONS) and not is_junk(name)
+
+
+def season_number(folder_name):
+    """Return the season number for 'Season 01'-style folder names (Specials is 0), else None."""
+    match = SEASON_FOLDER.match(folder_name)
+    if match:
+        return int(match.group(1))
+    if SPECIALS_FOLDER.match(folder_name):
+        return 0
+    return None
+
+
+def parse_episode(name):
+    """
+    Return (season, [episode, ...]) for names containing an SxxEyy tag, else None.
+
+    S01E01E02 lists episodes, S01E01-E03 is the range 1..3.
+    """
+    match = EPISODE_TAG.search(name)
+    if not match:
+        return None
+    season = int(match.group(1))
+    episodes = [int(match.group(2))]
+    for dash, number in EPISODE_PART.findall(match.group(3)):
+        number = int(number)
+        if dash and number > episodes[-1]:
+            episodes.extend(range(episodes[-1] + 1, number + 1))
+        else:
+            episodes.append(number)
+    return season, episodes
+
+
+class Folder:
+    """The listing of one directory plus classification helpers."""
+
+    __slots__ = ('path', 'mtime_ns', 'files', 'dirs', 'junk', '_names')
+
+    def __init__(self, path, mtime_ns, files, dirs, junk):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.files = files
+        self.dirs = dirs
+        self.junk = junk
+        self._names = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def season_number(self):
+        return season_number(self.name)
+
+    def videos(self, extensions=VIDEO_EXTENSIONS):
+        return [f for f in self.files if f.lower().endswith(extensions) and not is_junk(f)]
+
+    def subtitles(self):
+        return [f for f in self.files if is_subtitle(f)]
+
+    def has_file(self, name):
+        return name in self.files
+
+    def has_entry(self, name):
+        if self._names is None:
+            self._names = set(self.files) | set(self.dirs) | set(self.junk)
+        return name in self._names
+
+    def sidecars(self, video_name):
+        """Subtitles named after a video: 'Ep.srt', 'Ep.en.srt', 'Ep.en.sdh.srt', ..."""
+        stem = os.path.splitext(video_name)[0]
+        return [f for f in self.subtitles() if f == f"{stem}.srt" or f.startswith(f"{stem}.")]
+
+    def to_json(self):
+        return {'mtime_ns': self.mtime_ns, 'files': self.files, 'dirs': self.dirs, 'junk': self.junk}
+
+
+class LibraryIndex:
+    """Folder listings for everything under ``root``, refreshed by directory mtime."""
+
+    def __init__(self, root, index_path=None):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        self.folders = {}
+        self.scanned = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, root, persist=True):
+        """Load the saved index for ``root`` (if any), refresh it and save it back."""
+        root = os.path.abspath(root)
+        index = cls(root, os.path.join(root, INDEX_NAME) if persist else None)
+        index.load()
+        index.refresh()
+        index.save()
+        return index
+
+    def load(self):
+        if not self.index_path:
+            return
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('format') != INDEX_FORMAT:
+            return
+        for rel, entry in data.get('folders', {}).items():
+            path = os.path.normpath(os.path.join(self.root, rel))
+            self.folders[path] = Folder(path, entry['mtime_ns'], entry['files'], entry['dirs'], entry.get('junk', []))
+
+    def save(self):
+        if not self.index_path:
+            return
+        data = {
+            'format': INDEX_FORMAT,
+            'folders': {os.path.relpath(path, self.root): folder.to_json() for path, folder in self.folders.items()},
+        }
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # A read-only library still works, it just cannot skip the walk next time
+            pass
+
+    def _scan_dir(self, path, mtime_ns):
+        files, dirs, junk = [], [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name == INDEX_NAME or entry.name.startswith(f"{INDEX_NAME}."):
+                    continue
+                if is_junk(entry.name):
+                    junk.append(entry.name)
+                elif entry.is_dir():
+                    dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+        self.scanned += 1
+        return Folder(path, mtime_ns, sorted(files), sorted(dirs), sorted(junk))
+
+    def refresh(self, path=None):
+        """
+        Bring the index up to date below ``path`` (default: the root). Folders
+        whose mtime is unchanged keep their listing; removed folders are dropped.
+        """
+        start = os.path.abspath(path or self.root)
+        with trace.span('scan', root=start) as current:
+            scanned, reused = self.scanned, self.reused
+            self._refresh(start)
+            current.set(scanned=self.scanned - scanned, reused=self.reused - reused)
+
+    def _refresh(self, start):
+        seen = set()
+        stack = [start]
+        while stack:
+            current = stack.pop()
+            try:
+                mtime_ns = os.stat(current).st_mtime_ns
+            except OSError:
+                continue
+            folder = self.folders.get(current)
+            if folder is None or folder.mtime_ns != mtime_ns:
+                folder = self._scan_dir(current, mtime_ns)
+                with self._lock:
+                    self.folders[current] = folder
+            else:
+                self.reused += 1
+            seen.add(current)
+            stack.extend(os.path.join(current, d) for d in folder.dirs)
+
+        prefix = start.rstrip(os.sep) + os.sep
+        with self._lock:
+            for stale in [p for p in self.folders if (p == start or p.startswith(prefix)) and p not in seen]:
+                del self.folders[stale]
+
+    def folder(self, path):
+        """Return the Folder for ``path``, listing it on first use if it is not indexed yet."""
+        path = os.path.abspath(path)
+        folder = self.folders.get(path)
+        if folder is None and os.path.isdir(path):
+            folder = self._scan_dir(path, os.stat(path).st_mtime_ns)
+            with self._lock:
+                self.folders[path] = folder
+        return folder
+
+    def exists(self, path):
+        """Existence check answered from the listing when the parent folder is indexed."""
+        path = os.path.abspath(path)
+        folder = self.folders.get(os.path.dirname(path))
+        if folder is None:
+            return os.path.exists(path)
+        return folder.has_entry(os.path.basename(path))
+
+    def subfolders(self, path):
+        folder = self.folder(path)
+        return [self.folder(os.path.join(folder.path, d)) for d in folder.dirs] if folder else []
+
+    def seasons(self, show_path):
+        """Season folders of a show, ordered by season number."""
+        seasons = [f for f in self.subfolders(show_path) if f is not None and f.season_number is not None]
+        return sorted(seasons, key=lambda f: (f.season_number, f.name))
+
+    def shows(self):
+        """Folders that contain at least one season folder."""
+        return sorted(
+            (f for f in self.folders.values() if any(season_number(d) is not None for d in f.dirs)),
+            key=lambda f: f.path
+        )
+
+    def movies(self):
+        """Folders holding videos without SxxEyy tags that are not season folders."""
+        movies = []
+        for folder in self.folders.values():
+            if folder.season_number is not None:
+                continue
+            videos = folder.videos()
+            if videos and not any(parse_episode(v) for v in videos):
+                movies.append(folder)
+        return sorted(movies, key=lambda f: f.path)
+
+    def episodes(self, show_path):
+        """Yield (season folder, video name, (season, [episodes]) or None) for every video of a show."""
+        for season in self.seasons(show_path):
+            for video in season.videos():
+                yield season, video, parse_episode(video)
+
+    def junk(self):
+        """Paths of every @eaDir/.DS_Store-style entry found in the library."""
+        return [os.path.join(f.path, j) for f in self.folders.values() for j in f.junk]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def index_for(path, persist=False):
+    """
+    Return a process-wide index covering ``path``. Scripts call ``open_index``
+    on their library root once; helpers that only get a sub-folder path then
+    share that index instead of listing the directory again.
+    """
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        for root, index in _indexes.items():
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return index
+        index = LibraryIndex(path)
+        _indexes[path] = index
+        return index
+
+
+def open_index(root, persist=True):
+    """Open (load + refresh) the index for a library root and register it for ``index_for``."""
+    index = LibraryIndex.open(root, persist=persist)
+    with _indexes_lock:
+        _indexes[index.root] = index
+    return index
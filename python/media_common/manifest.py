@@ -0,0 +1,150 @@
+"""
+Per-library processing manifest.
+
+Records, for every operation run on a file, the identity of its inputs (size,
+mtime and optionally a fast partial hash), the parameters used and the
+identity of the output. Reruns consult it to skip work that is already up to
+date, which also makes an interrupted batch resumable.
+
+The manifest is an append-only JSON-lines file in the library root (one
+record per completed operation, last record wins), so a crash can lose at
+most the record being written and nothing needs a lock server on SMB/NFS.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+MANIFEST_NAME = '.media-manifest.jsonl'
+PARTIAL_HASH_BYTES = 64 * 1024
+
+
+def partial_hash(path, size=None):
+    """Hash the size plus the first and last 64 KiB of a file; enough to notice a replaced file."""
+    size = os.path.getsize(path) if size is None else size
+    digest = hashlib.sha1(str(size).encode('ascii'))
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_HASH_BYTES))
+        if size > PARTIAL_HASH_BYTES:
+            f.seek(max(size - PARTIAL_HASH_BYTES, PARTIAL_HASH_BYTES))
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+def canonical_params(params):
+    return json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+
+
+class Manifest:
+    """Tracks which (operation, file) pairs are done and with what inputs, params and output."""
+
+    def __init__(self, root, use_hash=False, name=MANIFEST_NAME):
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, name)
+        self.use_hash = use_hash
+        self._lock = threading.Lock()
+        self._records = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash; everything before it is still good
+                continue
+            self._records[(record['op'], record['path'])] = record
+        if len(lines) > 2 * len(self._records) + 100:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the manifest with only the latest record per (operation, file)."""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                for record in self._records.values():
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            os.replace(tmp_path, self.path)
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def identity(self, path):
+        """Return {'size', 'mtime_ns'[, 'hash']} for path, or None if it does not exist."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        identity = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        if self.use_hash:
+            identity['hash'] = partial_hash(path, st.st_size)
+        return identity
+
+    def _identities(self, paths):
+        return {self._key(p): self.identity(p) for p in paths}
+
+    def _same(self, recorded, current):
+        if recorded is None or current is None:
+            return False
+        if 'hash' in recorded and 'hash' in current:
+            return recorded['hash'] == current['hash'] and recorded['size'] == current['size']
+        return recorded['size'] == current['size'] and recorded['mtime_ns'] == current['mtime_ns']
+
+    def is_done(self, operation, path, inputs, params, output=None):
+        """
+        True if ``operation`` already ran on ``path`` with the same inputs and
+        params and its output is still the one it produced.
+
+        For in-place operations (output is the input file) the file must still
+        match the identity recorded after the operation finished, and any
+        other inputs (a merged .srt) the identities they had then.
+        """
+        record = self._records.get((operation, self._key(path)))
+        if record is None or record['params'] != canonical_params(params):
+            return False
+        output = output or path
+        if self._key(output) in {self._key(p) for p in inputs}:
+            others = self._identities([p for p in inputs if self._key(p) != self._key(output)])
+            if not all(self._same(record['inputs'].get(k), v) for k, v in others.items()):
+                return False
+            return self._same(record['output'], self.identity(output))
+        current_inputs = self._identities(inputs)
+        if set(current_inputs) != set(record['inputs']):
+            return False
+        if not all(self._same(record['inputs'][k], v) for k, v in current_inputs.items()):
+            return False
+        return self._same(record['output'], self.identity(output))
+
+    def record(self, operation, path, inputs, params, output=None, input_identities=None):
+        """
+        Append a completed-operation record. ``input_identities`` should be
+        captured before an in-place operation changes its input.
+        """
+        output = output or path
+        record = {
+            'op': operation,
+            'path': self._key(path),
+            'inputs': input_identities if input_identities is not None else self._identities(inputs),
+            'params': canonical_params(params),
+            'output': self.identity(output),
+            'output_path': self._key(output),
+            'done_at': time.time(),
+        }
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._records[(operation, record['path'])] = record
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def snapshot_inputs(self, inputs):
+        return self._identities(inputs)
@@ -0,0 +1,382 @@
+"""
+Native MP4 metadata writer.
+
+Edits the iTunes-style tags in ``moov/udta/meta/ilst`` without touching the
+media payload. The file is read through ``mmap`` to locate the top-level
+boxes, only the ``moov`` box (a few hundred KB even for long episodes) is
+parsed and rebuilt, and the new ``moov`` is written back in one of three
+ways, cheapest first:
+
+    in-place   the new moov fits in the old moov plus any free/skip padding
+               right after it; leftover space becomes a ``free`` box
+    at-end     the moov is the last box; the new one goes into the free box
+               right before it when it fits there (left by an earlier at-end
+               write) and the old moov is truncated away, else it is
+               appended and the old moov becomes a ``free`` box
+    relocate   the old moov is turned into a ``free`` box and the new one is
+               appended at the end of the file; a last box whose size is 0
+               ('runs to the end of the file', usual for a streamed mdat) is
+               first given its explicit size, or the new moov would become
+               part of it
+
+``mdat`` never moves in any of these, so the ``stco``/``co64`` chunk offsets
+stay valid and no sample data is ever copied. at-end and relocate never write
+over the only complete moov: the new one is on disk before the old one is
+retired, so a crash or a full disk leaves the old tags or the new ones. A
+file may briefly hold both, which players resolve by using the first.
+"""
+
+import mmap
+import os
+import plistlib
+import struct
+
+
+# Friendly tag names -> ilst atom types. Matches what ffmpeg's mov muxer writes.
+TEXT_ATOMS = {
+    'title': b'\xa9nam',
+    'artist': b'\xa9ART',
+    'album': b'\xa9alb',
+    'date': b'\xa9day',
+    'genre': b'\xa9gen',
+    'comment': b'\xa9cmt',
+    'description': b'desc',
+    'synopsis': b'ldes',
+    'show': b'tvsh',
+    'network': b'tvnn',
+    'episode_id': b'tven',
+    'encoder': b'\xa9too',
+}
+INTEGER_ATOMS = {
+    'season_number': b'tvsn',
+    'episode_sort': b'tves',
+}
+# iTunes keeps people in a plist under ----:com.apple.iTunes:iTunMOVI
+PEOPLE_KEYS = {
+    'cast': 'cast',
+    'director': 'directors',
+    'producer': 'producers',
+    'writer': 'screenwriters',
+}
+ITUNES_MEAN = b'com.apple.iTunes'
+
+DATA_UTF8 = 1
+DATA_JPEG = 13
+DATA_PNG = 14
+DATA_INTEGER = 21
+
+CONTAINER_PADDING_TYPES = (b'free', b'skip')
+
+
+class MP4Error(ValueError):
+    pass
+
+
+def _box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _free_box(size):
+    if size < 8:
+        raise MP4Error(f"cannot write a {size}-byte free box")
+    return struct.pack('>I4s', size, b'free') + b'\x00' * (size - 8)
+
+
+def _iter_boxes(buf, start, end):
+    """Yield (type, offset, header size, total size) for the boxes in buf[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise MP4Error(f"corrupt '{box_type.decode('latin-1')}' box at offset {pos}")
+        yield box_type, pos, header, size
+        pos += size
+
+
+def _children(data):
+    """Split a container payload into a list of [type, raw box bytes]."""
+    return [[t, bytes(data[o:o + s])] for t, o, _, s in _iter_boxes(data, 0, len(data))]
+
+
+def _join(children):
+    return b''.join(raw for _, raw in children)
+
+
+def _payload(raw):
+    header = 16 if struct.unpack_from('>I', raw, 0)[0] == 1 else 8
+    return raw[header:]
+
+
+def _data_atom(data_type, value):
+    return _box(b'data', struct.pack('>II', data_type, 0) + value)
+
+
+def _freeform_atom(name, data_type, value):
+    mean = _box(b'mean', b'\x00\x00\x00\x00' + ITUNES_MEAN)
+    name_box = _box(b'name', b'\x00\x00\x00\x00' + name.encode('utf-8'))
+    return _box(b'----', mean + name_box + _data_atom(data_type, value))
+
+
+def _freeform_name(raw):
+    mean = name = None
+    for box_type, child in _children(_payload(raw)):
+        if box_type == b'mean':
+            mean = _payload(child)[4:]
+        elif box_type == b'name':
+            name = _payload(child)[4:]
+    return mean, name
+
+
+def _people_plist(tags):
+    people = {}
+    for key, plist_key in PEOPLE_KEYS.items():
+        value = tags.get(key)
+        if value:
+            names = [n.strip() for n in value.split(',') if n.strip()] if isinstance(value, str) else list(value)
+            people[plist_key] = [{'name': n} for n in names]
+    return plistlib.dumps(people, fmt=plistlib.FMT_XML) if people else None
+
+
+def _content_rating(rating):
+    # iTunEXTC format: "<system>|<rating>|<score>|<annotation>"
+    return f"us-tv|{rating}|0|".encode('utf-8')
+
+
+def build_items(tags, cover=None):
+    """
+    Return ({atom type or freeform name: atom bytes or None}) for the given tags.
+
+    A value of None means "remove this atom"; empty strings are treated the
+    same so callers can pass TVDB fields straight through.
+    """
+    items = {}
+    for key, atom in TEXT_ATOMS.items():
+        if key in tags:
+            value = tags[key]
+            items[atom] = _box(atom, _data_atom(DATA_UTF8, str(value).encode('utf-8'))) if value not in (None, '') else None
+    for key, atom in INTEGER_ATOMS.items():
+        if key in tags:
+            value = tags[key]
+            items[atom] = _box(atom, _data_atom(DATA_INTEGER, struct.pack('>I', int(value)))) if value not in (None, '') else None
+    if any(key in tags for key in PEOPLE_KEYS):
+        plist = _people_plist(tags)
+        items[b'iTunMOVI'] = _freeform_atom('iTunMOVI', DATA_UTF8, plist) if plist else None
+    if 'content_rating' in tags:
+        rating = tags['content_rating']
+        items[b'iTunEXTC'] = _freeform_atom('iTunEXTC', DATA_UTF8, _content_rating(rating)) if rating else None
+    if cover is not None:
+        data_type = DATA_PNG if cover[:8] == b'\x89PNG\r\n\x1a\n' else DATA_JPEG
+        items[b'covr'] = _box(b'covr', _data_atom(data_type, cover))
+    return items
+
+
+def _item_key(box_type, raw):
+    if box_type == b'----':
+        mean, name = _freeform_name(raw)
+        if mean == ITUNES_MEAN:
+            return name
+    return box_type
+
+
+def _update_ilst(ilst_payload, items):
+    children = _children(ilst_payload)
+    kept = [[t, raw] for t, raw in children if _item_key(t, raw) not in items]
+    kept.extend([key, raw] for key, raw in items.items() if raw is not None)
+    return _join(kept)
+
+
+def _hdlr_box():
+    # version/flags, pre_defined, handler 'mdir', reserved ('appl' + 8 zero bytes), empty name
+    return _box(b'hdlr', b'\x00' * 8 + b'mdir' + b'appl' + b'\x00' * 9)
+
+
+def _meta_is_full_box(payload):
+    # QuickTime-style meta boxes have no version/flags; ISO ones do
+    return payload[4:8] != b'hdlr'
+
+
+def rebuild_moov(moov_payload, items):
+    """Return the new moov box with ``items`` applied to its ilst. Padding inside udta/meta is dropped."""
+    moov_children = _children(moov_payload)
+    udta = next((c for c in moov_children if c[0] == b'udta'), None)
+    if udta is None:
+        udta = [b'udta', _box(b'udta', b'')]
+        moov_children.append(udta)
+    udta_children = _children(_payload(udta[1]))
+
+    meta = next((c for c in udta_children if c[0] == b'meta'), None)
+    if meta is None:
+        meta = [b'meta', _box(b'meta', b'\x00' * 4 + _hdlr_box())]
+        udta_children.append(meta)
+    meta_payload = _payload(meta[1])
+    full_box = _meta_is_full_box(meta_payload)
+    meta_header = meta_payload[:4] if full_box else b''
+    meta_children = _children(meta_payload[4:] if full_box else meta_payload)
+    if not any(t == b'hdlr' for t, _ in meta_children):
+        meta_children.insert(0, [b'hdlr', _hdlr_box()])
+
+    ilst = next((c for c in meta_children if c[0] == b'ilst'), None)
+    if ilst is None:
+        ilst = [b'ilst', _box(b'ilst', b'')]
+        meta_children.append(ilst)
+    ilst[1] = _box(b'ilst', _update_ilst(_payload(ilst[1]), items))
+
+    meta_children = [c for c in meta_children if c[0] not in CONTAINER_PADDING_TYPES]
+    meta[1] = _box(b'meta', meta_header + _join(meta_children))
+    udta_children = [c for c in udta_children if c[0] not in CONTAINER_PADDING_TYPES]
+    udta[1] = _box(b'udta', _join(udta_children))
+    return _box(b'moov', _join(moov_children))
+
+
+def _layout(path):
+    """Return (file size, top-level boxes as (type, offset, header, size), moov payload)."""
+    size = os.path.getsize(path)
+    if size < 8:
+        raise MP4Error(f"{path}: not an MP4 file")
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        boxes = list(_iter_boxes(buf, 0, size))
+        moov = next((b for b in boxes if b[0] == b'moov'), None)
+        if moov is None:
+            raise MP4Error(f"{path}: no moov box")
+        _, offset, header, box_size = moov
+        payload = bytes(buf[offset + header:offset + box_size])
+    return size, boxes, payload
+
+
+def _close_last_box(f, box, file_size, path):
+    """Give a last box of size 0 its explicit size, so data appended after it is a box of its own."""
+    box_type, offset, header, size = box
+    f.seek(offset)
+    if header != 8 or struct.unpack('>I', f.read(4))[0] != 0:
+        return
+    if size >= 2 ** 32:
+        # A 64-bit size needs 8 more header bytes than the box has
+        raise MP4Error(f"{path}: the '{box_type.decode('latin-1')}' box runs to the end of the file and is too large "
+                       f"to close in place; use --remux")
+    f.seek(offset)
+    f.write(struct.pack('>I', size))
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def write_tags(path, tags, cover=None):
+    """
+    Apply ``tags`` (and optional cover art bytes) to the MP4 at ``path`` in place.
+
+    Returns the strategy used: 'in-place', 'at-end' or 'relocate'.
+    """
+    file_size, boxes, moov_payload = _layout(path)
+    new_moov = rebuild_moov(moov_payload, build_items(tags, cover))
+
+    index = next(i for i, b in enumerate(boxes) if b[0] == b'moov')
+    # A later moov is a leftover of an interrupted write; players use the first, so it is only padding
+    stale = [b for b in boxes[index + 1:] if b[0] == b'moov']
+    boxes = [(b'free',) + b[1:] if b in stale else b for b in boxes]
+    moov_offset = boxes[index][1]
+    available = boxes[index][3]
+    following = index + 1
+    while following < len(boxes) and boxes[following][0] in CONTAINER_PADDING_TYPES:
+        available += boxes[following][3]
+        following += 1
+    is_last = following == len(boxes)
+    preceding = index
+    while preceding > 0 and boxes[preceding - 1][0] in CONTAINER_PADDING_TYPES:
+        preceding -= 1
+    space_before = moov_offset - boxes[preceding][1]
+
+    with open(path, 'r+b') as f:
+        if len(new_moov) == available or len(new_moov) + 8 <= available:
+            f.seek(moov_offset)
+            f.write(new_moov)
+            if len(new_moov) < available:
+                f.write(_free_box(available - len(new_moov)))
+            strategy = 'in-place'
+        elif is_last and space_before < 2 ** 32 and (len(new_moov) == space_before or len(new_moov) + 8 <= space_before):
+            start = boxes[preceding][1]
+            # One free box over all the padding, filled behind its header, then the header becomes the moov's
+            f.seek(start)
+            f.write(struct.pack('>I4s', space_before, b'free'))
+            f.flush()
+            os.fsync(f.fileno())
+            f.write(new_moov[8:])
+            if len(new_moov) < space_before:
+                f.write(_free_box(space_before - len(new_moov)))
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(start)
+            f.write(new_moov[:8])
+            f.flush()
+            os.fsync(f.fileno())
+            f.truncate(moov_offset)
+            strategy = 'at-end'
+        else:
+            _close_last_box(f, boxes[-1], file_size, path)
+            # Append first so the file always has one complete moov, then retire the old one
+            f.seek(file_size)
+            f.write(new_moov)
+            f.flush()
+            os.fsync(f.fileno())
+            # Stale copies go too, or the first of them would take over from the new moov
+            for _, offset, _, size in [boxes[index]] + stale:
+                f.seek(offset)
+                f.write(struct.pack('>I4s', size, b'free'))
+            strategy = 'at-end' if is_last else 'relocate'
+        f.flush()
+        os.fsync(f.fileno())
+    return strategy
+
+
+def track_handlers(path):
+    """Return the handler type of every trak in moov order, e.g. ['vide', 'soun', 'sbtl']."""
+    _, _, moov_payload = _layout(path)
+    handlers = []
+    for box_type, raw in _children(moov_payload):
+        if box_type != b'trak':
+            continue
+        handler = ''
+        for trak_type, trak_raw in _children(_payload(raw)):
+            if trak_type != b'mdia':
+                continue
+            for mdia_type, mdia_raw in _children(_payload(trak_raw)):
+                if mdia_type == b'hdlr':
+                    handler = _payload(mdia_raw)[8:12].decode('latin-1')
+        handlers.append(handler)
+    return handlers
+
+
+def read_tags(path):
+    """Return {atom name: value} for the ilst of an MP4; cover art is reported by size."""
+    _, _, moov_payload = _layout(path)
+    tags = {}
+    for box_type, raw in _children(moov_payload):
+        if box_type != b'udta':
+            continue
+        for meta_type, meta_raw in _children(_payload(raw)):
+            if meta_type != b'meta':
+                continue
+            payload = _payload(meta_raw)
+            for ilst_type, ilst_raw in _children(payload[4:] if _meta_is_full_box(payload) else payload):
+                if ilst_type != b'ilst':
+                    continue
+                for item_type, item_raw in _children(_payload(ilst_raw)):
+                    key = _item_key(item_type, item_raw)
+                    for data_type, data_raw in _children(_payload(item_raw)):
+                        if data_type != b'data':
+                            continue
+                        data_payload = _payload(data_raw)
+                        kind = struct.unpack_from('>I', data_payload, 0)[0] & 0xFFFFFF
+                        value = data_payload[8:]
+                        if item_type == b'covr':
+                            value = len(value)
+                        elif kind == DATA_UTF8:
+                            value = value.decode('utf-8', 'replace')
+                        elif kind == DATA_INTEGER and len(value) in (1, 2, 4, 8):
+                            value = int.from_bytes(value, 'big')
+                        tags[key.decode('latin-1')] = value
+    return tags
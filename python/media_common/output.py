@@ -0,0 +1,228 @@
+"""
+Where remux jobs write their results.
+
+Every result is written to a hidden temp file in the destination folder
+('.Episode.mp4.1a2b3c.partial') and renamed into place only once ffmpeg has
+succeeded, so an interrupted run never leaves a half-written file under a
+real name. Two strategies decide what that place is:
+
+    copy       next to the original under the script's own name
+               ('*.output.mp4', '*_updated.mp4'), as before
+    replace    over the original, after the result's streams and duration
+               were checked against it; mode, owner and timestamps are
+               carried over and the rename is atomic (same directory, so
+               same volume). ``backup=True`` keeps the original as a
+               hardlink, '.Episode.mp4.orig'.
+
+Before a job starts, ``statvfs`` must show room for its output (plus a
+margin), and the temp file is preallocated with ``fallocate`` where the
+filesystem supports it, so a full disk fails the job up front rather than at
+90%. Space is booked per volume, so concurrent workers cannot all pass the
+check for the same free gigabytes. With ``replace`` the extra space needed
+peaks at one file per worker instead of a second copy of the whole library.
+"""
+
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import os
+import secrets
+import stat
+import threading
+
+from . import probe
+
+
+STRATEGIES = ('copy', 'replace')
+DEFAULT_MARGIN = 256 * 1024 * 1024
+DURATION_TOLERANCE = 1.0
+PARTIAL_SUFFIX = '.partial'
+BACKUP_SUFFIX = '.orig'
+
+_FALLOC_FL_KEEP_SIZE = 0x01
+
+_booked = {}
+_booked_lock = threading.Lock()
+_libc = None
+
+
+class InsufficientSpace(OSError):
+    pass
+
+
+class VerificationError(RuntimeError):
+    pass
+
+
+def free_space(directory):
+    st = os.statvfs(directory)
+    return st.f_bavail * st.f_frsize
+
+
+def _fallocate(fd, size):
+    """Reserve ``size`` bytes for fd without changing its length; False where that is not supported."""
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    func = getattr(_libc, 'fallocate', None)
+    if func is None:
+        return False
+    func.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+    if func(fd, _FALLOC_FL_KEEP_SIZE, 0, size) == 0:
+        return True
+    error = ctypes.get_errno()
+    if error == errno.ENOSPC:
+        raise InsufficientSpace(error, os.strerror(error))
+    # EOPNOTSUPP on SMB/NFS and tmpfs, ENOSYS on old kernels
+    return False
+
+
+def partial_path(destination):
+    directory, name = os.path.split(destination)
+    return os.path.join(directory, f".{name}.{secrets.token_hex(3)}{PARTIAL_SUFFIX}")
+
+
+def backup_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}{BACKUP_SUFFIX}")
+
+
+def ffmpeg_output_args(path, format_name='mp4'):
+    """
+    Output arguments for writing into a preallocated temp file: the name has
+    no media extension, so the muxer is named, and ``-truncate 0`` stops the
+    file protocol from truncating (and so releasing) the reserved blocks.
+    """
+    return ['-f', format_name, '-truncate', '0', path]
+
+
+def expected_layout(info, add=None, drop=None):
+    """Stream counts per type from a probe, adjusted by what the command maps in or out."""
+    counts = {}
+    for s in info.streams:
+        counts[s.codec_type] = counts.get(s.codec_type, 0) + 1
+    for codec_type, n in (add or {}).items():
+        counts[codec_type] = counts.get(codec_type, 0) + n
+    for codec_type, n in (drop or {}).items():
+        counts[codec_type] = counts.get(codec_type, 0) - n
+    return counts
+
+
+def verify(path, layout, duration=None, runner=None):
+    """Raise VerificationError unless ``path`` has at least ``layout``'s streams and about ``duration`` seconds."""
+    info = probe.probe_file(path, runner=runner)
+    for codec_type, expected in layout.items():
+        found = len(info.streams_of_type(codec_type))
+        if found < expected:
+            raise VerificationError(f"{path}: {found} {codec_type} stream(s), expected {expected}")
+    if duration and abs(info.duration - duration) > max(DURATION_TOLERANCE, duration * 0.01):
+        raise VerificationError(f"{path}: duration {info.duration:.1f}s, expected {duration:.1f}s")
+    return info
+
+
+def _carry_over(source, path):
+    st = os.stat(source)
+    os.chmod(path, stat.S_IMODE(st.st_mode))
+    try:
+        os.chown(path, st.st_uid, st.st_gid)
+    except PermissionError:
+        pass
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def _sync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class OutputStrategy:
+    """Decides where a job's result goes and moves it there safely."""
+
+    def __init__(self, strategy='copy', backup=False, margin=DEFAULT_MARGIN):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown output strategy '{strategy}'. Use one of: {', '.join(STRATEGIES)}")
+        self.strategy = strategy
+        self.backup = backup
+        self.margin = margin
+
+    @property
+    def replaces(self):
+        return self.strategy == 'replace'
+
+    def destination(self, source, copy_path):
+        """Final path of the result: the original itself, or the side-by-side copy."""
+        return source if self.replaces else copy_path
+
+    @contextlib.contextmanager
+    def writing(self, source, copy_path, needed):
+        """
+        Yield the temp path to write the result of ``source`` to. On a clean
+        exit it becomes ``destination()``; on an exception it is removed.
+        """
+        destination = self.destination(source, copy_path)
+        directory = os.path.dirname(os.path.abspath(destination))
+        device = os.stat(directory).st_dev
+        path = partial_path(destination)
+        booked = 0
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            with _booked_lock:
+                available = free_space(directory) - _booked.get(device, 0)
+                if available < needed + self.margin:
+                    raise InsufficientSpace(errno.ENOSPC, f"{available // 2**20} MiB free in {directory}, "
+                                                          f"{(needed + self.margin) // 2**20} MiB needed")
+                if not _fallocate(fd, needed):
+                    # Nothing was reserved on disk, so keep the space booked here until the job ends
+                    booked = needed
+                    _booked[device] = _booked.get(device, 0) + booked
+            os.close(fd)
+            fd = None
+            yield path
+            # Give back whatever the preallocation reserved beyond what was written
+            os.truncate(path, os.path.getsize(path))
+            self._commit(source, path, destination)
+        except BaseException:
+            if fd is not None:
+                os.close(fd)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            raise
+        finally:
+            if booked:
+                with _booked_lock:
+                    _booked[device] -= booked
+
+    def _commit(self, source, path, destination):
+        if self.replaces:
+            _carry_over(source, path)
+            if self.backup:
+                backup = backup_path(source)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(backup)
+                os.link(source, backup)
+        os.replace(path, destination)
+        _sync_directory(os.path.dirname(os.path.abspath(destination)))
+
+
+def add_arguments(parser):
+    """The --output-strategy/--keep-backup/--min-free options shared by the remuxing scripts."""
+    parser.add_argument('--output-strategy', choices=STRATEGIES, default='copy',
+                        help="'copy' writes the result next to the original (default); 'replace' swaps it in "
+                             "for the original after checking its streams")
+    parser.add_argument('--keep-backup', action='store_true',
+                        help="With --output-strategy replace, keep each original as a hidden hardlink ('.name.orig')")
+    parser.add_argument('--min-free', type=int, default=DEFAULT_MARGIN // 2**20, metavar='MB',
+                        help=f'Free space to leave on the volume besides the output (default: {DEFAULT_MARGIN // 2**20})')
+
+
+def from_args(args):
+    return OutputStrategy(args.output_strategy, backup=args.keep_backup, margin=args.min_free * 2**20)
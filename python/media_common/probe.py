@@ -0,0 +1,126 @@
+"""
+Single-shot ffprobe wrapper.
+
+Runs ``ffprobe -show_streams -show_format -of json`` once per file and turns
+the result into a small in-memory model, so callers never need to spawn a
+separate ffprobe per stream or per field.
+"""
+
+import json
+import os
+import subprocess
+from dataclasses import dataclass, field
+
+from . import faults, trace
+
+
+@dataclass
+class Stream:
+    """One stream of a media file as reported by ffprobe."""
+    index: int
+    codec_type: str
+    codec_name: str = ''
+    channels: int = 0
+    channel_layout: str = ''
+    tags: dict = field(default_factory=dict)
+    disposition: dict = field(default_factory=dict)
+
+    @property
+    def language(self):
+        return self.tags.get('language', '')
+
+    @property
+    def title(self):
+        return self.tags.get('title', '')
+
+
+@dataclass
+class MediaInfo:
+    """Parsed ffprobe output for a whole file."""
+    path: str
+    format_name: str = ''
+    duration: float = 0.0
+    size: int = 0
+    tags: dict = field(default_factory=dict)
+    streams: list = field(default_factory=list)
+
+    def streams_of_type(self, codec_type):
+        return [s for s in self.streams if s.codec_type == codec_type]
+
+    @property
+    def video_streams(self):
+        return self.streams_of_type('video')
+
+    @property
+    def audio_streams(self):
+        return self.streams_of_type('audio')
+
+    @property
+    def subtitle_streams(self):
+        return self.streams_of_type('subtitle')
+
+
+def _lower_keys(tags):
+    # Containers disagree on tag case (e.g. "LANGUAGE" in MKV, "language" in MP4)
+    return {str(k).lower(): v for k, v in (tags or {}).items()}
+
+
+def parse_probe_output(path, data):
+    """Build a MediaInfo from the decoded JSON document ffprobe printed."""
+    fmt = data.get('format', {})
+    streams = []
+    for raw in data.get('streams', []):
+        streams.append(Stream(
+            index=int(raw.get('index', len(streams))),
+            codec_type=raw.get('codec_type', ''),
+            codec_name=raw.get('codec_name', ''),
+            channels=int(raw.get('channels', 0) or 0),
+            channel_layout=raw.get('channel_layout', ''),
+            tags=_lower_keys(raw.get('tags')),
+            disposition=dict(raw.get('disposition', {})),
+        ))
+    return MediaInfo(
+        path=path,
+        format_name=fmt.get('format_name', ''),
+        duration=float(fmt.get('duration', 0) or 0),
+        size=int(fmt.get('size', 0) or 0),
+        tags=_lower_keys(fmt.get('tags')),
+        streams=streams,
+    )
+
+
+def _run(cmd):
+    return trace.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True,
+                     timeout=faults.PROBE_TIMEOUT)
+
+
+def probe_command(path):
+    return [
+        'ffprobe',
+        '-v', 'error',
+        '-show_streams',
+        '-show_format',
+        '-of', 'json',
+        path
+    ]
+
+
+def probe_file(path, runner=None, cache=None):
+    """
+    Probe a media file with a single ffprobe call and return a MediaInfo.
+
+    ``runner`` takes the command list and returns a CompletedProcess; scripts
+    pass their own ``run_command`` so debug output stays consistent. When a
+    ``ProbeCache`` is given it is consulted first and filled on a miss.
+    """
+    st = None
+    if cache is not None:
+        st = os.stat(path)
+        data = cache.get(path, st)
+        if data is not None:
+            return parse_probe_output(path, data)
+    result = (runner or _run)(probe_command(path))
+    data = json.loads(result.stdout or '{}')
+    if cache is not None:
+        cache.put(path, data, st)
+    return parse_probe_output(path, data)
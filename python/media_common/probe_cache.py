@@ -0,0 +1,163 @@
+"""
+Persistent cache of parsed ffprobe results.
+
+Entries are keyed by file identity (device, inode, size, mtime_ns), so an
+unchanged file costs a single ``stat`` instead of an ffprobe spawn. The cache
+is a SQLite database under ``$XDG_CACHE_HOME/media-scripts`` unless
+``MEDIA_PROBE_CACHE`` points somewhere else (e.g. the library root).
+
+Maintenance:
+    python -m media_common.probe_cache stats
+    python -m media_common.probe_cache vacuum [--max-age-days N]
+    python -m media_common.probe_cache clear
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    data TEXT NOT NULL,
+    probed_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (dev, ino, size, mtime_ns)
+)
+"""
+
+
+def default_cache_path():
+    override = os.environ.get('MEDIA_PROBE_CACHE')
+    if override:
+        return override
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'media-scripts', 'probe-cache.sqlite3')
+
+
+def file_identity(path, st=None):
+    st = st or os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class ProbeCache:
+    """SQLite-backed store of raw ffprobe JSON keyed by file identity."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_cache_path()
+        parent = os.path.dirname(self.db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        # Worker threads share one connection; the lock serialises access
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, st=None):
+        """Return the cached ffprobe document for ``path``, or None on a miss."""
+        key = file_identity(path, st)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM probes WHERE dev=? AND ino=? AND size=? AND mtime_ns=?', key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                'UPDATE probes SET last_used=?, path=? WHERE dev=? AND ino=? AND size=? AND mtime_ns=?',
+                (time.time(), path) + key
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, path, data, st=None):
+        key = file_identity(path, st)
+        now = time.time()
+        with self._lock:
+            # A changed file gets a new key; drop whatever was stored for the old version
+            self._conn.execute('DELETE FROM probes WHERE dev=? AND ino=?', key[:2])
+            self._conn.execute(
+                'INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                key + (path, json.dumps(data, separators=(',', ':')), now, now)
+            )
+            self._conn.commit()
+
+    def vacuum(self, max_age_days=None):
+        """
+        Drop entries whose file is gone or has changed, plus entries unused for
+        more than ``max_age_days``, then compact the database. Returns the
+        number of rows removed.
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT dev, ino, size, mtime_ns, path, last_used FROM probes').fetchall()
+        cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+        stale = []
+        for dev, ino, size, mtime_ns, path, last_used in rows:
+            if cutoff is not None and last_used < cutoff:
+                stale.append((dev, ino, size, mtime_ns))
+                continue
+            try:
+                if file_identity(path) != (dev, ino, size, mtime_ns):
+                    stale.append((dev, ino, size, mtime_ns))
+            except OSError:
+                stale.append((dev, ino, size, mtime_ns))
+        with self._lock:
+            self._conn.executemany('DELETE FROM probes WHERE dev=? AND ino=? AND size=? AND mtime_ns=?', stale)
+            self._conn.commit()
+            self._conn.execute('VACUUM')
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM probes')
+            self._conn.commit()
+            self._conn.execute('VACUUM')
+
+    def entry_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM probes').fetchone()[0]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': self.entry_count()}
+
+    def close(self):
+        self._conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect and maintain the ffprobe result cache.')
+    parser.add_argument('--db', help=f'Cache database (default: {default_cache_path()})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help='Show the number of cached entries')
+    vacuum = sub.add_parser('vacuum', help='Evict entries for missing or changed files and compact the database')
+    vacuum.add_argument('--max-age-days', type=float, help='Also evict entries unused for this many days')
+    sub.add_parser('clear', help='Remove every cached entry')
+    args = parser.parse_args(argv)
+
+    cache = ProbeCache(args.db)
+    if args.command == 'stats':
+        print(f"{cache.db_path}: {cache.entry_count()} entries")
+    elif args.command == 'vacuum':
+        removed = cache.vacuum(args.max_age_days)
+        print(f"Evicted {removed} entries, {cache.entry_count()} remaining.")
+    elif args.command == 'clear':
+        cache.clear()
+        print(f"Cleared {cache.db_path}.")
+    cache.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Batched rename engine with collision/cycle handling, a journal and undo.
+
+The rename tools first collect every (source, destination) move for a show,
+then ``plan_renames`` orders them so that no move ever lands on a file that
+is still waiting to be moved away:
+
+* chains (a -> b, b -> c) run back to front;
+* cycles (a -> b, b -> a, common when swapping DVD and aired order) are
+  broken with one hidden temporary name per cycle;
+* moves onto an existing file that is not part of the batch, or two moves
+  onto the same destination, are reported as conflicts and left out.
+
+``execute`` runs the plan as one batch and appends every step to a JSON-lines
+journal (fsynced), so an interrupted batch can be finished with ``resume``
+and a finished one reverted with ``undo``.
+"""
+
+import json
+import os
+import time
+from collections import deque
+
+from . import trace
+
+
+JOURNAL_NAME = '.rename-journal.jsonl'
+
+
+class RenamePlan:
+    """Ordered rename steps plus whatever could not be planned."""
+
+    def __init__(self):
+        self.steps = []
+        self.conflicts = []
+        self.directories = []
+        self.temporaries = 0
+
+    def __len__(self):
+        return len(self.steps)
+
+    def print(self, show_temporaries=False):
+        for src, dst in self.steps:
+            if show_temporaries or not _is_temporary(dst):
+                print(f"Rename: {src} -> {dst}")
+        for src, dst, reason in self.conflicts:
+            print(f"Conflict: {src} -> {dst}: {reason}")
+        print(f"{len(self.steps)} step(s), {self.temporaries} temporary rename(s), {len(self.conflicts)} conflict(s).")
+
+
+def _is_temporary(path):
+    return '.renametmp-' in os.path.basename(path)
+
+
+def _temporary_name(path, batch):
+    return os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.renametmp-{batch}")
+
+
+def _same_file(src, dst):
+    # A case-only rename on a case-insensitive share: dst "exists" because it is src itself.
+    # On a case-sensitive filesystem a name differing only by case is another file.
+    try:
+        return os.path.samefile(src, dst)
+    except OSError:
+        return False
+
+
+def plan_renames(moves, exists=os.path.exists, batch=None):
+    """
+    Order ``moves`` (an iterable of (src, dst) paths) into a safe sequence.
+
+    ``exists`` is used for collision checks; scripts pass a lookup into their
+    library index so planning does not stat every destination.
+    """
+    batch = batch or time.strftime('%Y%m%d%H%M%S')
+    plan = RenamePlan()
+
+    pending = {}
+    claimed = {}
+    for src, dst in moves:
+        src, dst = os.path.abspath(src), os.path.abspath(dst)
+        if src == dst:
+            continue
+        if dst in claimed:
+            plan.conflicts.append((src, dst, f"also the destination of {claimed[dst]}"))
+            continue
+        claimed[dst] = src
+        pending[src] = dst
+
+    # Collisions with files that are not themselves being moved away. Dropping a
+    # move leaves its source in place, which can block another move in turn.
+    sources = set(pending)
+    changed = True
+    while changed:
+        changed = False
+        for src, dst in list(pending.items()):
+            if dst not in pending and exists(dst) and not _same_file(src, dst):
+                reason = "destination is not moved away" if dst in sources else "destination already exists"
+                plan.conflicts.append((src, dst, reason))
+                del pending[src]
+                changed = True
+
+    directories = set()
+    for dst in pending.values():
+        parent = os.path.dirname(dst)
+        if parent not in directories and not exists(parent):
+            directories.add(parent)
+    plan.directories = sorted(directories)
+
+    # blocked[x] = the source whose destination is x, waiting for x to be moved away
+    blocked = {dst: src for src, dst in pending.items() if dst in pending}
+    ready = deque(src for src, dst in pending.items() if dst not in pending)
+    while pending:
+        while ready:
+            src = ready.popleft()
+            dst = pending.pop(src)
+            plan.steps.append((src, dst))
+            waiting = blocked.pop(src, None)
+            if waiting is not None:
+                ready.append(waiting)
+        if pending:
+            # Only cycles are left; park one member under a temporary name
+            src = next(iter(pending))
+            dst = pending.pop(src)
+            temporary = _temporary_name(src, batch)
+            plan.steps.append((src, temporary))
+            plan.temporaries += 1
+            pending[temporary] = dst
+            blocked[dst] = temporary
+            waiting = blocked.pop(src, None)
+            if waiting is not None:
+                ready.append(waiting)
+    return plan
+
+
+def _append(journal_path, record):
+    with open(journal_path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_batches(journal_path):
+    batches = {}
+    order = []
+    try:
+        with open(journal_path, 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return batches, order
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        batch = batches.get(record['batch'])
+        if record['event'] == 'begin':
+            batch = {'id': record['batch'], 'steps': record['steps'], 'dirs': record.get('dirs', []),
+                     'done': set(), 'undone': set(), 'state': 'open'}
+            batches[record['batch']] = batch
+            order.append(record['batch'])
+        elif batch is None:
+            continue
+        elif record['event'] == 'step':
+            batch['done'].add(record['i'])
+        elif record['event'] == 'unstep':
+            batch['undone'].add(record['i'])
+        elif record['event'] in ('commit', 'undone'):
+            batch['state'] = record['event']
+    return batches, order
+
+
+def _run_steps(journal_path, batch_id, steps, start_done, verbose):
+    originals = {}
+    for i, (src, dst) in enumerate(steps):
+        if _is_temporary(dst):
+            originals[dst] = src
+        if i in start_done:
+            continue
+        if not os.path.exists(src) and os.path.exists(dst):
+            # Renamed just before a crash, the journal line never made it
+            pass
+        else:
+            os.rename(src, dst)
+            if verbose and not _is_temporary(dst):
+                print(f"Renamed: {originals.get(src, src)} -> {dst}")
+        _append(journal_path, {'batch': batch_id, 'event': 'step', 'i': i})
+
+
+def execute(plan, journal_path, verbose=True):
+    """Apply a plan as one journaled batch and return its batch id."""
+    if not plan.steps:
+        return None
+    batch_id = time.strftime('%Y%m%d%H%M%S') + f"-{os.getpid()}"
+    with trace.span('rename', batch=batch_id, steps=len(plan.steps)):
+        _append(journal_path, {'batch': batch_id, 'event': 'begin', 'steps': plan.steps, 'dirs': plan.directories})
+        for directory in plan.directories:
+            os.makedirs(directory, exist_ok=True)
+        _run_steps(journal_path, batch_id, plan.steps, set(), verbose)
+        _append(journal_path, {'batch': batch_id, 'event': 'commit'})
+    return batch_id
+
+
+def resume(journal_path, verbose=True):
+    """Finish the most recent batch that was interrupted. Returns its id, or None."""
+    batches, order = _read_batches(journal_path)
+    for batch_id in reversed(order):
+        batch = batches[batch_id]
+        if batch['state'] == 'open' and not batch['undone']:
+            for directory in batch['dirs']:
+                os.makedirs(directory, exist_ok=True)
+            _run_steps(journal_path, batch_id, batch['steps'], batch['done'], verbose)
+            _append(journal_path, {'batch': batch_id, 'event': 'commit'})
+            return batch_id
+    return None
+
+
+def undo(journal_path, verbose=True):
+    """Revert the most recent batch (finished or not). Returns its id, or None."""
+    batches, order = _read_batches(journal_path)
+    for batch_id in reversed(order):
+        batch = batches[batch_id]
+        if batch['state'] == 'undone':
+            continue
+        for i in sorted(batch['done'], reverse=True):
+            if i in batch['undone']:
+                continue
+            src, dst = batch['steps'][i]
+            if os.path.exists(dst) and not os.path.exists(src):
+                os.rename(dst, src)
+                if verbose and not _is_temporary(src) and not _is_temporary(dst):
+                    print(f"Restored: {dst} -> {src}")
+            elif not (os.path.exists(src) and not os.path.exists(dst)):
+                raise RuntimeError(f"Cannot undo {src} -> {dst}: the files changed since the rename")
+            _append(journal_path, {'batch': batch_id, 'event': 'unstep', 'i': i})
+        for directory in reversed(batch['dirs']):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        _append(journal_path, {'batch': batch_id, 'event': 'undone'})
+        return batch_id
+    return None
+
+
+def add_arguments(parser):
+    """The --dry-run/--undo/--resume options shared by the rename scripts."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--dry-run', action='store_true', help='Print the rename plan without renaming anything')
+    group.add_argument('--undo', action='store_true', help='Revert the last rename batch recorded in the journal')
+    group.add_argument('--resume', action='store_true', help='Finish a rename batch that was interrupted')
+
+
+def apply_moves(moves, root, dry_run=False, exists=os.path.exists):
+    """Plan ``moves`` and print (dry run) or execute them, journaling under ``root``."""
+    plan = plan_renames(moves, exists)
+    if dry_run:
+        plan.print(show_temporaries=True)
+        return plan
+    for src, dst, reason in plan.conflicts:
+        print(f"Skipped: {src} -> {dst}: {reason}")
+    execute(plan, os.path.join(root, JOURNAL_NAME))
+    return plan
+
+
+def run_journal_command(root, undo_last=False, resume_last=False):
+    """Handle --undo/--resume. Returns True when one of them was requested."""
+    journal_path = os.path.join(root, JOURNAL_NAME)
+    if undo_last:
+        batch_id = undo(journal_path)
+        print(f"Reverted rename batch {batch_id}." if batch_id else "Nothing to undo.")
+        return True
+    if resume_last:
+        batch_id = resume(journal_path)
+        print(f"Finished rename batch {batch_id}." if batch_id else "No interrupted rename batch found.")
+        return True
+    return False
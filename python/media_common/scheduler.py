@@ -0,0 +1,198 @@
+"""
+Disk-aware worker pool for per-file media jobs.
+
+Jobs are mostly I/O-bound ffmpeg/ffprobe runs, so the pool runs up to
+``max_workers`` of them at once but never more than ``per_volume`` against the
+same device (``st_dev``). Two shares on different disks therefore run side by
+side while a single HDD is not thrashed by competing remuxes.
+
+Anything a job prints is buffered and written out in submission order, so the
+log reads the same as a sequential run no matter which job finishes first.
+A ``retry`` policy (see ``faults``) reruns a job after a network or transient
+I/O error; a failed job never stops the others unless ``fail_fast`` is set.
+"""
+
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from . import faults
+
+
+@dataclass
+class Job:
+    """A unit of work: ``func()`` is called with no arguments."""
+    label: str
+    path: str
+    func: object
+    device: int = None
+
+
+@dataclass
+class JobResult:
+    job: Job
+    ok: bool = False
+    value: object = None
+    error: BaseException = None
+    output: str = ''
+    skipped: bool = False
+
+    @property
+    def kind(self):
+        return faults.classify(self.error) if self.error is not None else None
+
+
+class ThreadLocalStdout:
+    """Routes writes to a per-thread buffer when one is set, else to the real stream."""
+
+    def __init__(self, real):
+        self.real = real
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        return (buffer if buffer is not None else self.real).write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.real.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+
+def device_of(path):
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+
+def _run_job(job, stdout_proxy, retry=None):
+    result = JobResult(job)
+    buffer = io.StringIO()
+    if stdout_proxy is not None:
+        stdout_proxy.local.buffer = buffer
+    try:
+        result.value = (retry or faults.NO_RETRY).call(job.func, label=job.label)
+        result.ok = True
+    except Exception as e:
+        result.error = e
+    finally:
+        if stdout_proxy is not None:
+            stdout_proxy.local.buffer = None
+        result.output = buffer.getvalue()
+    return result
+
+
+def run_jobs(jobs, max_workers=1, per_volume=1, fail_fast=False, retry=None):
+    """
+    Run ``jobs`` and return their JobResults in submission order.
+
+    With ``fail_fast`` no new jobs are started after the first failure and
+    that failure is re-raised once running jobs have finished, carrying the
+    results so far as ``error.results``. Otherwise every
+    job runs and failures are reported in the returned results.
+    """
+    jobs = list(jobs)
+    total = len(jobs)
+    results = [None] * total
+    if total == 0:
+        return results
+
+    if max_workers <= 1:
+        for i, job in enumerate(jobs):
+            results[i] = _run_job(job, None, retry)
+            _report(i, total, results[i], echo_output=False)
+            if not results[i].ok and fail_fast:
+                _mark_skipped(jobs, results)
+                results[i].error.results = results
+                raise results[i].error
+        return results
+
+    # Queue jobs per device, keeping submission order inside each queue
+    queues = OrderedDict()
+    for i, job in enumerate(jobs):
+        if job.device is None:
+            job.device = device_of(job.path)
+        queues.setdefault(job.device, deque()).append(i)
+
+    active = {device: 0 for device in queues}
+    running = {}
+    next_to_emit = 0
+    first_error = None
+    stdout_proxy = ThreadLocalStdout(sys.stdout)
+    sys.stdout = stdout_proxy
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while queues or running:
+                if first_error is None or not fail_fast:
+                    for device in list(queues):
+                        queue = queues[device]
+                        while queue and active[device] < per_volume and len(running) < max_workers:
+                            i = queue.popleft()
+                            running[pool.submit(_run_job, jobs[i], stdout_proxy, retry)] = i
+                            active[device] += 1
+                        if not queue:
+                            del queues[device]
+                else:
+                    queues.clear()
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    results[i] = future.result()
+                    active[jobs[i].device] -= 1
+                    if not results[i].ok and first_error is None:
+                        first_error = results[i].error
+
+                while next_to_emit < total and results[next_to_emit] is not None:
+                    _report(next_to_emit, total, results[next_to_emit], echo_output=True)
+                    next_to_emit += 1
+    finally:
+        sys.stdout = stdout_proxy.real
+
+    _mark_skipped(jobs, results)
+    # Jobs that finished after a skipped one in fail-fast mode are still reported
+    for i in range(next_to_emit, total):
+        if not results[i].skipped:
+            _report(i, total, results[i], echo_output=True)
+
+    if first_error is not None and fail_fast:
+        first_error.results = results
+        raise first_error
+    return results
+
+
+def _mark_skipped(jobs, results):
+    for i, job in enumerate(jobs):
+        if results[i] is None:
+            results[i] = JobResult(job, skipped=True)
+
+
+def _report(i, total, result, echo_output):
+    if echo_output and result.output:
+        sys.stdout.write(result.output)
+    status = 'ok' if result.ok else f'FAILED, {result.kind} ({result.error})'
+    print(f"[{i + 1}/{total}] {result.job.label}: {status}")
+    stderr = getattr(result.error, 'stderr', None)
+    if stderr:
+        # Only the tail of ffmpeg's stderr says why it failed
+        print('\n'.join(stderr.strip().splitlines()[-5:]))
+    sys.stdout.flush()
+
+
+def summarize(results):
+    """Print a one-line summary and return the number of failed jobs."""
+    failed = [r for r in results if r is not None and not r.ok and not r.skipped]
+    skipped = [r for r in results if r is not None and r.skipped]
+    print(f"{len(results) - len(failed) - len(skipped)} succeeded, {len(failed)} failed, {len(skipped)} not started.")
+    for r in failed:
+        print(f"  FAILED ({r.kind}): {r.job.path}: {r.error}")
+    return len(failed)
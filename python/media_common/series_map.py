@@ -0,0 +1,167 @@
+"""
+Show folder -> TVDB series id mapping for library-wide runs.
+
+Kept as ``.tvdb-series.json`` in the TV root, keyed by show folder name:
+
+    {
+      "The Office (2005)": {"id": "73244", "name": "The Office (US)", "source": "search",
+                            "fingerprint": "9f2c...", "done_at": 1700000000.0},
+      "Doctor Who (2005)": "78804",
+      "Ambiguous Show": {"id": null, "source": "search", "candidates": [...]}
+    }
+
+A folder is resolved once, from an id in its name ('Show (2005) [tvdbid-73244]'
+or '{tvdb-73244}') or else by a TVDB search scored on title and year; a
+search that is not clearly right is stored without an id, with its
+candidates, for a person to decide. Entries can be edited by hand: a bare id
+or ``"source": "manual"`` is never re-resolved.
+
+``fingerprint`` is a digest of the show's episode listing when it was last
+processed completely. A show whose listing still matches is skipped without
+any TVDB request.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+from . import title_match
+
+
+MAP_NAME = '.tvdb-series.json'
+CONFIDENT_SCORE = 0.9
+# The best search result must beat the next one by this much to be taken without asking
+AMBIGUITY_MARGIN = 0.05
+
+_ID_HINT = re.compile(r'[\[{]\s*tvdb(?:id)?[\s:=-]*(\d+)\s*[\]}]', re.IGNORECASE)
+_YEAR = re.compile(r'\s*\((\d{4})\)\s*$')
+_QUALIFIER = re.compile(r'\s*\([^)]*\)\s*$')
+
+
+def parse_show_folder(name):
+    """'The Office (2005) [tvdbid-73244]' -> ('The Office', '2005', '73244')."""
+    hint = _ID_HINT.search(name)
+    title = _ID_HINT.sub('', name).strip()
+    year = _YEAR.search(title)
+    if year:
+        title = title[:year.start()].strip()
+    return title, year.group(1) if year else None, hint.group(1) if hint else None
+
+
+def fingerprint(listing):
+    """Digest of any JSON-able description of a show's episodes."""
+    return hashlib.sha1(json.dumps(listing, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _score(title, year, result):
+    names = [result.get('name') or ''] + list(result.get('aliases') or [])
+    # 'The Office (US)', 'Doctor Who (2005)': TVDB's disambiguation is not part of the folder title
+    names += [_QUALIFIER.sub('', n) for n in names]
+    score = max(title_match.similarity(title_match.normalize(title), title_match.normalize(n)) for n in names)
+    if year and str(result.get('year') or '') not in ('', str(year)):
+        score -= 0.2
+    return round(score, 4)
+
+
+def pick_series(title, year, results):
+    """Return (chosen result or None, [(score, result), ...] best first)."""
+    scored = sorted(((_score(title, year, r), r) for r in results if r.get('tvdb_id') or r.get('id')),
+                    key=lambda pair: -pair[0])
+    if not scored:
+        return None, scored
+    best_score, best = scored[0]
+    runner_up = scored[1][0] if len(scored) > 1 else 0.0
+    if best_score >= CONFIDENT_SCORE and best_score - runner_up >= AMBIGUITY_MARGIN:
+        return best, scored
+    return None, scored
+
+
+def _series_id(result):
+    value = str(result.get('tvdb_id') or result.get('id'))
+    # Search results sometimes carry the prefixed object id ('series-73244')
+    return value.rsplit('-', 1)[-1]
+
+
+class SeriesMap:
+    """The mapping file for one TV root."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    @classmethod
+    def for_root(cls, root, path=None):
+        return cls(path or os.path.join(os.path.abspath(root), MAP_NAME))
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        for name, entry in data.items():
+            if not isinstance(entry, dict):
+                # A bare id typed in by hand
+                entry = {'id': None if entry is None else str(entry), 'source': 'manual'}
+            elif entry.get('id') is not None:
+                entry['id'] = str(entry['id'])
+                if entry.pop('candidates', None) is not None:
+                    # Someone picked one of the candidates
+                    entry['source'] = 'manual'
+            self.entries[name] = entry
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def series_id(self, name):
+        entry = self.entries.get(name)
+        return entry.get('id') if entry else None
+
+    def resolve(self, name, tvdb, refresh=False):
+        """
+        Return the series id for show folder ``name``, searching TVDB if the
+        folder has never been resolved (or ``refresh`` is set and the entry did
+        not come from a person). None when nobody has decided yet.
+        """
+        entry = self.entries.get(name)
+        if entry is not None and (entry.get('source') == 'manual' or not refresh):
+            return entry.get('id')
+
+        title, year, hint = parse_show_folder(name)
+        self.dirty = True
+        if hint:
+            self.entries[name] = {'id': hint, 'source': 'folder'}
+            return hint
+        chosen, scored = pick_series(title, year, tvdb.search(title, year) or [])
+        if chosen is None and year:
+            # Folders often carry the year of a later season or a remake's year
+            chosen, scored = pick_series(title, None, tvdb.search(title) or [])
+        entry = {'id': _series_id(chosen) if chosen else None, 'source': 'search'}
+        if chosen:
+            entry['name'] = chosen.get('name')
+            entry['year'] = chosen.get('year')
+        else:
+            entry['candidates'] = [{'id': _series_id(r), 'name': r.get('name'), 'year': r.get('year'), 'score': score}
+                                   for score, r in scored[:5]]
+        self.entries[name] = entry
+        return entry['id']
+
+    def is_current(self, name, digest):
+        entry = self.entries.get(name)
+        return bool(entry) and entry.get('fingerprint') == digest
+
+    def mark_done(self, name, digest, when):
+        entry = self.entries.setdefault(name, {'id': None, 'source': 'manual'})
+        entry['fingerprint'] = digest
+        entry['done_at'] = when
+        self.dirty = True
@@ -0,0 +1,282 @@
+"""
+Pre-flight checks for .srt files before they are muxed.
+
+``inspect`` streams a subtitle once (twice if it turns out not to be UTF-8)
+and returns what the remux needs: the language (from the filename suffix,
+e.g. 'Movie.fr.forced.srt'), the track name (SDH / Forced / CC), the detected
+encoding and any problems found:
+
+    errors      no cues at all, malformed timing lines, a truncated last cue,
+                cues that end before they start, negative or out-of-order
+                timestamps
+    warnings    overlapping cues, cues without text
+
+A file with errors is rejected in milliseconds instead of failing ffmpeg (or
+producing a broken output) after the whole video has been copied. With
+``repair=True`` everything but an empty file is fixed in a normalised UTF-8
+copy in the temp folder; files that are only in another encoding (UTF-16,
+Windows-1252) are always normalised that way, since mov_text wants UTF-8.
+"""
+
+import codecs
+import os
+import re
+import tempfile
+from dataclasses import dataclass, field
+
+from . import trace
+
+
+DEFAULT_LANGUAGE = 'eng'
+
+_TIMING = re.compile(
+    r'^\s*(-?)(\d{1,3}):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(-?)(\d{1,3}):(\d{1,2}):(\d{1,2})[,.](\d{1,3})'
+)
+_TOKENS = re.compile(r'[\s._\-\[\]()]+')
+
+# ISO 639-1 codes and English names to the ISO 639-2/B codes ffmpeg writes into MP4
+_LANGUAGES = {
+    'en': 'eng', 'english': 'eng', 'fr': 'fre', 'fra': 'fre', 'french': 'fre', 'de': 'ger', 'deu': 'ger',
+    'german': 'ger', 'es': 'spa', 'spanish': 'spa', 'it': 'ita', 'italian': 'ita', 'pt': 'por',
+    'portuguese': 'por', 'nl': 'dut', 'nld': 'dut', 'dutch': 'dut', 'sv': 'swe', 'swedish': 'swe',
+    'da': 'dan', 'danish': 'dan', 'no': 'nor', 'nb': 'nor', 'norwegian': 'nor', 'fi': 'fin', 'finnish': 'fin',
+    'pl': 'pol', 'polish': 'pol', 'ru': 'rus', 'russian': 'rus', 'ja': 'jpn', 'japanese': 'jpn',
+    'zh': 'chi', 'zho': 'chi', 'chinese': 'chi', 'ko': 'kor', 'korean': 'kor', 'ar': 'ara', 'arabic': 'ara',
+    'he': 'heb', 'hebrew': 'heb', 'hi': 'hin', 'hindi': 'hin', 'tr': 'tur', 'turkish': 'tur', 'el': 'gre',
+    'ell': 'gre', 'greek': 'gre', 'cs': 'cze', 'ces': 'cze', 'czech': 'cze', 'hu': 'hun', 'hungarian': 'hun',
+    'ro': 'rum', 'ron': 'rum', 'romanian': 'rum', 'uk': 'ukr', 'ukrainian': 'ukr', 'vi': 'vie',
+    'vietnamese': 'vie', 'th': 'tha', 'thai': 'tha', 'id': 'ind', 'indonesian': 'ind',
+}
+_LANGUAGES.update({code: code for code in set(_LANGUAGES.values())})
+_FLAGS = ('sdh', 'forced', 'cc')
+
+
+class SubtitleError(ValueError):
+    pass
+
+
+@dataclass
+class Subtitle:
+    source: str
+    path: str
+    language: str = DEFAULT_LANGUAGE
+    track_name: str = 'Subtitle Track'
+    encoding: str = 'utf-8'
+    cues: int = 0
+    errors: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+    repaired: bool = False
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def temporary(self):
+        return self.path != self.source
+
+    def describe(self):
+        problems = '; '.join(self.errors or self.warnings)
+        return f"{os.path.basename(self.source)}: {problems}" if problems else os.path.basename(self.source)
+
+    def cleanup(self):
+        if self.temporary:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def _is_label(words):
+    # 'English', '2_English', 'French.forced': a subtitle named only after its language
+    return (any(len(w) > 3 and w in _LANGUAGES for w in words)
+            and all(w.isdigit() or w in _LANGUAGES or w in _FLAGS for w in words))
+
+
+def _suffix_tokens(name, video_base=None):
+    """The tokens of a subtitle name after the title it belongs to: 'Movie.en.sdh.srt' -> ['en', 'sdh']."""
+    stem = os.path.splitext(name)[0].lower()
+    if video_base and stem.startswith(video_base.lower()):
+        stem = stem[len(video_base):]
+    elif not _is_label([t for t in _TOKENS.split(stem) if t]):
+        # Not the video's name, so the title words are unknown: only dot suffixes can be a language
+        stem = stem.partition('.')[2]
+    return [t for t in _TOKENS.split(stem) if t]
+
+
+def subtitle_language(name, video_base=None, default=DEFAULT_LANGUAGE):
+    """'Movie.fr.forced.srt' -> 'fre': the last suffix of 'Name[.lang][.sdh|.forced|.cc].srt', else ``default``."""
+    tokens = _suffix_tokens(name, video_base)
+    # 'hi' is Hindi on its own but 'hearing impaired' after another language ('Movie.en.hi.srt')
+    while tokens and (tokens[-1] in _FLAGS or (tokens[-1] == 'hi' and len(tokens) > 1 and tokens[-2] in _LANGUAGES)):
+        tokens.pop()
+    return _LANGUAGES.get(tokens[-1], default) if tokens else default
+
+
+def track_name(name, video_base=None):
+    tokens = _suffix_tokens(name, video_base)
+    if 'sdh' in tokens or ('hi' in tokens and len(tokens) > 1):
+        return 'Subtitle Track [SDH]'
+    if 'forced' in tokens:
+        return 'Subtitle Track [Forced]'
+    if 'cc' in tokens:
+        return 'Subtitle Track [CC]'
+    return 'Subtitle Track'
+
+
+def bom_encoding(path):
+    """The encoding a byte-order mark announces, or None."""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+        return 'utf-32'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    return None
+
+
+def _ms(sign, hours, minutes, seconds, millis):
+    value = ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis.ljust(3, '0'))
+    return -value if sign else value
+
+
+_WARNINGS = ('overlap', 'blank')
+
+
+def _parse(path, encoding):
+    """Return (cues, errors, warnings); cues are (start_ms, end_ms, [lines])."""
+    cues, found = [], {}
+
+    def note(kind, message):
+        # Only the first occurrence of each problem is described, the rest are counted
+        entry = found.setdefault(kind, [message, 0])
+        entry[1] += 1
+
+    current = None
+    blank = True
+    with open(path, 'r', encoding=encoding, newline=None) as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\n').lstrip('\ufeff')
+            match = _TIMING.match(line)
+            if match:
+                if current is not None:
+                    cues.append(current)
+                current = (_ms(*match.group(1, 2, 3, 4, 5)), _ms(*match.group(6, 7, 8, 9, 10)), [], number)
+                blank = False
+            elif not line.strip():
+                blank = True
+            elif '-->' in line:
+                note('timing', f"malformed timing line {number}")
+            elif current is None or (blank and line.strip().isdigit()):
+                # Cue numbers (ignored, cues are renumbered) or text before the first cue
+                if not line.strip().isdigit():
+                    note('stray', f"text outside a cue at line {number}")
+            else:
+                current[2].append(line)
+    if current is not None:
+        cues.append(current)
+
+    previous_start = previous_end = None
+    for start, end, text, number in cues:
+        if not text and number == cues[-1][3]:
+            note('truncated', f"last cue (line {number}) has no text; truncated file?")
+        elif not text:
+            note('blank', f"cue at line {number} has no text")
+        if start < 0 or end < 0:
+            note('negative', f"negative timestamp at line {number}")
+        if end <= start:
+            note('reversed', f"cue at line {number} ends before it starts")
+        if previous_start is not None:
+            if start < previous_start:
+                note('order', f"cue at line {number} is out of order")
+            elif start < previous_end:
+                note('overlap', f"cue at line {number} overlaps the previous one")
+        previous_start, previous_end = start, end
+    if not cues:
+        found['none'] = ["no subtitle cues found", 1]
+
+    messages = {kind: message + (f" (+{count - 1} more)" if count > 1 else '') for kind, (message, count) in found.items()}
+    errors = [m for kind, m in messages.items() if kind not in _WARNINGS]
+    warnings = [m for kind, m in messages.items() if kind in _WARNINGS]
+    return [c[:3] for c in cues], errors, warnings
+
+
+def _repaired(cues):
+    """Drop empty cues, clamp negative times, sort, give every cue a duration and trim overlaps."""
+    cues = sorted((max(start, 0), max(end, 0), text) for start, end, text in cues if text)
+    fixed = []
+    for i, (start, end, text) in enumerate(cues):
+        next_start = cues[i + 1][0] if i + 1 < len(cues) else None
+        if end <= start:
+            end = start + 2000
+        if next_start is not None and next_start > start:
+            end = min(end, next_start)
+        fixed.append((start, end, text))
+    return fixed
+
+
+def _timestamp(ms):
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def write_srt(cues, path):
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for number, (start, end, text) in enumerate(cues, 1):
+            f.write(f"{number}\n{_timestamp(start)} --> {_timestamp(end)}\n" + '\n'.join(text) + '\n\n')
+
+
+def inspect(path, video_base=None, repair=False, normalize=True):
+    """
+    Check one subtitle file. ``Subtitle.path`` is the file to hand to ffmpeg:
+    the original, or a normalised temporary copy the caller removes with
+    ``cleanup()`` once the remux is done. ``normalize=False`` only checks.
+    """
+    with trace.span('srt', path) as current:
+        subtitle = _inspect(path, video_base, repair, normalize)
+        current.set(cues=subtitle.cues, encoding=subtitle.encoding, ok=subtitle.ok)
+    return subtitle
+
+
+def _inspect(path, video_base, repair, normalize):
+    name = os.path.basename(path)
+    subtitle = Subtitle(path, path, subtitle_language(name, video_base), track_name(name, video_base))
+    try:
+        bom = bom_encoding(path)
+        # Without a BOM: UTF-8 if the whole file decodes, else Windows-1252, and Latin-1 never fails
+        for encoding in [bom] if bom else ['utf-8', 'cp1252', 'latin-1']:
+            try:
+                cues, subtitle.errors, subtitle.warnings = _parse(path, encoding)
+                subtitle.encoding = encoding
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            # Only a file with a BOM gets here; Latin-1 decodes anything
+            subtitle.errors = [f"undecodable as {bom}"]
+            return subtitle
+    except (OSError, UnicodeError) as e:
+        subtitle.errors = [f"cannot read: {e}"]
+        return subtitle
+    subtitle.cues = len(cues)
+
+    fixable = cues and (subtitle.errors or subtitle.warnings)
+    if repair and fixable:
+        cues = _repaired(cues)
+        subtitle.cues = len(cues)
+        if not cues:
+            subtitle.errors = ["no subtitle cues left after repair"]
+            return subtitle
+        subtitle.warnings = [f"repaired: {m}" for m in subtitle.errors + subtitle.warnings]
+        subtitle.errors = []
+        subtitle.repaired = True
+    if normalize and subtitle.ok and (subtitle.repaired or subtitle.encoding not in ('utf-8', 'utf-8-sig')):
+        fd, temp_path = tempfile.mkstemp(prefix='subtitle-', suffix='.srt')
+        os.close(fd)
+        write_srt(cues, temp_path)
+        subtitle.path = temp_path
+    return subtitle
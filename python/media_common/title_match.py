@@ -0,0 +1,278 @@
+"""
+Fuzzy matching of file titles to episode titles.
+
+Titles are normalised first (unicode folding, case, punctuation and
+apostrophes, leading articles, 'Part 1' / 'Pt. One' / '(1)' / 'Part I', and
+trailing release tags such as '1080p WEB-DL x264'), so most near-misses become
+exact matches. Two titles with different part numbers never match, however
+alike the rest is. What is left is scored against candidates found through a
+character-trigram inverted index: only episodes sharing trigrams with a title
+are ever looked at, which keeps lookups fast for shows with thousands of
+episodes.
+
+Files are then assigned to episodes as a whole (Hungarian algorithm on each
+connected group of candidate pairs), maximising the total score, so two files
+never claim the same episode and a weak match cannot take an episode another
+file fits better.
+"""
+
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+
+
+DEFAULT_MIN_SCORE = 0.6
+CONFIDENT_SCORE = 0.9
+# Candidates scoring this far below a file's best match are not considered in the assignment
+MARGIN = 0.15
+
+_BRACKETS = re.compile(r'\[[^\]]*\]|\{[^}]*\}')
+_TRAILING_NUMBER = re.compile(r'\s*\((\d+|[ivx]+)\)\s*$')
+_APOSTROPHES = re.compile(r"['‘’ʼ`]")
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+# Release tags that say nothing but how the file was made; a run of tags only counts as one
+# when it has at least one of these, so 'Proper Etiquette' or 'Into the Web' stay titles
+_TECHNICAL_TAGS = (r'480p|576p|720p|1080p|2160p|4k|uhd|hdr|hdr10|web ?dl|webrip|bluray|blu ray|bdrip|brrip|hdtv|dvdrip|'
+                   r'x264|x265|h 264|h 265|h264|h265|hevc|avc|aac|ac3|eac3|dts|ddp?5 1')
+_TECHNICAL_TAG = re.compile(rf'^(?:{_TECHNICAL_TAGS})$')
+# A run of tags after at least one title word; whatever follows it (a release group) goes too
+_RELEASE_TAG = re.compile(rf'(?<=[0-9a-z]) ((?:(?:{_TECHNICAL_TAGS}|dv|web|proper|repack|internal|amzn|nf|hulu|dsnp|hmax)'
+                          r'(?: |$))+)')
+_TAG_WORD = re.compile(rf'{_TECHNICAL_TAGS}|\S+')
+_PART_NUMBER = re.compile(r'\bpart (\d+)\b')
+_PART = re.compile(r'\b(?:part|pt)\s+(\d+|one|two|three|four|five|six|i{1,3}|iv|v|vi)\b')
+_LEADING_ARTICLE = re.compile(r'^(?:the|a|an)\s+')
+_PART_WORDS = {'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5', 'six': '6',
+               'i': '1', 'ii': '2', 'iii': '3', 'iv': '4', 'v': '5', 'vi': '6'}
+
+
+def _strip_release_tags(text):
+    for match in _RELEASE_TAG.finditer(text):
+        if any(_TECHNICAL_TAG.match(word) for word in _TAG_WORD.findall(match.group(1))):
+            return text[:match.start()]
+    return text
+
+
+def normalize(title):
+    """Return the comparison form of a title: 'The Pilot (Part 1) 1080p' -> 'pilot part 1'."""
+    text = unicodedata.normalize('NFKD', title)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = _BRACKETS.sub(' ', text)
+    text = _TRAILING_NUMBER.sub(lambda m: f' part {m.group(1)}', text)
+    text = _APOSTROPHES.sub('', text).replace('&', ' and ')
+    text = _NON_WORD.sub(' ', text).strip()
+    text = _strip_release_tags(text)
+    text = _PART.sub(lambda m: f"part {_PART_WORDS.get(m.group(1), m.group(1))}", text)
+    text = _LEADING_ARTICLE.sub('', text)
+    if text.endswith(' the'):
+        # 'Office, The'
+        text = text[:-4]
+    return text
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def part_numbers(text):
+    """The part numbers of a normalised title: 'pilot part 2' -> {'2'}."""
+    return set(_PART_NUMBER.findall(text))
+
+
+def similarity(a, b, a_grams=None, b_grams=None):
+    """Score two normalised titles from 0 to 1."""
+    if not a or not b:
+        # A title that was all release tags or punctuation says nothing about the episode
+        return 0.0
+    a_parts, b_parts = part_numbers(a), part_numbers(b)
+    if a_parts and b_parts and a_parts != b_parts:
+        return 0.0
+    if a == b:
+        return 1.0
+    a_grams = a_grams if a_grams is not None else trigrams(a)
+    b_grams = b_grams if b_grams is not None else trigrams(b)
+    dice = 2 * len(a_grams & b_grams) / (len(a_grams) + len(b_grams))
+    return round((dice + SequenceMatcher(None, a, b, autojunk=False).ratio()) / 2, 4)
+
+
+class TitleIndex:
+    """Trigram inverted index over episode titles, keyed by episode key ('s01e01')."""
+
+    def __init__(self, titles):
+        self.titles = dict(titles)
+        self.normalized = {}
+        self._grams = {}
+        self._exact = defaultdict(list)
+        self._postings = defaultdict(list)
+        for key, title in self.titles.items():
+            norm = normalize(title)
+            self.normalized[key] = norm
+            if norm:
+                self._exact[norm].append(key)
+            grams = trigrams(norm)
+            self._grams[key] = grams
+            for gram in grams:
+                self._postings[gram].append(key)
+
+    def candidates(self, title, limit=5, min_score=DEFAULT_MIN_SCORE):
+        """Return up to ``limit`` (score, key) pairs for ``title``, best first."""
+        norm = normalize(title)
+        if not norm:
+            return []
+        exact = self._exact.get(norm)
+        if exact:
+            return [(1.0, key) for key in exact[:limit]]
+        grams = trigrams(norm)
+        # Trigrams shared by a large part of the show ('the', ' pa') say little and cost the most to count
+        common = max(32, len(self.titles) // 20)
+        rare = [gram for gram in grams if len(self._postings.get(gram, ())) <= common] or grams
+        shared = Counter()
+        for gram in rare:
+            shared.update(self._postings.get(gram, ()))
+        pool = [key for key, _ in shared.most_common(limit * 8)]
+        # Rank the pool by trigram overlap, then give only the best the (slower) full score
+        pool.sort(key=lambda key: -len(grams & self._grams[key]) / (len(grams) + len(self._grams[key])))
+        scored = []
+        for key in pool[:limit * 2]:
+            score = similarity(norm, self.normalized[key], grams, self._grams[key])
+            if score >= min_score:
+                scored.append((score, key))
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return scored[:limit]
+
+
+@dataclass
+class Match:
+    item: int
+    text: str
+    key: str
+    title: str
+    score: float
+
+
+@dataclass
+class MatchResult:
+    matches: list = field(default_factory=list)
+    unmatched: list = field(default_factory=list)
+    unused: list = field(default_factory=list)
+
+    def report(self, confident=CONFIDENT_SCORE):
+        """Human-readable lines: uncertain matches, then everything left unmatched."""
+        lines = []
+        exact = sum(1 for m in self.matches if m.score >= 1.0)
+        lines.append(f"{len(self.matches)} matched ({exact} exact), {len(self.unmatched)} unmatched file(s), "
+                     f"{len(self.unused)} episode(s) without a file.")
+        for m in sorted(self.matches, key=lambda m: m.score):
+            if m.score < 1.0:
+                flag = '' if m.score >= confident else '  <-- check'
+                lines.append(f"  {m.score:.2f}  '{m.text}' -> {m.key} '{m.title}'{flag}")
+        for text in self.unmatched:
+            lines.append(f"  unmatched file: '{text}'")
+        for key, title in self.unused:
+            lines.append(f"  no file for {key} '{title}'")
+        return lines
+
+
+def _min_cost_assignment(cost):
+    """
+    Hungarian algorithm for a rows x cols cost matrix with rows <= cols.
+    Returns the column assigned to each row.
+    """
+    n, m = len(cost), len(cost[0])
+    inf = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = p[j0], inf, 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j], way[j] = cur, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    assignment = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+def _components(edges):
+    """Group (item, key, score) edges into connected components of items and keys."""
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for item, key, _ in edges:
+        parent[find(('item', item))] = find(('key', key))
+    groups = defaultdict(list)
+    for edge in edges:
+        groups[find(('item', edge[0]))].append(edge)
+    return list(groups.values())
+
+
+def assign(texts, index, min_score=DEFAULT_MIN_SCORE, limit=5):
+    """Match each of ``texts`` to at most one episode of ``index`` and each episode to at most one text."""
+    edges = []
+    for item, text in enumerate(texts):
+        candidates = index.candidates(text, limit, min_score)
+        for score, key in candidates:
+            if score >= candidates[0][0] - MARGIN:
+                edges.append((item, key, score))
+
+    result = MatchResult()
+    assigned = {}
+    for group in _components(edges):
+        items = sorted({e[0] for e in group})
+        keys = sorted({e[1] for e in group})
+        if len(group) == 1:
+            item, key, score = group[0]
+            assigned[item] = (key, score)
+            continue
+        # Leaving a file unmatched costs 1, a non-candidate pair more, so neither is ever preferred
+        scores = {(e[0], e[1]): e[2] for e in group}
+        columns = keys + [None] * len(items)
+        cost = [[1.0 if key is None else 1.0 - scores.get((item, key), -1.0) for key in columns] for item in items]
+        for row, column in enumerate(_min_cost_assignment(cost)):
+            key = columns[column]
+            if key is not None and (items[row], key) in scores:
+                assigned[items[row]] = (key, scores[(items[row], key)])
+
+    for item, text in enumerate(texts):
+        if item in assigned:
+            key, score = assigned[item]
+            result.matches.append(Match(item, text, key, index.titles[key], score))
+        else:
+            result.unmatched.append(text)
+    used = {m.key for m in result.matches}
+    result.unused = [(key, title) for key, title in index.titles.items() if key not in used]
+    return result
@@ -0,0 +1,170 @@
+"""
+Timing and I/O spans for the media scripts.
+
+Each stage of interest (directory scan, ffprobe, ffmpeg, native tag write,
+TVDB request, artwork download, rename batch) runs inside ``span(...)``,
+which records its wall time, exit status and the bytes read and written while
+it ran, taken from ``/proc/self/io``. The kernel folds a child's counters into
+the parent's when the child is reaped, so a span around ``subprocess.run``
+includes everything ffmpeg or ffprobe read and wrote. With several jobs
+running in parallel the I/O of concurrent spans overlaps; wall times do not.
+
+Spans are written as JSON lines to the file given with ``--trace`` (or
+``$MEDIA_TRACE``), and ``--profile`` prints a per-stage table and the slowest
+files when the run ends. With neither enabled a span costs two clock reads.
+"""
+
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+_IO_FIELDS = ('rchar', 'wchar', 'read_bytes', 'write_bytes')
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.profile = False
+        self.top = 10
+        self._file = None
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._paths = {}
+
+    def configure(self, trace_path=None, profile=False, top=10):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if trace_path:
+                self._file = open(trace_path, 'a', buffering=1)
+            self.profile = profile
+            self.top = top
+            self.enabled = bool(trace_path or profile)
+
+    def record(self, entry):
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(entry, separators=(',', ':'), default=str) + '\n')
+            stage = self._stages.setdefault(entry['stage'], {'count': 0, 'seconds': 0.0, 'max': 0.0, 'errors': 0,
+                                                             'read_bytes': 0, 'write_bytes': 0})
+            stage['count'] += 1
+            stage['seconds'] += entry['seconds']
+            stage['max'] = max(stage['max'], entry['seconds'])
+            stage['errors'] += 0 if entry['ok'] else 1
+            stage['read_bytes'] += entry.get('rchar', 0)
+            stage['write_bytes'] += entry.get('wchar', 0)
+            if entry.get('path'):
+                per_path = self._paths.setdefault(entry['path'], {})
+                per_path[entry['stage']] = per_path.get(entry['stage'], 0.0) + entry['seconds']
+
+    def summary(self, out=None):
+        out = out or sys.stdout
+        with self._lock:
+            stages = dict(self._stages)
+            paths = {p: dict(s) for p, s in self._paths.items()}
+        if not stages:
+            return
+        out.write("\nTime per stage:\n")
+        out.write(f"  {'stage':<10} {'count':>6} {'total s':>9} {'mean s':>8} {'max s':>8} {'read MB':>9} {'written MB':>10} {'errors':>6}\n")
+        for name, s in sorted(stages.items(), key=lambda item: -item[1]['seconds']):
+            out.write(f"  {name:<10} {s['count']:>6} {s['seconds']:>9.2f} {s['seconds'] / s['count']:>8.3f} {s['max']:>8.2f} "
+                      f"{s['read_bytes'] / 1e6:>9.1f} {s['write_bytes'] / 1e6:>10.1f} {s['errors']:>6}\n")
+        if paths:
+            out.write(f"\nSlowest {min(self.top, len(paths))} file(s):\n")
+            ranked = sorted(paths.items(), key=lambda item: -sum(item[1].values()))[:self.top]
+            for path, per_stage in ranked:
+                detail = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in sorted(per_stage.items(), key=lambda item: -item[1]))
+                out.write(f"  {sum(per_stage.values()):>8.2f}s  {path}  ({detail})\n")
+        out.flush()
+
+
+TRACER = Tracer()
+
+
+def proc_io():
+    """This process's (and its reaped children's) I/O counters, or None off Linux."""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(': ', 1) for line in f.read().splitlines() if ': ' in line)
+    except OSError:
+        return None
+    return {field: int(counters.get(field, 0)) for field in _IO_FIELDS}
+
+
+class Span:
+    """Attributes of a running span; ``set`` adds fields to its record."""
+
+    def __init__(self, stage, path, attrs):
+        self.stage = stage
+        self.path = path
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(stage, path=None, **attrs):
+    """Time a stage. Exceptions propagate; their type and exit status are recorded."""
+    current = Span(stage, path, attrs)
+    if not TRACER.enabled:
+        yield current
+        return
+    io_before = proc_io()
+    started = time.time()
+    clock = time.monotonic()
+    ok = True
+    try:
+        yield current
+    except BaseException as e:
+        ok = False
+        current.attrs.setdefault('error', type(e).__name__)
+        if getattr(e, 'returncode', None) is not None:
+            current.attrs.setdefault('exit', e.returncode)
+        raise
+    finally:
+        entry = {'stage': stage, 'path': path, 'start': round(started, 3),
+                 'seconds': round(time.monotonic() - clock, 6), 'ok': ok, 'thread': threading.current_thread().name}
+        io_after = proc_io() if io_before is not None else None
+        if io_after is not None:
+            entry.update({field: io_after[field] - io_before[field] for field in _IO_FIELDS})
+        entry.update(current.attrs)
+        TRACER.record(entry)
+
+
+def _command_path(cmd):
+    # The file a command works on: ffmpeg's first input, otherwise the last argument
+    if '-i' in cmd[:-1]:
+        return cmd[cmd.index('-i') + 1]
+    return cmd[-1] if len(cmd) > 1 else None
+
+
+def run(cmd, stage=None, path=None, **kwargs):
+    """``subprocess.run`` inside a span named after the executable."""
+    stage = stage or os.path.basename(cmd[0])
+    with span(stage, path or _command_path(cmd)) as current:
+        result = subprocess.run(cmd, **kwargs)
+        current.set(exit=result.returncode)
+        return result
+
+
+def add_arguments(parser):
+    """The --trace/--profile options shared by the scripts."""
+    parser.add_argument('--trace', metavar='FILE', default=os.environ.get('MEDIA_TRACE'),
+                        help='Append a JSON line per timed stage to FILE (default: $MEDIA_TRACE)')
+    parser.add_argument('--profile', nargs='?', type=int, const=10, metavar='N',
+                        help='Print time per stage and the N slowest files (default 10) when the run ends')
+
+
+def configure(trace_path=None, profile=None):
+    """Enable tracing as requested on the command line; the profile prints at exit."""
+    TRACER.configure(trace_path, profile is not None, profile or 10)
+    if profile is not None:
+        atexit.register(TRACER.summary)
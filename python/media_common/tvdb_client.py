@@ -0,0 +1,278 @@
+"""
+Caching wrapper around ``tvdb_v4_official.TVDB``.
+
+Raw API responses are memoised in-process and kept on disk for ``ttl``
+seconds, and series/season payloads are indexed once so lookups no longer
+re-fetch or linearly scan:
+
+    (season type, season number) -> season id
+    (season type, season number, episode number) -> episode record
+
+A full show update therefore costs one series fetch plus one fetch per season.
+The underlying client (and its login round-trip) is only created when a
+request actually has to go to the network. With a snapshot loaded (see
+``media_common.tvdb_snapshot``) and ``offline=True`` it never is. The login
+token is kept on disk until it expires, so even a cold start that does hit
+the network skips the login request.
+
+Library-wide runs share one client across shows and can cap it with a
+request ``budget`` (``BudgetExhausted`` once spent) and a ``rate`` limit in
+requests per second; cache hits cost neither. Requests that fail on the
+network are retried with backoff (``faults.RetryPolicy``), and every request
+times out after ``REQUEST_TIMEOUT`` seconds instead of hanging a run.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+from . import faults, trace
+
+
+AIRED_ORDER = 'Aired Order'
+DEFAULT_TTL = 24 * 60 * 60
+# TVDB tokens are valid for a month; renew a day early so one never expires mid-run
+TOKEN_MARGIN = 24 * 60 * 60
+TOKEN_LIFETIME = 30 * 24 * 60 * 60
+REQUEST_TIMEOUT = 60
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'media-scripts', 'tvdb')
+
+
+class BudgetExhausted(LookupError):
+    """The run's TVDB request budget is spent; what is left waits for the next run."""
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / rate`` seconds apart across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def token_expiry(token):
+    """The 'exp' claim of a JWT, or None if it cannot be read."""
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class CachedTVDB:
+    """Drop-in for the handful of ``TVDB`` calls the scripts make, with caching and indexes."""
+
+    def __init__(self, api_key, cache_dir=None, ttl=DEFAULT_TTL, refresh=False, client_factory=None, offline=False,
+                 budget=None, rate=None, retry=None):
+        self.api_key = api_key
+        self.retry = retry or faults.RetryPolicy()
+        self.offline = offline
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.ttl = ttl
+        self.refresh = refresh
+        self._client_factory = client_factory
+        self._client = None
+        self._memo = {}
+        self._season_index = {}
+        self._episode_index = {}
+        self._lock = threading.RLock()
+        self.network_calls = 0
+        self.budget = budget
+        self.exhausted = False
+        self._limiter = RateLimiter(rate) if rate else None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                if self.offline:
+                    raise LookupError("TVDB data not available offline; export a fresher snapshot")
+                if self._client_factory is not None:
+                    self._client = self._client_factory(self.api_key)
+                else:
+                    self._client = self._login()
+            return self._client
+
+    def _token_path(self):
+        # One token per API key; the key itself is not written to disk
+        digest = hashlib.sha256(self.api_key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"token-{digest}.json")
+
+    def _login(self):
+        import tvdb_v4_official
+
+        # tvdb_v4_official calls urlopen without a timeout; a dropped connection would block forever
+        if socket.getdefaulttimeout() is None:
+            socket.setdefaulttimeout(REQUEST_TIMEOUT)
+
+        # Built the way TVDB() builds itself, so the login can be skipped and the
+        # API base URL pointed elsewhere ($TVDB_API_URL, e.g. a local test server)
+        url = tvdb_v4_official.Url()
+        url.base_url = os.environ.get('TVDB_API_URL') or url.base_url
+        token_path = self._token_path()
+        token = None
+        try:
+            with open(token_path, 'r') as f:
+                entry = json.load(f)
+            if entry['expires_at'] - TOKEN_MARGIN > time.time() and entry.get('base_url', url.base_url) == url.base_url:
+                token = entry['token']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if token is None:
+            with trace.span('tvdb', kind='login'):
+                token = tvdb_v4_official.Auth(url.construct('login'), self.api_key).get_token()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{token_path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'token': token, 'base_url': url.base_url,
+                           'expires_at': token_expiry(token) or time.time() + TOKEN_LIFETIME}, f)
+            os.replace(tmp_path, token_path)
+
+        client = tvdb_v4_official.TVDB.__new__(tvdb_v4_official.TVDB)
+        client.url = url
+        client.request = tvdb_v4_official.Request(token)
+        return client
+
+    def _forget_token(self):
+        with self._lock:
+            self._client = None
+            try:
+                os.remove(self._token_path())
+            except OSError:
+                pass
+
+    def load_snapshot(self, snapshot):
+        """Seed the in-process cache from a snapshot dict so its series needs no requests."""
+        with self._lock:
+            self._memo[('series', str(snapshot['series']['id']))] = snapshot['series']
+            for season_id, season in snapshot['seasons'].items():
+                self._memo[('season', str(season_id))] = season
+
+    def _cache_path(self, kind, key):
+        return os.path.join(self.cache_dir, f"{kind}-{key}.json")
+
+    def _read_disk(self, kind, key):
+        if self.refresh or not self.ttl:
+            return None
+        path = self._cache_path(kind, key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('fetched_at', 0) > self.ttl:
+            return None
+        return entry.get('data')
+
+    def _write_disk(self, kind, key, data):
+        if not self.ttl:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(kind, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'fetched_at': time.time(), 'data': data}, f)
+        os.replace(tmp_path, path)
+
+    def _fetch(self, kind, key, call):
+        memo_key = (kind, str(key))
+        with self._lock:
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+        data = self._read_disk(kind, key)
+        if data is None:
+            if not self.offline:
+                self._spend()
+            with trace.span('tvdb', kind=kind, key=str(key)):
+                label = f"TVDB {kind} {key}"
+                try:
+                    data = self.retry.call(call, label=label)
+                except ValueError as e:
+                    # A cached token that TVDB revoked early: log in again once
+                    if self._client_factory is not None or 'unauthorized' not in str(e).lower():
+                        raise
+                    self._forget_token()
+                    data = self.retry.call(call, label=label)
+            self._write_disk(kind, key, data)
+        with self._lock:
+            self._memo[memo_key] = data
+        return data
+
+    def _spend(self):
+        """Take one request from the budget and wait for the rate limiter."""
+        with self._lock:
+            if self.budget is not None and self.network_calls >= self.budget:
+                self.exhausted = True
+                raise BudgetExhausted(f"TVDB request budget of {self.budget} used up")
+            # Counted up front so concurrent fetches cannot overrun the budget together
+            self.network_calls += 1
+        if self._limiter is not None:
+            self._limiter.wait()
+
+    def get_series_extended(self, series_id):
+        return self._fetch('series', series_id, lambda: self.client.get_series_extended(series_id))
+
+    def get_season_extended(self, season_id):
+        return self._fetch('season', season_id, lambda: self.client.get_season_extended(season_id))
+
+    def search(self, query, year=None):
+        """TVDB series search results for ``query`` (dicts with 'tvdb_id', 'name', 'year', ...)."""
+        key = hashlib.sha256(f"{query}\n{year or ''}".encode('utf-8')).hexdigest()[:16]
+        options = {'type': 'series'}
+        if year:
+            options['year'] = year
+        return self._fetch('search', key, lambda: self.client.search(query, **options))
+
+    def season_index(self, series_id):
+        """Return {(season type name, season number): season record} for a series."""
+        series_id = str(series_id)
+        with self._lock:
+            if series_id in self._season_index:
+                return self._season_index[series_id]
+        index = {}
+        for season in self.get_series_extended(series_id).get("seasons", []):
+            index[(season["type"]["name"], int(season["number"]))] = season
+        with self._lock:
+            self._season_index[series_id] = index
+        return index
+
+    def get_season_info(self, series_id, season, season_type=AIRED_ORDER):
+        return self.season_index(series_id).get((season_type, int(season)))
+
+    def episode_index(self, series_id, season, season_type=AIRED_ORDER):
+        """Return {episode number: episode record} for one season of a series."""
+        key = (str(series_id), season_type, int(season))
+        with self._lock:
+            if key in self._episode_index:
+                return self._episode_index[key]
+        season_info = self.get_season_info(series_id, season, season_type)
+        index = {}
+        if season_info is not None:
+            for ep in self.get_season_extended(season_info["id"]).get("episodes", []):
+                index[int(ep["number"])] = ep
+        with self._lock:
+            self._episode_index[key] = index
+        return index
+
+    def get_episode(self, series_id, season, episode, season_type=AIRED_ORDER):
+        return self.episode_index(series_id, season, season_type).get(int(episode))
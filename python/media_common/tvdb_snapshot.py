@@ -0,0 +1,177 @@
+"""
+Offline TVDB snapshots.
+
+A snapshot is a compact JSON file holding everything the scripts use from
+TVDB for one series: the series record (ratings, genres, network, cast) and
+every season in every order (aired, DVD, absolute, ...) with episode numbers,
+titles and air dates. It is loaded by the rename tools in place of
+hand-maintained ``episode-names.txt`` files and by ``CachedTVDB`` so metadata
+runs need no network at all.
+
+Usage:
+    python -m media_common.tvdb_snapshot export <series_id> <api_key> -o show.tvdb.json
+    python -m media_common.tvdb_snapshot names show.tvdb.json [--order dvd] [-o episode-names.txt]
+    python -m media_common.tvdb_snapshot names show.tvdb.json --season-folders "/tv/Show"
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+
+SNAPSHOT_FORMAT = 1
+
+# CLI-friendly names for TVDB season types (season["type"]["type"])
+ORDER_ALIASES = {
+    'aired': 'official',
+    'official': 'official',
+    'dvd': 'dvd',
+    'absolute': 'absolute',
+    'alternate': 'alternate',
+    'regional': 'regional',
+}
+
+SERIES_KEYS = ('id', 'name', 'year', 'firstAired', 'overview', 'contentRatings', 'genres', 'originalNetwork', 'characters')
+SEASON_KEYS = ('id', 'number', 'type', 'aired', 'image', 'overview')
+EPISODE_KEYS = ('id', 'number', 'seasonNumber', 'absoluteNumber', 'name', 'aired', 'overview')
+
+
+def _pick(record, keys):
+    return {k: record[k] for k in keys if record.get(k) is not None}
+
+
+def _trim_characters(characters):
+    # Only the cast names are used; the full character records dominate the payload size
+    return [{'personName': c.get('personName')} for c in characters or [] if c.get('personName')]
+
+
+def build_snapshot(tvdb, series_id):
+    """Fetch a series and all of its seasons through ``tvdb`` and return a snapshot dict."""
+    series = tvdb.get_series_extended(series_id)
+    trimmed_series = _pick(series, SERIES_KEYS)
+    trimmed_series['characters'] = _trim_characters(series.get('characters'))
+    trimmed_series['seasons'] = [_pick(s, ('id', 'number', 'type')) for s in series.get('seasons', [])]
+
+    seasons = {}
+    for season_info in series.get('seasons', []):
+        season = tvdb.get_season_extended(season_info['id'])
+        trimmed = _pick(season, SEASON_KEYS)
+        trimmed.setdefault('type', season_info.get('type'))
+        trimmed.setdefault('number', season_info.get('number'))
+        trimmed['episodes'] = [_pick(ep, EPISODE_KEYS) for ep in season.get('episodes', [])]
+        seasons[str(season_info['id'])] = trimmed
+
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'series': trimmed_series,
+        'seasons': seasons,
+    }
+
+
+def save_snapshot(snapshot, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    with open(path, 'r') as f:
+        snapshot = json.load(f)
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path}: unsupported snapshot format {snapshot.get('format')!r}")
+    return snapshot
+
+
+def resolve_order(order):
+    try:
+        return ORDER_ALIASES[order.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown season order '{order}'. Use one of: {', '.join(sorted(ORDER_ALIASES))}")
+
+
+def iter_episodes(snapshot, order='aired'):
+    """Yield (season number, episode number, title) for one season order, sorted."""
+    season_type = resolve_order(order)
+    rows = []
+    for season in snapshot['seasons'].values():
+        if (season.get('type') or {}).get('type') != season_type:
+            continue
+        for ep in season.get('episodes', []):
+            if ep.get('name'):
+                rows.append((int(season['number']), int(ep['number']), ep['name']))
+    return sorted(rows)
+
+
+def episode_key(season, episode):
+    return f"S{season:02d}E{episode:02d}"
+
+
+def episode_titles(snapshot, order='aired'):
+    """Map lowercased 'sXXeYY' keys to titles, like rename-episode-files.py reads them."""
+    return {episode_key(s, e).lower(): title for s, e, title in iter_episodes(snapshot, order)}
+
+
+def episode_names_lines(snapshot, order='aired', season=None):
+    return [
+        f"{episode_key(s, e)} {title}"
+        for s, e, title in iter_episodes(snapshot, order)
+        if season is None or s == season
+    ]
+
+
+def write_episode_names(snapshot, path, order='aired', season=None):
+    with open(path, 'w') as f:
+        for line in episode_names_lines(snapshot, order, season):
+            f.write(line + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export TVDB series snapshots and generate episode-names.txt from them.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help='Fetch a series from TVDB and save it as a snapshot')
+    export.add_argument('series_id', help='TVDB series id')
+    export.add_argument('api_key', help='TVDB API key')
+    export.add_argument('-o', '--output', help='Snapshot file (default: <series_id>.tvdb.json)')
+
+    names = sub.add_parser('names', help='Write episode-names.txt from a snapshot')
+    names.add_argument('snapshot', help='Snapshot file')
+    names.add_argument('--order', default='aired', help='Season order: aired, dvd, absolute, alternate or regional (default: aired)')
+    group = names.add_mutually_exclusive_group()
+    group.add_argument('-o', '--output', help='Write all seasons to this file (default: stdout)')
+    group.add_argument('--season-folders', metavar='SHOW_FOLDER', help="Write one episode-names.txt into each 'Season NN' folder")
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        from media_common.tvdb_client import CachedTVDB
+        tvdb = CachedTVDB(args.api_key)
+        snapshot = build_snapshot(tvdb, args.series_id)
+        output = args.output or f"{args.series_id}.tvdb.json"
+        save_snapshot(snapshot, output)
+        print(f"Saved {len(snapshot['seasons'])} season(s) of '{snapshot['series'].get('name')}' to {output} ({tvdb.network_calls} TVDB request(s)).")
+        return 0
+
+    snapshot = load_snapshot(args.snapshot)
+    if args.season_folders:
+        for entry in sorted(os.listdir(args.season_folders)):
+            folder = os.path.join(args.season_folders, entry)
+            parts = entry.split(' ')
+            if os.path.isdir(folder) and len(parts) == 2 and parts[0].lower() == 'season' and parts[1].isdigit():
+                path = os.path.join(folder, 'episode-names.txt')
+                write_episode_names(snapshot, path, args.order, int(parts[1]))
+                print(f"Wrote {path}")
+    elif args.output:
+        write_episode_names(snapshot, args.output, args.order)
+        print(f"Wrote {args.output}")
+    else:
+        for line in episode_names_lines(snapshot, args.order):
+            print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
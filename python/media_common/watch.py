@@ -0,0 +1,338 @@
+"""
+Watch a library and hand newly landed episodes to a worker as they settle.
+
+Events come from inotify (through ``ctypes``, no extra dependency); where
+inotify is not available the library index is polled instead, which is a
+``stat`` per directory per interval.
+
+A file is considered complete once no event arrived for ``settle`` seconds
+and its size did not change between two checks, so a download that is still
+growing, or an SMB copy that closes and reopens the file, is not picked up
+half-way. Subtitle sidecars are coalesced with their video: 'Ep.mp4',
+'Ep.srt' and 'Ep.en.forced.srt' landing together become one job, and a
+sidecar never runs ahead of a video that is still being written.
+
+Ready jobs go through a bounded queue to ``workers`` threads. When the queue
+is full the watcher blocks, and new events wait in the kernel queue; if that
+overflows the whole tree is rescanned through the index.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+
+from . import library
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# IN_MODIFY keeps pushing the settle deadline back while a file is still being written
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+_EVENT = struct.Struct('iIII')
+
+DEFAULT_SETTLE = 10.0
+DEFAULT_QUEUE_SIZE = 16
+
+
+class Inotify:
+    """Minimal inotify wrapper: one descriptor, any number of directory watches."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify is not available on this system')
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watches = {}
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self.watches[wd] = path
+
+    def read(self, timeout):
+        """Return a list of (mask, path) events, waiting at most ``timeout`` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if mask & IN_Q_OVERFLOW or directory is None:
+                events.append((mask, None))
+            else:
+                events.append((mask, os.path.join(directory, os.fsdecode(name)) if name else directory))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Fallback event source: refreshes the library index and reports new names."""
+
+    def __init__(self, index, interval=30.0):
+        self.index = index
+        self.interval = interval
+        self._known = self._names()
+
+    def _names(self):
+        return {(path, name) for path, folder in self.index.folders.items() for name in folder.files}
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        pass
+
+    def read(self, timeout):
+        time.sleep(max(timeout, self.interval))
+        self.index.refresh()
+        names = self._names()
+        new = names - self._known
+        self._known = names
+        return [(IN_CREATE, os.path.join(path, name)) for path, name in sorted(new)]
+
+    def close(self):
+        pass
+
+
+@dataclass
+class WatchJob:
+    """A settled video and the subtitle sidecars that belong to it."""
+    folder: str
+    video: str
+    subtitles: list = field(default_factory=list)
+
+    @property
+    def path(self):
+        return os.path.join(self.folder, self.video)
+
+
+class Watcher:
+    """
+    Feed settled videos under ``root`` to ``handler(job)``.
+
+    ``ignore(name)`` filters out files the handler itself writes (for example
+    '*.output.mp4'); hidden files such as temporaries and manifests are always
+    ignored. A job whose files are unchanged since the handler last ran on them
+    is dropped, so in-place edits made by the handler do not trigger it again.
+    """
+
+    def __init__(self, root, handler, settle=DEFAULT_SETTLE, workers=1, queue_size=DEFAULT_QUEUE_SIZE,
+                 ignore=None, poll_interval=None):
+        self.root = os.path.abspath(root)
+        self.handler = handler
+        self.settle = settle
+        self.workers = workers
+        self.ignore = ignore or (lambda name: False)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.index = library.index_for(self.root)
+        self._pending = {}
+        self._done = {}
+        self._done_lock = threading.Lock()
+        self._stopping = threading.Event()
+        if poll_interval is None:
+            try:
+                self.source = Inotify()
+            except OSError:
+                self.source = PollingSource(self.index)
+        else:
+            self.source = PollingSource(self.index, poll_interval)
+        self.handled = 0
+        self.failed = 0
+
+    def _wanted(self, name):
+        if name.startswith('.') or library.is_junk(name) or self.ignore(name):
+            return False
+        return library.is_video(name) or library.is_subtitle(name)
+
+    def _watch_tree(self, path, mark_files=False):
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = [d for d in dirnames if not library.is_junk(d) and not d.startswith('.')]
+            try:
+                self.source.add_watch(dirpath)
+            except OSError as e:
+                print(f"Cannot watch {dirpath}: {e}")
+            if mark_files:
+                for name in filenames:
+                    self._touch(os.path.join(dirpath, name))
+
+    def _touch(self, path):
+        if not self._wanted(os.path.basename(path)):
+            return
+        state = self._pending.get(path)
+        if state is None:
+            self._pending[path] = [time.monotonic(), None]
+        else:
+            # Any further write restarts the settle timer
+            state[0] = time.monotonic()
+
+    def _handle_event(self, mask, path):
+        if path is None:
+            # The kernel dropped events; fall back to a rescan of the whole tree
+            print("Event queue overflowed, rescanning the library.")
+            self._watch_tree(self.root, mark_files=True)
+            return
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # A whole season folder moved in: watch it and pick up what is already inside
+                self._watch_tree(path, mark_files=True)
+            return
+        if mask & IN_DELETE_SELF:
+            return
+        self._touch(path)
+
+    def _settled(self, now):
+        """Return the pending paths that stopped changing, dropping ones that vanished."""
+        settled = []
+        for path, state in list(self._pending.items()):
+            last_event, last_size = state
+            if now - last_event < self.settle:
+                continue
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                del self._pending[path]
+                continue
+            if size == last_size:
+                settled.append(path)
+            else:
+                state[0], state[1] = now, size
+        return settled
+
+    def _jobs_for(self, paths):
+        """Group settled paths by folder and coalesce sidecars with their video."""
+        by_folder = {}
+        for path in paths:
+            by_folder.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+
+        jobs = []
+        for folder_path, names in by_folder.items():
+            self.index.refresh(folder_path)
+            for name in names:
+                self._pending.pop(os.path.join(folder_path, name), None)
+            folder = self.index.folder(folder_path)
+            if folder is None:
+                continue
+            for video in folder.videos():
+                if self.ignore(video):
+                    continue
+                sidecars = folder.sidecars(video)
+                if not names & ({video} | set(sidecars)):
+                    continue
+                if os.path.join(folder_path, video) in self._pending:
+                    # The video itself is still being written; it brings its sidecars along once it settles
+                    continue
+                jobs.append(WatchJob(folder_path, video, sidecars))
+        return jobs
+
+    def _identity(self, job):
+        identity = []
+        for name in [job.video] + job.subtitles:
+            try:
+                st = os.stat(os.path.join(job.folder, name))
+            except OSError:
+                return None
+            identity.append((name, st.st_size, st.st_mtime_ns))
+        return tuple(identity)
+
+    def _unchanged(self, job):
+        with self._done_lock:
+            return self._done.get(job.path) == self._identity(job)
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            try:
+                if not self._unchanged(job):
+                    self.handler(job)
+                    with self._done_lock:
+                        self.handled += 1
+                        self._done[job.path] = self._identity(job)
+            except Exception as e:
+                with self._done_lock:
+                    self.failed += 1
+                print(f"FAILED: {job.path}: {e}")
+                stderr = getattr(e, 'stderr', None)
+                if stderr:
+                    print('\n'.join(stderr.strip().splitlines()[-5:]))
+            finally:
+                self.queue.task_done()
+
+    def run(self, stop_after=None):
+        """
+        Watch until interrupted (or for ``stop_after`` seconds). Returns the
+        number of jobs that failed.
+        """
+        self._watch_tree(self.root)
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        kind = 'inotify' if isinstance(self.source, Inotify) else 'polling'
+        print(f"Watching {self.root} ({kind}, settle {self.settle:g}s). Press Ctrl+C to stop.")
+        started = time.monotonic()
+        try:
+            while not self._stopping.is_set():
+                if stop_after is not None and time.monotonic() - started >= stop_after:
+                    break
+                for mask, path in self.source.read(min(1.0, self.settle)):
+                    self._handle_event(mask, path)
+                for job in self._jobs_for(self._settled(time.monotonic())):
+                    if not self._unchanged(job):
+                        # Blocks while the workers are busy; that is the backpressure
+                        self.queue.put(job)
+        except KeyboardInterrupt:
+            print("Stopping, waiting for running jobs to finish.")
+        finally:
+            for _ in threads:
+                self.queue.put(None)
+            for thread in threads:
+                thread.join()
+            self.source.close()
+        return self.failed
+
+    def stop(self):
+        self._stopping.set()
+
+
+def add_arguments(parser):
+    """The --watch options shared by the processing scripts."""
+    parser.add_argument('--watch', action='store_true', help='Keep running and process new files as they finish landing')
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE,
+                        help=f'Seconds a file must stay unchanged before it is processed in watch mode (default: {DEFAULT_SETTLE:g})')
+    parser.add_argument('--poll', type=float, metavar='SECONDS',
+                        help='Poll the folder every SECONDS instead of using inotify (e.g. for network mounts)')
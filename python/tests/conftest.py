@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scripts import media_common from the python/ folder the same way
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
@@ -0,0 +1,50 @@
+import time
+
+from media_common.artwork import DEFAULT_MAX_AGE, ArtworkStore
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+
+class FakeSession:
+    def __init__(self):
+        self.body = b'poster v1'
+        self.requests = []
+
+    def get(self, url, stream=False, timeout=None):
+        self.requests.append(url)
+        return FakeResponse(self.body)
+
+
+def test_artwork_expires_by_default(tmp_path):
+    session = FakeSession()
+    store = ArtworkStore(store_dir=str(tmp_path), session=session)
+    assert store.max_age == DEFAULT_MAX_AGE
+    url = 'https://artworks.example/season.jpg'
+    path = store.get(url)
+    assert store.get(url) == path and len(session.requests) == 1
+
+    # The same URL now serves a new image; a store reopened later sees it once the entry is too old
+    session.body = b'poster v2'
+    store = ArtworkStore(store_dir=str(tmp_path), session=session)
+    assert store.read(url) == b'poster v1'
+    store._index[url]['fetched_at'] = time.time() - DEFAULT_MAX_AGE - 1
+    assert store.read(url) == b'poster v2' and len(session.requests) == 2
+
+    forever = ArtworkStore(store_dir=str(tmp_path), session=session, max_age=None)
+    forever._index[url]['fetched_at'] = 0
+    assert forever.read(url) == b'poster v2' and len(session.requests) == 2
@@ -0,0 +1,33 @@
+import os
+import stat
+import subprocess
+
+import pytest
+
+from media_common import audit, faults, probe
+
+
+@pytest.fixture
+def hanging_ffprobe(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    ffprobe = bin_dir / 'ffprobe'
+    ffprobe.write_text('#!/bin/sh\nexec sleep 30\n')
+    ffprobe.chmod(ffprobe.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(faults, 'PROBE_TIMEOUT', 0.2)
+
+
+def test_hung_probe_becomes_an_error_row(tmp_path, hanging_ffprobe):
+    video = tmp_path / 'Movie.mp4'
+    video.write_bytes(b'x')
+    row, data = audit._probe_row((str(video), 'movie', [], []))
+    assert data is None
+    assert 'timed out' in row['error'] and row['needs_merge'] is False
+
+
+def test_probe_file_times_out(tmp_path, hanging_ffprobe):
+    video = tmp_path / 'Movie.mp4'
+    video.write_bytes(b'x')
+    with pytest.raises(subprocess.TimeoutExpired):
+        probe.probe_file(str(video))
@@ -0,0 +1,126 @@
+import argparse
+import errno
+import subprocess
+
+import pytest
+
+from media_common import faults
+
+
+def test_classify():
+    assert faults.classify(subprocess.TimeoutExpired('ffmpeg', 1)) == 'timeout'
+    assert faults.classify(subprocess.CalledProcessError(1, 'ffmpeg')) == 'failed'
+    assert faults.classify(ConnectionResetError()) == 'network'
+    assert faults.classify(OSError(errno.ESTALE, 'stale')) == 'io'
+    assert faults.classify(OSError(errno.ENOSPC, 'full')) == 'failed'
+
+
+def test_retry_gives_up_on_deterministic_errors():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OSError(errno.EIO, 'flaky')
+        return 'ok'
+
+    policy = faults.RetryPolicy(attempts=3, base_delay=0)
+    assert policy.call(flaky) == 'ok' and len(calls) == 3
+
+    def broken():
+        calls.append(1)
+        raise subprocess.CalledProcessError(1, 'ffmpeg')
+
+    del calls[:]
+    try:
+        policy.call(broken)
+    except subprocess.CalledProcessError as e:
+        assert e.attempts == 1
+    assert len(calls) == 1
+
+
+def test_quarantine_keeps_operations_apart(tmp_path):
+    video = tmp_path / 'Ep.mp4'
+    video.write_bytes(b'x')
+    quarantine = faults.Quarantine(str(tmp_path))
+    quarantine.add(str(video), subprocess.CalledProcessError(1, 'ffmpeg'), 'tag_metadata')
+    quarantine.save()
+
+    merge = faults.Quarantine(str(tmp_path))
+    assert not merge.holds(str(video), 'merge_subtitles')
+    assert merge.paths('merge_subtitles') == set()
+    assert not merge.clear(str(video), 'merge_subtitles')
+    merge.save()
+
+    tag = faults.Quarantine(str(tmp_path))
+    assert tag.holds(str(video), 'tag_metadata')
+    assert faults.load_failures(tag.path, 'tag_metadata') == {str(video)}
+
+    video.write_bytes(b'changed')
+    assert not tag.holds(str(video), 'tag_metadata')
+
+
+def test_save_keeps_the_other_scripts_failures(tmp_path):
+    a, b = tmp_path / 'a.mp4', tmp_path / 'b.mp4'
+    a.write_bytes(b'a')
+    b.write_bytes(b'b')
+    merge = faults.Quarantine(str(tmp_path))
+    tag = faults.Quarantine(str(tmp_path))
+    merge.add(str(a), subprocess.CalledProcessError(1, 'ffmpeg'), 'merge_subtitles')
+    merge.save()
+    tag.add(str(b), subprocess.CalledProcessError(1, 'ffmpeg'), 'tag_metadata')
+    tag.save()
+    reloaded = faults.Quarantine(str(tmp_path))
+    assert reloaded.paths('merge_subtitles') == {str(a)}
+    assert reloaded.paths('tag_metadata') == {str(b)}
+
+
+def test_retry_failed_does_not_take_the_next_argument():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode')
+    parser.add_argument('folder_path')
+    faults.add_arguments(parser)
+    args = parser.parse_args(['--retry-failed', 'tv', '/show'])
+    assert args.retry_failed and args.mode == 'tv' and args.folder_path == '/show' and args.failure_report is None
+    args = parser.parse_args(['tv', '/show', '--retry-failed', '--failure-report', '/tmp/report.json'])
+    assert args.failure_report == '/tmp/report.json'
+
+
+def test_quarantined_call_records_and_clears(tmp_path):
+    video = tmp_path / 'Ep.mp4'
+    video.write_bytes(b'x')
+    quarantine = faults.Quarantine(str(tmp_path))
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError(errno.EIO, 'I/O error')
+        raise subprocess.CalledProcessError(1, ['ffmpeg'])
+    policy = faults.RetryPolicy(attempts=3, base_delay=0)
+    with pytest.raises(subprocess.CalledProcessError):
+        faults.quarantined_call(policy, quarantine, 'merge_subtitles', str(video), flaky)
+    assert len(calls) == 2
+    assert faults.Quarantine(str(tmp_path)).holds(str(video), 'merge_subtitles')
+
+    assert faults.quarantined_call(policy, quarantine, 'merge_subtitles', str(video), lambda: 'done') == 'done'
+    assert faults.Quarantine(str(tmp_path)).paths('merge_subtitles') == set()
+
+
+def test_failed_paths_reads_every_show(tmp_path):
+    videos = []
+    for show in ('Show A', 'Show B'):
+        (tmp_path / show).mkdir()
+        video = tmp_path / show / 'Ep.mp4'
+        video.write_bytes(b'x')
+        videos.append(str(video))
+        quarantine = faults.Quarantine(str(tmp_path / show))
+        quarantine.add(str(video), ValueError('bad'), 'tag_metadata')
+        quarantine.save()
+    # A single-show run and merge_subtitles open the same file --library wrote
+    shows = [faults.Quarantine(str(tmp_path / show)) for show in ('Show A', 'Show B')]
+    assert faults.failed_paths(shows, 'tag_metadata') == set(videos)
+    assert faults.failed_paths(shows[:1], 'tag_metadata') == {videos[0]}
+    assert faults.failed_paths(shows, 'merge_subtitles') == set()
+    report = str(tmp_path / 'Show B' / faults.QUARANTINE_NAME)
+    assert faults.failed_paths([], 'tag_metadata', report) == {videos[1]}
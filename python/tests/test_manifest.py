@@ -0,0 +1,96 @@
+import os
+
+from media_common.manifest import Manifest
+
+
+def _write(path, data, mtime_ns=None):
+    with open(path, 'wb') as f:
+        f.write(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_hit_and_miss_after_size_or_mtime_change(tmp_path):
+    source, target = str(tmp_path / 'a.mp4'), str(tmp_path / 'a_updated.mp4')
+    _write(source, b'video', 10**18)
+    _write(target, b'tagged', 10**18)
+    manifest = Manifest(str(tmp_path))
+    manifest.record('tag', source, [source], {'remux': False}, target)
+    assert manifest.is_done('tag', source, [source], {'remux': False}, target)
+    # A fresh instance reads the same answer back from disk
+    assert Manifest(str(tmp_path)).is_done('tag', source, [source], {'remux': False}, target)
+
+    _write(source, b'video', 10**18 + 1)
+    assert not manifest.is_done('tag', source, [source], {'remux': False}, target)
+    _write(source, b'video!', 10**18)
+    assert not manifest.is_done('tag', source, [source], {'remux': False}, target)
+
+    _write(source, b'video', 10**18)
+    assert manifest.is_done('tag', source, [source], {'remux': False}, target)
+    _write(target, b'tagged', 10**18 + 1)
+    assert not manifest.is_done('tag', source, [source], {'remux': False}, target)
+    os.remove(target)
+    assert not manifest.is_done('tag', source, [source], {'remux': False}, target)
+
+
+def test_hash_ignores_a_touched_file(tmp_path):
+    source, target = str(tmp_path / 'a.mp4'), str(tmp_path / 'a_updated.mp4')
+    _write(source, b'video', 10**18)
+    _write(target, b'tagged')
+    manifest = Manifest(str(tmp_path), use_hash=True)
+    manifest.record('tag', source, [source], {}, target)
+    _write(source, b'video', 10**18 + 1)
+    assert manifest.is_done('tag', source, [source], {}, target)
+    _write(source, b'vidEo', 10**18)
+    assert not manifest.is_done('tag', source, [source], {}, target)
+
+
+def test_params_change_is_a_miss(tmp_path):
+    source = str(tmp_path / 'a.mp4')
+    _write(source, b'video')
+    manifest = Manifest(str(tmp_path))
+    manifest.record('tag', source, [source], {'remux': False, 'tags': ['b', 'a']})
+    assert manifest.is_done('tag', source, [source], {'tags': ['b', 'a'], 'remux': False})
+    assert not manifest.is_done('tag', source, [source], {'remux': True, 'tags': ['b', 'a']})
+    assert not manifest.is_done('tag', source, [source], {'remux': False, 'tags': ['a', 'b']})
+    assert not manifest.is_done('merge', source, [source], {'remux': False, 'tags': ['b', 'a']})
+
+
+def test_in_place_operation(tmp_path):
+    video, subtitle = str(tmp_path / 'a.mkv'), str(tmp_path / 'a.srt')
+    _write(video, b'video', 10**18)
+    _write(subtitle, b'1\n00:00:01,000 --> 00:00:02,000\nhi\n', 10**18)
+    manifest = Manifest(str(tmp_path))
+    inputs = manifest.snapshot_inputs([video, subtitle])
+    # The operation rewrites its input; the record keeps the identity from after it finished
+    _write(video, b'video+subs', 10**18 + 5)
+    manifest.record('merge', video, [video, subtitle], {}, input_identities=inputs)
+    assert manifest.is_done('merge', video, [video, subtitle], {})
+
+    _write(subtitle, b'1\n00:00:01,000 --> 00:00:02,000\nbye\n', 10**18 + 6)
+    assert not manifest.is_done('merge', video, [video, subtitle], {})
+    _write(subtitle, b'1\n00:00:01,000 --> 00:00:02,000\nhi\n', 10**18)
+    assert manifest.is_done('merge', video, [video, subtitle], {})
+    # Someone replaced the video after the merge
+    _write(video, b'other video', 10**18 + 5)
+    assert not manifest.is_done('merge', video, [video, subtitle], {})
+
+
+def test_compaction_keeps_the_latest_record(tmp_path):
+    paths = [str(tmp_path / f'{n}.mp4') for n in range(3)]
+    for path in paths:
+        _write(path, b'video')
+    manifest = Manifest(str(tmp_path))
+    for n in range(150):
+        for path in paths:
+            manifest.record('tag', path, [path], {'run': n})
+    with open(manifest.path, 'a') as f:
+        f.write('{"op": "tag", "pa')
+
+    reloaded = Manifest(str(tmp_path))
+    with open(reloaded.path) as f:
+        assert len(f.readlines()) == len(paths)
+    for path in paths:
+        assert reloaded.is_done('tag', path, [path], {'run': 149})
+        assert not reloaded.is_done('tag', path, [path], {'run': 148})
+    assert not os.path.exists(reloaded.path + '.tmp')
@@ -0,0 +1,140 @@
+import os
+import shutil
+import struct
+import subprocess
+import sys
+
+import pytest
+
+from media_common import mp4tags
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'benchmark'))
+from synth_library import minimal_mp4  # noqa: E402
+
+
+# Made with ffmpeg 7.0: one second of lavfi color + sine as mpeg4/aac (episode.mp4), the same remuxed
+# with -movflags +faststart (episode-faststart.mp4), and one 32x32 frame as cover.jpg
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+PAYLOAD = bytes(range(256)) * 16
+TAGS = {'title': 'Pilot', 'genre': 'Drama', 'episode_sort': 1, 'cast': 'A, B', 'content_rating': 'TV-14'}
+
+
+def _boxes(data):
+    """Split bytes into [(type, raw)] at the top level."""
+    return [(t, data[o:o + s]) for t, o, _, s in mp4tags._iter_boxes(data, 0, len(data))]
+
+
+def _synthetic(tmp_path, order, mdat_size_zero=False):
+    """Write an MP4 with its top-level boxes in ``order`` ('ftyp', 'moov', 'mdat', 'free')."""
+    parts = {box_type.decode(): raw for box_type, raw in _boxes(minimal_mp4())}
+    parts['mdat'] = (struct.pack('>I4s', 0, b'mdat') + PAYLOAD if mdat_size_zero
+                     else mp4tags._box(b'mdat', PAYLOAD))
+    parts['free'] = mp4tags._free_box(4096)
+    path = tmp_path / 'episode.mp4'
+    path.write_bytes(b''.join(parts[name] for name in order))
+    return str(path)
+
+
+def _mdat_payload(path):
+    data = open(path, 'rb').read()
+    boxes = [b for b in mp4tags._iter_boxes(data, 0, len(data))]
+    assert [b[0] for b in boxes].count(b'moov') == 1
+    mdat = next(b for b in boxes if b[0] == b'mdat')
+    return data[mdat[1] + mdat[2]:mdat[1] + mdat[3]]
+
+
+@pytest.mark.parametrize('order, strategy', [
+    (('ftyp', 'moov', 'free', 'mdat'), 'in-place'),
+    (('ftyp', 'mdat', 'moov'), 'at-end'),
+    (('ftyp', 'moov', 'mdat'), 'relocate'),
+])
+def test_round_trip(tmp_path, order, strategy):
+    path = _synthetic(tmp_path, order)
+    assert mp4tags.write_tags(path, TAGS, cover=b'\xff\xd8' + bytes(100)) == strategy
+    tags = mp4tags.read_tags(path)
+    assert tags['\xa9nam'] == 'Pilot' and tags['\xa9gen'] == 'Drama' and tags['tves'] == 1
+    assert tags['covr'] == 102
+    assert _mdat_payload(path) == PAYLOAD
+    assert mp4tags.track_handlers(path) == ['vide']
+
+    # A second write changes tags without losing the others
+    mp4tags.write_tags(path, {'title': 'Renamed', 'genre': None})
+    tags = mp4tags.read_tags(path)
+    assert tags['\xa9nam'] == 'Renamed' and '\xa9gen' not in tags and tags['tves'] == 1
+    assert _mdat_payload(path) == PAYLOAD
+
+
+def test_relocate_closes_a_trailing_box_of_size_zero(tmp_path):
+    path = _synthetic(tmp_path, ('ftyp', 'moov', 'mdat'), mdat_size_zero=True)
+    assert mp4tags.write_tags(path, TAGS) == 'relocate'
+    assert mp4tags.read_tags(path)['\xa9nam'] == 'Pilot'
+    assert _mdat_payload(path) == PAYLOAD
+
+
+def test_at_end_reuses_the_space_it_freed(tmp_path):
+    path = _synthetic(tmp_path, ('ftyp', 'mdat', 'moov'))
+    sizes = []
+    # Each write needs a bigger moov; once the old ones freed enough room in front, the next goes there
+    for cover_size in (1000, 1100, 1200):
+        assert mp4tags.write_tags(path, {'title': f'Cover {cover_size}'}, cover=b'\xff\xd8' + bytes(cover_size)) == 'at-end'
+        sizes.append(os.path.getsize(path))
+    assert sizes[2] < sizes[1]
+    tags = mp4tags.read_tags(path)
+    assert tags['\xa9nam'] == 'Cover 1200' and tags['covr'] == 1202
+    assert _mdat_payload(path) == PAYLOAD
+
+
+@pytest.mark.parametrize('before, fail_at', [
+    # Appending after the old moov: fsync after the append, then after retiring the old one
+    ((1000,), 1), ((1000,), 2),
+    # Writing into the freed space in front: free header, moov body, moov header, truncate
+    ((1000, 1100), 1), ((1000, 1100), 2), ((1000, 1100), 3), ((1000, 1100), 4),
+])
+def test_interrupted_at_end_write_keeps_a_moov(tmp_path, monkeypatch, before, fail_at):
+    path = _synthetic(tmp_path, ('ftyp', 'mdat', 'moov'))
+    for cover_size in before:
+        mp4tags.write_tags(path, {'title': 'Old'}, cover=b'\xff\xd8' + bytes(cover_size))
+    calls = []
+
+    def fsync(fd):
+        calls.append(fd)
+        if len(calls) == fail_at:
+            raise OSError('disk full')
+    monkeypatch.setattr(mp4tags.os, 'fsync', fsync)
+    with pytest.raises(OSError):
+        mp4tags.write_tags(path, {'title': 'New'}, cover=b'\xff\xd8' + bytes(before[-1] + 100))
+    assert mp4tags.read_tags(path)['\xa9nam'] in ('Old', 'New')
+    assert mp4tags.track_handlers(path) == ['vide']
+
+    monkeypatch.undo()
+    mp4tags.write_tags(path, {'title': 'Again'})
+    assert mp4tags.read_tags(path)['\xa9nam'] == 'Again'
+    assert _mdat_payload(path) == PAYLOAD
+
+
+@pytest.mark.parametrize('name, strategies', [
+    ('episode.mp4', ['at-end', 'at-end', 'at-end', 'in-place']),
+    ('episode-faststart.mp4', ['in-place', 'relocate', 'at-end', 'in-place']),
+])
+def test_ffmpeg_muxed_file(tmp_path, name, strategies):
+    path = str(tmp_path / name)
+    shutil.copyfile(os.path.join(DATA, name), path)
+    with open(os.path.join(DATA, 'cover.jpg'), 'rb') as f:
+        cover = f.read()
+    data = open(path, 'rb').read()
+    mdat = next(b for b in mp4tags._iter_boxes(data, 0, len(data)) if b[0] == b'mdat')
+    media = data[mdat[1]:mdat[1] + mdat[3]]
+
+    used = [mp4tags.write_tags(path, {'title': 'Pilot'})]
+    for length in (1000, 2000, 500):
+        used.append(mp4tags.write_tags(path, dict(TAGS, description='x' * length), cover))
+    assert used == strategies
+    tags = mp4tags.read_tags(path)
+    assert tags['\xa9nam'] == 'Pilot' and tags['desc'] == 'x' * 500 and tags['covr'] == len(cover)
+    assert mp4tags.track_handlers(path) == ['vide', 'soun']
+    data = open(path, 'rb').read()
+    assert data[mdat[1]:mdat[1] + mdat[3]] == media
+    if shutil.which('ffmpeg'):
+        result = subprocess.run(['ffmpeg', '-v', 'error', '-i', path, '-map', '0', '-f', 'null', '-'],
+                                capture_output=True, text=True)
+        assert result.returncode == 0 and not result.stderr
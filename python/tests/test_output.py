@@ -0,0 +1,84 @@
+import os
+import stat
+
+import pytest
+
+from media_common import output
+
+
+def _original(tmp_path, data=b'original'):
+    source = str(tmp_path / 'Episode.mp4')
+    with open(source, 'wb') as f:
+        f.write(data)
+    os.chmod(source, 0o640)
+    os.utime(source, ns=(10**18, 10**18 + 123))
+    return source
+
+
+def _leftovers(tmp_path):
+    return [name for name in os.listdir(tmp_path) if name.endswith(output.PARTIAL_SUFFIX)]
+
+
+def test_replace_keeps_mode_and_timestamps(tmp_path):
+    source = _original(tmp_path)
+    strategy = output.OutputStrategy('replace', margin=0)
+    with strategy.writing(source, str(tmp_path / 'Episode_updated.mp4'), 1024) as path:
+        assert os.path.dirname(path) == str(tmp_path) and path != source
+        with open(path, 'wb') as f:
+            f.write(b'tagged')
+    with open(source, 'rb') as f:
+        assert f.read() == b'tagged'
+    st = os.stat(source)
+    assert stat.S_IMODE(st.st_mode) == 0o640
+    assert st.st_mtime_ns == 10**18 + 123
+    # The preallocated 1 KiB was given back
+    assert st.st_size == len(b'tagged')
+    assert sorted(os.listdir(tmp_path)) == ['Episode.mp4']
+
+
+def test_replace_keeps_a_hardlinked_backup(tmp_path):
+    source = _original(tmp_path)
+    with open(output.backup_path(source), 'wb') as f:
+        f.write(b'older backup')
+    strategy = output.OutputStrategy('replace', backup=True, margin=0)
+    with strategy.writing(source, None, 0) as path:
+        with open(path, 'wb') as f:
+            f.write(b'tagged')
+    backup = output.backup_path(source)
+    assert backup == str(tmp_path / '.Episode.mp4.orig')
+    with open(backup, 'rb') as f:
+        assert f.read() == b'original'
+    assert os.stat(backup).st_nlink == 1 and os.stat(source).st_nlink == 1
+    with open(source, 'rb') as f:
+        assert f.read() == b'tagged'
+
+
+def test_replace_leaves_the_original_when_the_job_fails(tmp_path):
+    source = _original(tmp_path)
+    strategy = output.OutputStrategy('replace', backup=True, margin=0)
+    with pytest.raises(RuntimeError):
+        with strategy.writing(source, None, 1024) as path:
+            with open(path, 'wb') as f:
+                f.write(b'half')
+            raise RuntimeError('ffmpeg died')
+    with open(source, 'rb') as f:
+        assert f.read() == b'original'
+    assert os.stat(source).st_mtime_ns == 10**18 + 123
+    assert sorted(os.listdir(tmp_path)) == ['Episode.mp4']
+
+
+def test_refuses_to_start_without_free_space(tmp_path, monkeypatch):
+    source = _original(tmp_path)
+    monkeypatch.setattr(output, 'free_space', lambda directory: 100 * 2**20)
+    strategy = output.OutputStrategy('replace', margin=50 * 2**20)
+    with pytest.raises(output.InsufficientSpace):
+        with strategy.writing(source, None, 60 * 2**20):
+            pytest.fail('the job should not start')
+    assert not _leftovers(tmp_path)
+    with open(source, 'rb') as f:
+        assert f.read() == b'original'
+    # Nothing stays booked, so a job that fits still runs
+    with strategy.writing(source, None, 40 * 2**20) as path:
+        with open(path, 'wb') as f:
+            f.write(b'tagged')
+    assert output._booked.get(os.stat(tmp_path).st_dev, 0) == 0
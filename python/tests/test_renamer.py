@@ -0,0 +1,84 @@
+import os
+
+from media_common import renamer
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _case_sensitive(directory):
+    probe = os.path.join(directory, 'Case')
+    _write(probe, '')
+    try:
+        return not os.path.exists(os.path.join(directory, 'case'))
+    finally:
+        os.remove(probe)
+
+
+def test_chain_runs_back_to_front(tmp_path):
+    a, b, c = (str(tmp_path / name) for name in ('a', 'b', 'c'))
+    _write(a, 'A')
+    _write(b, 'B')
+    plan = renamer.plan_renames([(a, b), (b, c)])
+    assert plan.steps == [(b, c), (a, b)]
+    assert not plan.conflicts
+
+
+def test_cycle_uses_one_temporary(tmp_path):
+    a, b = str(tmp_path / 'a'), str(tmp_path / 'b')
+    _write(a, 'A')
+    _write(b, 'B')
+    plan = renamer.plan_renames([(a, b), (b, a)], batch='t')
+    assert plan.temporaries == 1
+    renamer.execute(plan, str(tmp_path / renamer.JOURNAL_NAME), verbose=False)
+    assert (_read(a), _read(b)) == ('B', 'A')
+
+
+def test_existing_destination_is_a_conflict(tmp_path):
+    a, b = str(tmp_path / 'a'), str(tmp_path / 'b')
+    _write(a, 'A')
+    _write(b, 'B')
+    plan = renamer.plan_renames([(a, b)])
+    assert not plan.steps
+    assert plan.conflicts == [(a, b, 'destination already exists')]
+
+
+def test_case_only_name_of_another_file_is_a_conflict(tmp_path):
+    if not _case_sensitive(str(tmp_path)):
+        return
+    src, other = str(tmp_path / 'S01E01 Pilot.mp4'), str(tmp_path / 's01e01 Pilot.mp4')
+    _write(src, 'first')
+    _write(other, 'second')
+    plan = renamer.plan_renames([(src, other)])
+    assert not plan.steps
+    assert len(plan.conflicts) == 1
+    renamer.execute(plan, str(tmp_path / renamer.JOURNAL_NAME), verbose=False)
+    assert (_read(src), _read(other)) == ('first', 'second')
+
+
+def test_case_only_rename_of_the_same_file_is_planned(tmp_path):
+    src = str(tmp_path / 'S01E01 Pilot.mp4')
+    _write(src, 'first')
+    alias = str(tmp_path / 'Same.mp4')
+    os.link(src, alias)
+    # A second name for the same inode stands in for a case-insensitive share
+    plan = renamer.plan_renames([(src, alias)])
+    assert plan.steps == [(src, alias)]
+    assert not plan.conflicts
+
+
+def test_undo_restores_names(tmp_path):
+    a, b = str(tmp_path / 'a'), str(tmp_path / 'b')
+    _write(a, 'A')
+    journal = str(tmp_path / renamer.JOURNAL_NAME)
+    renamer.execute(renamer.plan_renames([(a, b)]), journal, verbose=False)
+    assert os.path.exists(b) and not os.path.exists(a)
+    renamer.undo(journal, verbose=False)
+    assert _read(a) == 'A' and not os.path.exists(b)
@@ -0,0 +1,63 @@
+import codecs
+
+import pytest
+
+from media_common import subtitles
+
+
+@pytest.mark.parametrize('name, video_base, expected', [
+    ('Movie.fr.forced.srt', None, 'fre'),
+    ('Movie.en.hi.srt', None, 'eng'),
+    ('Movie.hi.srt', None, 'hin'),
+    ('Movie.Name.2019.de.sdh.srt', None, 'ger'),
+    ('French.srt', None, 'fre'),
+    ('2_English.srt', None, 'eng'),
+    ('Ep 01.fr.srt', 'Ep 01', 'fre'),
+    ('Ep 01 [English] (SDH).srt', 'Ep 01', 'eng'),
+    # Title words are not language codes
+    ('No Country for Old Men.srt', None, 'eng'),
+    ('It.2017.srt', None, 'eng'),
+    ('It.srt', None, 'eng'),
+])
+def test_subtitle_language(name, video_base, expected):
+    assert subtitles.subtitle_language(name, video_base) == expected
+
+
+def test_undecodable_file_with_bom_is_an_error(tmp_path):
+    path = tmp_path / 'Ep.srt'
+    path.write_bytes(codecs.BOM_UTF8 + b'1\n00:00:01,000 --> 00:00:02,000\n\xff\x80\n\n')
+    subtitle = subtitles.inspect(str(path))
+    assert not subtitle.ok
+    assert subtitle.errors == ['undecodable as utf-8-sig']
+
+
+def test_cp1252_file_is_normalised_to_utf8(tmp_path):
+    path = tmp_path / 'Ep.srt'
+    path.write_bytes('1\n00:00:01,000 --> 00:00:02,000\nCafé\n\n'.encode('cp1252'))
+    subtitle = subtitles.inspect(str(path))
+    try:
+        assert subtitle.ok and subtitle.encoding == 'cp1252' and subtitle.path != str(path)
+        with open(subtitle.path, encoding='utf-8') as f:
+            assert 'Café' in f.read()
+    finally:
+        subtitle.cleanup()
+
+
+def test_repair_rejects_file_without_any_text(tmp_path):
+    path = tmp_path / 'Ep.srt'
+    path.write_text('1\n00:00:01,000 --> 00:00:02,000\n\n2\n00:00:03,000 --> 00:00:04,000\n\n')
+    subtitle = subtitles.inspect(str(path), repair=True)
+    assert not subtitle.ok
+    assert subtitle.errors == ['no subtitle cues left after repair']
+    assert subtitle.cues == 0
+    assert subtitle.path == str(path)
+
+
+def test_repair_counts_the_cues_it_keeps(tmp_path):
+    path = tmp_path / 'Ep.srt'
+    path.write_text('1\n00:00:01,000 --> 00:00:02,000\n\n2\n00:00:03,000 --> 00:00:04,000\nHello\n\n')
+    subtitle = subtitles.inspect(str(path), repair=True)
+    try:
+        assert subtitle.ok and subtitle.repaired and subtitle.cues == 1
+    finally:
+        subtitle.cleanup()
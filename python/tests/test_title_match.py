@@ -0,0 +1,59 @@
+import pytest
+
+from media_common import title_match
+
+
+@pytest.mark.parametrize('title, expected', [
+    ('The Pilot (Part 1) 1080p', 'pilot part 1'),
+    ('Pilot Pt. Two', 'pilot part 2'),
+    ('Pilot (II)', 'pilot part 2'),
+    ("Don't Stop 1080p WEB-DL x264-GROUP", 'dont stop'),
+    ('Pilot PROPER 720p', 'pilot'),
+    ('Office, The', 'office'),
+    ('Café Society', 'cafe society'),
+    # Tag words that are the title itself, or not followed by anything technical
+    ('Internal Affairs', 'internal affairs'),
+    ('Proper Etiquette', 'proper etiquette'),
+    ('Web of Lies', 'web of lies'),
+    ('Hulu', 'hulu'),
+    ('HDTV Special', 'hdtv special'),
+    ('Into the Web', 'into the web'),
+    ('Pilot Internal Affairs 1080p', 'pilot internal affairs'),
+])
+def test_normalize(title, expected):
+    assert title_match.normalize(title) == expected
+
+
+def test_empty_titles_never_match():
+    assert title_match.similarity('', '') == 0.0
+    index = title_match.TitleIndex({'s01e01': '1080p', 's01e02': 'Pilot'})
+    assert index.candidates('720p x264') == []
+
+
+def test_different_part_numbers_never_match():
+    assert title_match.similarity('pilot part 3', 'pilot part 1') < title_match.DEFAULT_MIN_SCORE
+    assert title_match.similarity('pilot', 'pilot part 1') >= title_match.DEFAULT_MIN_SCORE
+
+
+def test_assign_prefers_the_best_overall_fit():
+    index = title_match.TitleIndex({
+        's01e01': 'Pilot (1)',
+        's01e02': 'Pilot (2)',
+        's01e03': 'The Long Goodbye',
+        's01e04': 'The Long Goodbyes',
+    })
+    result = title_match.assign(['Pilot Part 2', 'Pilot Part One', 'Long Goodbyes', 'Long Goodbye'], index)
+    assert {m.text: m.key for m in result.matches} == {
+        'Pilot Part 2': 's01e02',
+        'Pilot Part One': 's01e01',
+        'Long Goodbyes': 's01e04',
+        'Long Goodbye': 's01e03',
+    }
+    assert not result.unmatched and not result.unused
+
+
+def test_assign_leaves_wrong_parts_and_tag_titles_unmatched():
+    index = title_match.TitleIndex({'s01e01': 'Pilot (1)', 's01e02': 'Web of Lies', 's01e03': 'Hulu'})
+    result = title_match.assign(['Pilot Part 3', 'Internal Affairs', 'Proper Etiquette', 'Web of Lies'], index)
+    assert [(m.text, m.key, m.score) for m in result.matches] == [('Web of Lies', 's01e02', 1.0)]
+    assert result.unmatched == ['Pilot Part 3', 'Internal Affairs', 'Proper Etiquette']
@@ -0,0 +1,55 @@
+import threading
+
+from media_common import watch
+
+
+def _watcher(tmp_path, settle=5.0):
+    return watch.Watcher(str(tmp_path), lambda job: None, settle=settle, poll_interval=1.0)
+
+
+def test_modify_restarts_settle_timer(tmp_path):
+    video = tmp_path / 'Show - S01E01.mp4'
+    video.write_bytes(b'x' * 10)
+    watcher = _watcher(tmp_path)
+    watcher._handle_event(watch.IN_CREATE, str(video))
+    state = watcher._pending[str(video)]
+    state[0] -= 60
+    # Still being written: the next chunk arrives before the file is checked
+    watcher._handle_event(watch.IN_MODIFY, str(video))
+    assert watcher._pending[str(video)] is state
+    assert watcher._settled(state[0] + 1) == []
+
+
+def test_file_settles_once_writes_stop(tmp_path):
+    video = tmp_path / 'Show - S01E01.mp4'
+    video.write_bytes(b'x' * 10)
+    watcher = _watcher(tmp_path)
+    watcher._handle_event(watch.IN_MODIFY, str(video))
+    start = watcher._pending[str(video)][0]
+    # The first check records the size, the second sees it unchanged
+    assert watcher._settled(start + 6) == []
+    assert watcher._settled(start + 12) == [str(video)]
+
+
+def test_watch_mask_includes_modify():
+    assert watch.WATCH_MASK & watch.IN_MODIFY
+
+
+def test_workers_count_every_job(tmp_path):
+    def handler(job):
+        if job.video.startswith('bad'):
+            raise ValueError('bad file')
+    watcher = watch.Watcher(str(tmp_path), handler, workers=4, queue_size=0, poll_interval=1.0)
+    names = [f'{kind}{i}.mp4' for i in range(50) for kind in ('good', 'bad')]
+    for name in names:
+        (tmp_path / name).write_bytes(b'x')
+    threads = [threading.Thread(target=watcher._worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for name in names:
+        watcher.queue.put(watch.WatchJob(str(tmp_path), name))
+    for _ in threads:
+        watcher.queue.put(None)
+    for thread in threads:
+        thread.join()
+    assert (watcher.handled, watcher.failed) == (50, 50)
@@ -1,15 +1,58 @@
+import asyncio
+import contextlib
+import dataclasses
+import io
 import os
 import subprocess
 import sys
-import requests
+import argparse
 import json
-import tvdb_v4_official
+import time
 from pprint import pprint
 from colorama import init, Fore, Style
+from dataclasses import dataclass, field
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from media_common import audit, faults, library, mp4tags, output, probe, scheduler, trace, watch  # noqa: E402
+from media_common.artwork import DEFAULT_MAX_AGE, ArtworkStore  # noqa: E402
+from media_common.manifest import Manifest  # noqa: E402
+from media_common.series_map import SeriesMap, fingerprint  # noqa: E402
+from media_common.tvdb_client import BudgetExhausted, CachedTVDB, DEFAULT_TTL  # noqa: E402
+from media_common.tvdb_snapshot import load_snapshot  # noqa: E402
 
 # Initialize colorama
 init(autoreset=True)
 
+TAG_OPERATION = 'tag_metadata'
+DEFAULT_OUTPUT = output.OutputStrategy()
+
+@dataclass
+class TagOptions:
+    """How a run tags files; process_library hands the same options to every show."""
+    debug: bool = False
+    cache_ttl: float = DEFAULT_TTL
+    artwork_ttl: float = DEFAULT_MAX_AGE
+    refresh: bool = False
+    remux: bool = False
+    force: bool = False
+    plan: bool = False
+    # dict(net_jobs=..., mux_jobs=...) for tag_show_pipeline; None tags one file at a time
+    pipeline: dict = None
+    outputs: output.OutputStrategy = DEFAULT_OUTPUT
+    # Only these absolute paths (an audit worklist, the files --retry-failed runs)
+    only: set = None
+    use_manifest: bool = True
+    use_hash: bool = False
+    use_quarantine: bool = True
+    retry: faults.RetryPolicy = field(default_factory=faults.RetryPolicy)
+    retry_failed: bool = False
+    # A single show only: TVDB snapshot data, and Watcher options for --watch
+    snapshot: dict = None
+    watch: dict = None
+    # --library only: TVDB request budget and requests per second
+    budget: int = None
+    rate: float = None
+
 def pretty_print_json(data, label):
     print(Fore.YELLOW + f"{label}:")
     pprint(data, indent=2)
@@ -46,38 +89,73 @@ def get_season_metadata(tvdb, season_info, debug):
     return season_metadata
 
 def get_episode_metadata(tvdb, series_id, season, episode, debug):
-    try:
-        series_extended = tvdb.get_series_extended(series_id)
-        if debug:
-            pretty_print_json(series_extended, f"Series Extended Data for ID {series_id}")
+    season_info = tvdb.get_season_info(series_id, season)
+    if debug:
+        pretty_print_json(season_info, "Season Info")
 
-        for season_info in series_extended["seasons"]:
-            if debug:
-                pretty_print_json(season_info, "Season Info")
-
-            if season_info["type"]["name"] == "Aired Order" and season_info["number"] == int(season):
-                season_data = tvdb.get_season_extended(season_info["id"])
-                if debug:
-                    pretty_print_json(season_data, f"Season Data for Season {season_info['number']}")
-
-                for ep in season_data["episodes"]:
-                    if ep["number"] == int(episode):
-                        return ep
-        return None
-    except Exception as e:
-        if debug:
-            print(Fore.RED + f"Error fetching metadata for series ID {series_id}, Season {season}, Episode {episode}: {e}")
-        return None
+    return tvdb.get_episode(series_id, season, episode)
 
-def update_metadata(file_path, metadata, series_metadata, season_metadata, debug):
+def episode_tags(metadata, series_metadata, season_metadata):
+    return {
+        "title": metadata.get("name", ""),
+        "date": season_metadata.get("aired", ""),
+        "genre": series_metadata.get("genres", ""),
+        "description": metadata.get("overview", ""),
+        "network": series_metadata.get("network", ""),
+        "episode_id": metadata.get("id", ""),
+        "cast": series_metadata.get("actors", ""),
+        "director": metadata.get("director", ""),
+        "producer": metadata.get("director", ""),  # Assuming same as director if producer is not provided
+        "writer": metadata.get("writer", ""),
+        "content_rating": series_metadata.get("contentRating", ""),
+    }
+
+def update_metadata(file_path, metadata, series_metadata, season_metadata, debug, remux=False, artwork_store=None, outputs=None):
     if debug:
         pretty_print_json(metadata, f"Updating metadata for {file_path}")
         pretty_print_json(series_metadata, "Series Metadata")
         pretty_print_json(season_metadata, "Season Metadata")
 
-    ffmpeg_command = [
-        'ffmpeg',
-        '-i', file_path,
+    artwork_store = artwork_store or ArtworkStore()
+    artwork_url = season_metadata.get('image', None)
+    artwork_path = artwork_store.get(artwork_url) if artwork_url else None
+
+    if remux:
+        remux_metadata(file_path, metadata, series_metadata, season_metadata, artwork_path, debug, outputs)
+        return
+
+    # Rewrite only the moov box of the original file; the media data is never copied
+    cover = None
+    if artwork_path:
+        with open(artwork_path, 'rb') as f:
+            cover = f.read()
+    with trace.span('mp4tags', file_path) as current:
+        strategy = mp4tags.write_tags(file_path, episode_tags(metadata, series_metadata, season_metadata), cover)
+        current.set(strategy=strategy)
+    if debug:
+        print(Fore.CYAN + f"Tags written to {file_path} ({strategy})")
+
+def cover_streams(source_info):
+    """Video-relative indexes of the attached pictures (an existing covr atom) in a probe."""
+    return [i for i, s in enumerate(source_info.video_streams) if s.disposition.get('attached_pic')]
+
+def remux_command(file_path, metadata, series_metadata, season_metadata, artwork_path, output_args=None, source_info=None):
+    # Tags and cover art go in with a single ffmpeg pass
+    ffmpeg_command = ['ffmpeg', '-y', '-i', file_path]
+    if artwork_path:
+        source_info = source_info or probe.probe_file(file_path)
+        covers = cover_streams(source_info)
+        ffmpeg_command.extend(['-i', artwork_path, '-map', '0'])
+        # An old cover is replaced, not kept next to the new one
+        for index in covers:
+            ffmpeg_command.extend(['-map', f'-0:v:{index}'])
+        # The cover becomes the video stream after the episode's own video tracks
+        video_tracks = len(source_info.video_streams) - len(covers)
+        ffmpeg_command.extend([
+            '-map', '1',
+            f'-disposition:v:{video_tracks}', 'attached_pic'
+        ])
+    ffmpeg_command.extend([
         '-metadata', f'title={metadata.get("name", "")}',
         '-metadata', f'date={season_metadata.get("aired", "")}',
         '-metadata', f'genre={series_metadata.get("genres", "")}',
@@ -90,69 +168,515 @@ def update_metadata(file_path, metadata, series_metadata, season_metadata, debug
         '-metadata', f'writer={metadata.get("writer", "")}',
         '-metadata', f'contentRating={series_metadata.get("contentRating", "")}',
         '-c', 'copy',
-        f'{os.path.splitext(file_path)[0]}_updated.mp4'
-    ]
-    if debug:
-        pretty_print_command(ffmpeg_command, "FFmpeg Command")
-    subprocess.run(ffmpeg_command, check=True)
+    ] + (output_args or [f'{os.path.splitext(file_path)[0]}_updated.mp4']))
+    return ffmpeg_command
 
-    artwork_url = season_metadata.get('image', None)
-    if artwork_url:
-        artwork_path = os.path.join(os.path.dirname(file_path), 'artwork.jpg')
-        response = requests.get(artwork_url)
-        with open(artwork_path, 'wb') as f:
-            f.write(response.content)
-        atomicparsley_command = [
-            'AtomicParsley', f'{os.path.splitext(file_path)[0]}_updated.mp4',
-            '--artwork', artwork_path,
-            '--overWrite'
-        ]
+def remux_layout(source_info, artwork_path):
+    """Streams a remux must keep: everything plus the cover with artwork, else ffmpeg's default video and audio pick."""
+    if artwork_path:
+        return output.expected_layout(source_info, add={'video': 1}, drop={'video': len(cover_streams(source_info))})
+    counts = output.expected_layout(source_info)
+    return {t: min(1, counts.get(t, 0)) for t in ('video', 'audio')}
+
+def remux_needed(file_path, artwork_path):
+    return os.path.getsize(file_path) + (os.path.getsize(artwork_path) if artwork_path else 0)
+
+def remux_metadata(file_path, metadata, series_metadata, season_metadata, artwork_path, debug, outputs=None):
+    outputs = outputs or DEFAULT_OUTPUT
+    source_info = probe.probe_file(file_path) if outputs.replaces or artwork_path else None
+    needed = remux_needed(file_path, artwork_path)
+    with outputs.writing(file_path, output_path(file_path, True), needed) as partial_path:
+        ffmpeg_command = remux_command(file_path, metadata, series_metadata, season_metadata, artwork_path,
+                                       output.ffmpeg_output_args(partial_path), source_info)
         if debug:
-            pretty_print_command(atomicparsley_command, "AtomicParsley Command")
-        subprocess.run(atomicparsley_command, check=True)
+            pretty_print_command(ffmpeg_command, "FFmpeg Command")
+        trace.run(ffmpeg_command, check=True, timeout=faults.subprocess_timeout(needed))
+        if outputs.replaces:
+            output.verify(partial_path, remux_layout(source_info, artwork_path), source_info.duration)
+
+def output_path(file_path, remux, outputs=None):
+    if not remux:
+        return file_path
+    return (outputs or DEFAULT_OUTPUT).destination(file_path, f'{os.path.splitext(file_path)[0]}_updated.mp4')
+
+def tag_params(metadata, series_metadata, season_metadata, remux):
+    return {
+        "tags": episode_tags(metadata, series_metadata, season_metadata),
+        "artwork": season_metadata.get("image", ""),
+        "remux": remux,
+    }
+
+def episode_number(file):
+    return int(os.path.splitext(file)[0].split(' ')[0])
+
+def source_files(season, only=None):
+    """A season's episodes in alphabetical order, without --remux outputs and, given ``only``, limited to those paths."""
+    return [f for f in season.files if f.endswith('.mp4') and not f.endswith('_updated.mp4')
+            and (only is None or os.path.join(season.path, f) in only)]
+
+async def run_ffmpeg(command, file_path, timeout):
+    """Run an ffmpeg command without blocking the event loop; killed and TimeoutExpired after ``timeout`` seconds."""
+    with trace.span('ffmpeg', file_path) as current:
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE)
+        try:
+            out, err = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise subprocess.TimeoutExpired(command, timeout)
+        current.set(exit=process.returncode)
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command, out.decode(errors='replace'),
+                                                err.decode(errors='replace'))
+
+@contextlib.asynccontextmanager
+async def writing_in_thread(outputs, source, copy_path, needed):
+    """``outputs.writing`` with its disk work (space check, preallocation, the final rename) in a worker thread."""
+    writing = outputs.writing(source, copy_path, needed)
+    partial_path = await asyncio.to_thread(writing.__enter__)
+    try:
+        yield partial_path
+    except BaseException as e:
+        if not await asyncio.to_thread(writing.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await asyncio.to_thread(writing.__exit__, None, None, None)
+
+async def tag_show_pipeline(folder_path, series_id, tvdb, series_metadata, manifest, artwork_store, options,
+                            net_jobs=4, mux_jobs=2, queue_size=32):
+    """
+    Tag a show with overlapping stages: TVDB season data and artwork are
+    prefetched (at most net_jobs requests at a time) while up to mux_jobs files
+    are being tagged or remuxed. Each file's log lines are printed in file
+    order. A file that fails does not stop the others. Returns the number of
+    files that were already up to date and a list of (path, error) failures.
+    """
+    debug, remux, force, outputs, only, retry = (options.debug, options.remux, options.force, options.outputs,
+                                                 options.only, options.retry)
+    seasons = [s for s in library.index_for(folder_path).seasons(folder_path) if source_files(s, only)]
+    network = asyncio.Semaphore(net_jobs)
+    stdout_proxy = scheduler.ThreadLocalStdout(sys.stdout)
+
+    def captured(func, *args):
+        # Runs in a worker thread; whatever func prints is returned instead
+        buffer = io.StringIO()
+        stdout_proxy.local.buffer = buffer
+        try:
+            return func(*args), buffer.getvalue()
+        finally:
+            stdout_proxy.local.buffer = None
 
-def process_tv_show(folder_path, series_id, api_key, debug):
-    tvdb = tvdb_v4_official.TVDB(api_key)
+    # What a season's downloads print goes out once, ahead of the season's first file
+    season_logs = {season.path: [] for season in seasons}
+
+    async def fetch(season, func, *args):
+        async with network:
+            value, text = await asyncio.to_thread(captured, func, *args)
+        season_logs[season.path].extend(text.splitlines())
+        return value
+
+    async def season_data(season):
+        season_number = str(season.season_number)
+        season_info = await fetch(season, tvdb.get_season_info, series_id, season_number)
+        season_metadata = await fetch(season, get_season_metadata, tvdb, season_info, debug)
+        episodes = await fetch(season, tvdb.episode_index, series_id, season_number)
+        if season_metadata.get('image'):
+            await fetch(season, artwork_store.get, season_metadata['image'])
+        return season_metadata, episodes
+
+    # Every season starts downloading right away; files wait only for their own season
+    season_tasks = {season.path: asyncio.create_task(season_data(season)) for season in seasons}
+
+    metadata_queue = asyncio.Queue(maxsize=queue_size)
+    mux_queue = asyncio.Queue(maxsize=queue_size)
+    finished = {}
+    failures = []
+    state = {'next': 0, 'skipped': 0}
+
+    def finish(seq, lines):
+        finished[seq] = lines
+        while state['next'] in finished:
+            for line in finished.pop(state['next']):
+                print(line)
+            state['next'] += 1
+
+    async def produce():
+        seq = 0
+        for season in seasons:
+            for i, file in enumerate(source_files(season, only)):
+                await metadata_queue.put((seq, season, file, i == 0))
+                seq += 1
+        for _ in range(net_jobs):
+            await metadata_queue.put(None)
+
+    async def resolve():
+        while (item := await metadata_queue.get()) is not None:
+            seq, season, file, first = item
+            file_path = os.path.join(season.path, file)
+            error = metadata = None
+            try:
+                season_metadata, episodes = await season_tasks[season.path]
+                metadata = episodes.get(episode_number(file))
+            except Exception as e:
+                error = e
+            # The season's downloads are over by now, so its log is complete
+            lines = season_logs[season.path] if first else []
+            if error is not None:
+                failures.append((file_path, error))
+                finish(seq, lines + [Fore.RED + f'Failed to fetch metadata for {file_path}: {error}'])
+                continue
+            if not metadata:
+                finish(seq, lines + [Fore.RED + f'No metadata found for {file_path}'])
+                continue
+            params = tag_params(metadata, series_metadata, season_metadata, remux)
+            target = output_path(file_path, remux, outputs)
+            # Stats (and with --hash reads) the file, so keep it off the event loop
+            if manifest is not None and not force and await asyncio.to_thread(
+                    manifest.is_done, TAG_OPERATION, file_path, [file_path], params, target):
+                state['skipped'] += 1
+                finish(seq, lines)
+                continue
+            await mux_queue.put((seq, lines, file_path, metadata, season_metadata, params, target))
+
+    async def tag_one(file_path, metadata, season_metadata, params, target):
+        lines = []
+        inputs = await asyncio.to_thread(manifest.snapshot_inputs, [file_path]) if manifest is not None else None
+        if remux:
+            artwork_url = season_metadata.get('image')
+            artwork_path = None
+            if artwork_url:
+                artwork_path, text = await asyncio.to_thread(captured, artwork_store.get, artwork_url)
+                lines.extend(text.splitlines())
+            source_info = await asyncio.to_thread(probe.probe_file, file_path) if outputs.replaces or artwork_path else None
+            needed = remux_needed(file_path, artwork_path)
+            async with writing_in_thread(outputs, file_path, output_path(file_path, True), needed) as partial_path:
+                command = remux_command(file_path, metadata, series_metadata, season_metadata, artwork_path,
+                                        output.ffmpeg_output_args(partial_path), source_info)
+                await run_ffmpeg(command, file_path, faults.subprocess_timeout(needed))
+                if outputs.replaces:
+                    await asyncio.to_thread(output.verify, partial_path, remux_layout(source_info, artwork_path),
+                                            source_info.duration)
+            if debug:
+                lines.append(Fore.CYAN + "FFmpeg Command:\n" + " ".join(command))
+        else:
+            _, text = await asyncio.to_thread(captured, update_metadata, file_path, metadata, series_metadata,
+                                              season_metadata, debug, False, artwork_store)
+            lines.extend(text.splitlines())
+        if manifest is not None:
+            await asyncio.to_thread(manifest.record, TAG_OPERATION, file_path, [file_path], params, target, inputs)
+        return lines
+
+    async def tag():
+        while (item := await mux_queue.get()) is not None:
+            seq, lines, file_path, metadata, season_metadata, params, target = item
+            lines = list(lines)
+            try:
+                lines += await retry.call_async(tag_one, file_path, metadata, season_metadata, params, target,
+                                                label=file_path)
+                lines.append(Fore.GREEN + f'Updated metadata for {file_path}')
+            except Exception as e:
+                failures.append((file_path, e))
+                lines.append(Fore.RED + f'Failed to update {file_path}: {e}')
+                stderr = getattr(e, 'stderr', None)
+                if stderr:
+                    lines.extend(stderr.strip().splitlines()[-5:])
+            finish(seq, lines)
+
+    real_stdout = sys.stdout
+    sys.stdout = stdout_proxy
+    try:
+        resolvers = [asyncio.create_task(resolve()) for _ in range(net_jobs)]
+        taggers = [asyncio.create_task(tag()) for _ in range(mux_jobs)]
+        await produce()
+        await asyncio.gather(*resolvers)
+        for _ in range(mux_jobs):
+            await mux_queue.put(None)
+        await asyncio.gather(*taggers)
+        await asyncio.gather(*season_tasks.values(), return_exceptions=True)
+    finally:
+        sys.stdout = real_stdout
+    for _, error in failures:
+        if isinstance(error, BudgetExhausted):
+            # Not the file's fault; process_library leaves the rest of the library for the next run
+            raise error
+    return state['skipped'], failures
+
+def process_tv_show(folder_path, series_id, api_key, options, tvdb=None, artwork_store=None):
+    """
+    Tag one show. ``tvdb`` and ``artwork_store`` are shared by process_library;
+    a single-show run makes its own. The show's manifest and quarantine live
+    in its folder.
+    """
+    retry = options.retry
+    if tvdb is None:
+        tvdb = CachedTVDB(api_key, ttl=options.cache_ttl, refresh=options.refresh, offline=api_key is None, retry=retry)
+    if options.snapshot is not None:
+        tvdb.load_snapshot(options.snapshot)
+    artwork_store = artwork_store or ArtworkStore(max_age=options.artwork_ttl, retry=retry)
+    manifest = Manifest(folder_path, use_hash=options.use_hash) if options.use_manifest else None
+    quarantine = faults.Quarantine(folder_path) if options.use_quarantine else None
+    debug, remux, outputs, only = options.debug, options.remux, options.outputs, options.only
 
     # Cache series metadata
     series_metadata = get_series_metadata(tvdb, series_id, debug)
+    season_cache = {}
+    skipped = 0
+    pending = []
+    failures = []
+
+    def season_context(season_number):
+        # Cache season metadata
+        if season_number not in season_cache:
+            season_info = tvdb.get_season_info(series_id, season_number)
+            season_cache[season_number] = get_season_metadata(tvdb, season_info, debug)
+        return season_cache[season_number]
 
-    for root, dirs, files in os.walk(folder_path):
-        if 'Season ' in root:
-            files = sorted(files)  # Process files in alphabetical order
+    def tag_file(season_number, root, file):
+        nonlocal skipped
+        episode = str(episode_number(file))  # Remove leading zeros
+        file_path = os.path.join(root, file)
+        season_metadata = season_context(season_number)
 
-            # Cache season metadata
-            season_number = root.split(os.path.sep)[-1].split(' ')[-1]
-            season_info = next((s for s in tvdb.get_series_extended(series_id)["seasons"] if s["number"] == int(season_number)), None)
-            season_metadata = get_season_metadata(tvdb, season_info, debug)
+        if debug:
+            print(Fore.GREEN + f"Searching for: Series ID: {series_id}, Season: {season_number}, Episode: {episode}")
 
-            for file in files:
-                if file.endswith('.mp4'):
-                    episode = str(int(os.path.splitext(file)[0].split(' ')[0]))  # Remove leading zeros
-                    file_path = os.path.join(root, file)
+        metadata = get_episode_metadata(tvdb, series_id, season_number, episode, debug)
+        if not metadata:
+            print(Fore.RED + f'No metadata found for {file_path}')
+            return
 
-                    if debug:
-                        print(Fore.GREEN + f"Searching for: Series ID: {series_id}, Season: {season_number}, Episode: {episode}")
+        params = tag_params(metadata, series_metadata, season_metadata, remux)
+        target = output_path(file_path, remux, outputs)
+        if manifest is not None and not options.force and manifest.is_done(TAG_OPERATION, file_path, [file_path], params, target):
+            skipped += 1
+            return
+        if options.plan:
+            pending.append(file_path)
+            return
 
-                    metadata = get_episode_metadata(tvdb, series_id, season_number, episode, debug)
-                    if metadata:
-                        update_metadata(file_path, metadata, series_metadata, season_metadata, debug)
-                        print(Fore.GREEN + f'Updated metadata for {file_path}')
-                    else:
-                        print(Fore.RED + f'No metadata found for {file_path}')
+        inputs = manifest.snapshot_inputs([file_path]) if manifest is not None else None
+        update_metadata(file_path, metadata, series_metadata, season_metadata, debug, remux, artwork_store, outputs)
+        if manifest is not None:
+            manifest.record(TAG_OPERATION, file_path, [file_path], params, target, input_identities=inputs)
+        print(Fore.GREEN + f'Updated metadata for {file_path}')
+
+    def tag_isolated(season_number, root, file):
+        file_path = os.path.join(root, file)
+        try:
+            retry.call(tag_file, season_number, root, file, label=file_path)
+        except BudgetExhausted:
+            raise
+        except Exception as e:
+            failures.append((file_path, e))
+            print(Fore.RED + f'Failed to update {file_path}: {e}')
+            stderr = getattr(e, 'stderr', None)
+            if stderr:
+                print('\n'.join(stderr.strip().splitlines()[-5:]))
+
+    if options.watch is not None:
+        def handle(job):
+            season_number = library.season_number(os.path.basename(job.folder))
+            if season_number is not None and job.video.endswith('.mp4'):
+                faults.quarantined_call(retry, quarantine, TAG_OPERATION, job.path,
+                                        tag_file, str(season_number), job.folder, job.video)
+
+        # *_updated.mp4 files are this script's own --remux output
+        watcher = watch.Watcher(folder_path, handle, ignore=lambda name: name.endswith('_updated.mp4'), **options.watch)
+        return watcher.run() == 0
+
+    held = set()
+    if quarantine is not None and not options.retry_failed:
+        # Files that failed for good before are left alone until they change
+        candidates = {os.path.join(season.path, f) for season in library.index_for(folder_path).seasons(folder_path)
+                      for f in source_files(season, only)}
+        held = {file_path for file_path in candidates if quarantine.holds(file_path, TAG_OPERATION)}
+        if held:
+            only = candidates - held
+
+    if options.pipeline is not None and not options.plan:
+        skipped, failures = asyncio.run(tag_show_pipeline(folder_path, series_id, tvdb, series_metadata, manifest,
+                                                          artwork_store, dataclasses.replace(options, only=only),
+                                                          **options.pipeline))
+    else:
+        for season in library.index_for(folder_path).seasons(folder_path):
+            for file in source_files(season, only):
+                tag_isolated(str(season.season_number), season.path, file)
+
+    if skipped:
+        print(Fore.CYAN + f"Skipped {skipped} file(s) already up to date (use --force to redo them).")
+    if held:
+        print(Fore.YELLOW + f"Holding back {len(held)} file(s) that failed before and have not changed (use --retry-failed to try them again).")
+    if quarantine is not None and not options.plan:
+        failed = {file_path for file_path, _ in failures}
+        for file_path in quarantine.paths(TAG_OPERATION):
+            if file_path.startswith(os.path.join(os.path.abspath(folder_path), '')) and file_path not in failed \
+                    and file_path not in held and (only is None or file_path in only):
+                quarantine.clear(file_path, TAG_OPERATION)
+        for file_path, error in failures:
+            quarantine.add(file_path, error, TAG_OPERATION)
+        quarantine.save()
+        if quarantine.paths(TAG_OPERATION):
+            print(quarantine.summary(TAG_OPERATION))
+    if options.plan:
+        print(f"{len(pending)} file(s) pending:")
+        for file_path in pending:
+            print(f"  {file_path}")
+
+    if debug:
+        print(Fore.CYAN + f"TVDB requests made: {tvdb.network_calls}")
+        print(Fore.CYAN + f"Artwork downloads: {artwork_store.downloads} ({artwork_store.bytes_downloaded} bytes)")
+    return not failures
+
+def show_fingerprint(show_path, series_id, remux, outputs=None):
+    """
+    What a finished show run depends on: the series, the episode files and how
+    they were written. Season folder mtimes stand in for the files themselves,
+    since a replaced or upgraded episode is moved into place.
+    """
+    seasons = library.index_for(show_path).seasons(show_path)
+    return fingerprint({
+        'series_id': series_id,
+        'remux': remux,
+        'output': (outputs or DEFAULT_OUTPUT).strategy if remux else None,
+        'seasons': [[season.name, season.mtime_ns, source_files(season)] for season in seasons],
+    })
+
+def process_library(root, api_key, series_map, options):
+    """
+    Tag every show under a TV root with one shared TVDB client. Show folders
+    are resolved to series ids through ``series_map``; shows whose episode
+    listing has not changed since their last complete run are skipped without
+    any TVDB request. Stops early, leaving the rest for the next run, once the
+    request budget is spent. A show with failed files is not marked done, so
+    the next run looks at it again.
+    """
+    tvdb = CachedTVDB(api_key, ttl=options.cache_ttl, refresh=options.refresh, budget=options.budget, rate=options.rate,
+                      retry=options.retry)
+    artwork_store = ArtworkStore(max_age=options.artwork_ttl, retry=options.retry)
+    shows = library.index_for(root).shows()
+    unchanged, unresolved, failed, done = [], [], [], []
+    deferred = 0
+
+    for position, show in enumerate(shows):
+        if options.only is not None and not any(file_path.startswith(os.path.join(show.path, '')) for file_path in options.only):
+            continue
+        try:
+            series_id = series_map.resolve(show.name, tvdb, refresh=options.refresh)
+        except BudgetExhausted:
+            deferred = len(shows) - position
+            break
+        finally:
+            series_map.save()
+        if series_id is None:
+            unresolved.append(show.name)
+            print(Fore.YELLOW + f"No confident TVDB match for '{show.name}'; set its id in {series_map.path}")
+            continue
+        digest = show_fingerprint(show.path, series_id, options.remux, options.outputs)
+        if not options.force and not options.refresh and options.only is None and series_map.is_current(show.name, digest):
+            unchanged.append(show.name)
+            continue
+
+        print(Style.BRIGHT + f"{show.name} (TVDB {series_id})")
+        try:
+            succeeded = process_tv_show(show.path, series_id, api_key, options, tvdb=tvdb, artwork_store=artwork_store)
+        except BudgetExhausted:
+            deferred = len(shows) - position
+            break
+        except Exception as e:
+            failed.append(show.name)
+            print(Fore.RED + f"Failed to process {show.name}: {e}")
+            continue
+        if tvdb.exhausted:
+            # The sequential path reports a spent budget as missing metadata; the show is not finished
+            deferred = len(shows) - position
+            break
+        if not succeeded:
+            failed.append(show.name)
+            continue
+        if not options.plan and options.only is None:
+            # The run itself may have added or replaced files
+            library.index_for(show.path).refresh(show.path)
+            series_map.mark_done(show.name, show_fingerprint(show.path, series_id, options.remux, options.outputs), time.time())
+            series_map.save()
+        done.append(show.name)
+
+    print(f"{len(done)} show(s) processed, {len(unchanged)} unchanged, {len(unresolved)} unresolved, "
+          f"{len(failed)} failed, {tvdb.network_calls} TVDB request(s).")
+    if deferred:
+        print(Fore.YELLOW + f"TVDB request budget used up; {deferred} show(s) left for the next run.")
+    for name in failed:
+        print(Fore.RED + f"  FAILED: {name}")
+    return not failed
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4 or len(sys.argv) > 5:
-        print("Usage: python update_tv_metadata.py <folder_path> <series_id> <api_key> [--debug]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Tag TV show episodes with metadata and artwork from TVDB.")
+    parser.add_argument("folder_path", help="Path to the TV show folder (the TV root with --library)")
+    parser.add_argument("series_id", nargs="?", help="TVDB series id (with --library, give only the API key)")
+    parser.add_argument("api_key", nargs="?", help="TVDB API key (optional with --snapshot; without it the run is fully offline)")
+    parser.add_argument("--library", action="store_true", help="Tag every show under folder_path, resolving each show folder to a series id")
+    parser.add_argument("--series-map", help="Show folder to series id mapping for --library (default: <folder_path>/.tvdb-series.json)")
+    parser.add_argument("--max-requests", type=int, help="With --library, stop after this many TVDB requests and leave the rest for the next run")
+    parser.add_argument("--rate", type=float, default=5.0, help="With --library, at most this many TVDB requests per second (default: 5)")
+    parser.add_argument("--debug", action="store_true", help="Print API payloads and commands")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL / 3600, help="Hours to reuse cached TVDB responses; 0 disables the disk cache (default: 24)")
+    parser.add_argument("--artwork-ttl", type=float, default=DEFAULT_MAX_AGE / 3600, help=f"Hours to reuse downloaded season artwork before fetching it again (default: {DEFAULT_MAX_AGE // 3600})")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached TVDB responses and fetch fresh ones")
+    parser.add_argument("--remux", action="store_true", help="Write tagged copies (*_updated.mp4) with ffmpeg instead of editing the files in place")
+    parser.add_argument("--snapshot", help="Read series data from a snapshot made with 'python -m media_common.tvdb_snapshot export'")
+    parser.add_argument("--force", action="store_true", help="Re-tag files the manifest says are up to date")
+    parser.add_argument("--plan", action="store_true", help="List the files that would be tagged and exit")
+    parser.add_argument("--hash", action="store_true", help="Also compare a fast partial hash of inputs, not just size and mtime")
+    parser.add_argument("--no-manifest", action="store_true", help="Do not read or write the library manifest")
+    parser.add_argument("--no-index-cache", action="store_true", help="Walk the whole show folder instead of reusing the saved directory index")
+    parser.add_argument("--net-jobs", type=int, default=4, help="Concurrent TVDB/artwork requests (default: 4)")
+    parser.add_argument("--mux-jobs", type=int, default=2, help="Files tagged or remuxed at the same time (default: 2)")
+    parser.add_argument("--sequential", action="store_true", help="Handle one file at a time instead of overlapping network and disk work")
+    parser.add_argument("--from-audit", metavar="REPORT", help="Only tag the files an audit report (python -m media_common.audit) flags as missing tags")
+    faults.add_arguments(parser)
+    output.add_arguments(parser)
+    watch.add_arguments(parser)
+    trace.add_arguments(parser)
+    args = parser.parse_args()
+    if args.failure_report and not args.retry_failed:
+        parser.error("--failure-report only applies with --retry-failed")
+    trace.configure(args.trace, args.profile)
 
-    folder_path = sys.argv[1]
-    series_id = sys.argv[2]
-    api_key = sys.argv[3]
-    debug = len(sys.argv) == 5 and sys.argv[4] == '--debug'
+    if args.library:
+        # 'update_tv_metadata.py --library /tv KEY': the only other positional is the key
+        if args.api_key is not None or args.series_id is None:
+            parser.error("--library takes the TV root and an api_key, no series_id")
+        if args.snapshot or args.watch:
+            parser.error("--snapshot and --watch work on a single show, not with --library")
+        args.api_key, args.series_id = args.series_id, None
+    elif args.series_id is None:
+        parser.error("a series_id is required unless --library is given")
+    elif args.api_key is None and args.snapshot is None:
+        parser.error("an api_key is required unless --snapshot is given")
 
-    if not os.path.isdir(folder_path):
+    if not os.path.isdir(args.folder_path):
         print("Invalid folder path provided.")
         sys.exit(1)
 
-    process_tv_show(folder_path, series_id, api_key, debug)
+    library.open_index(args.folder_path, persist=not args.no_index_cache)
+    only = audit.load_worklist(args.from_audit, 'needs_tags') if args.from_audit else None
+    if args.retry_failed:
+        show_paths = [show.path for show in library.index_for(args.folder_path).shows()] if args.library else [args.folder_path]
+        quarantines = [faults.Quarantine(path) for path in show_paths]
+        failed = faults.failed_paths(quarantines, TAG_OPERATION, args.failure_report)
+        only = failed if only is None else only & failed
+    options = TagOptions(
+        debug=args.debug, cache_ttl=args.cache_ttl * 3600, artwork_ttl=args.artwork_ttl * 3600, refresh=args.refresh,
+        remux=args.remux, force=args.force, plan=args.plan,
+        pipeline=None if args.sequential else dict(net_jobs=args.net_jobs, mux_jobs=args.mux_jobs),
+        outputs=output.from_args(args), only=only, use_manifest=not args.no_manifest, use_hash=args.hash,
+        retry=faults.RetryPolicy(attempts=args.retries), retry_failed=args.retry_failed,
+        snapshot=load_snapshot(args.snapshot) if args.snapshot else None,
+        watch=dict(settle=args.settle, poll_interval=args.poll) if args.watch else None,
+        budget=args.max_requests, rate=args.rate)
+    if args.library:
+        succeeded = process_library(args.folder_path, args.api_key, SeriesMap.for_root(args.folder_path, args.series_map),
+                                    options)
+    else:
+        succeeded = process_tv_show(args.folder_path, args.series_id, args.api_key, options)
+    sys.exit(0 if succeeded else 1)
@@ -1,113 +1,137 @@
 import os
-import re
 import sys
 import argparse
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from media_common import filenames, library, renamer, trace, tvdb_snapshot, watch  # noqa: E402
+
 def get_episode_titles(file_path):
     """
     Reads episode titles from the provided file path and returns a dictionary
-    mapping episode identifiers (e.g., 'S01E01') to their titles.
+    mapping episode identifiers (e.g., 's01e01', or 's01e01-e02' for a double
+    episode listed on one line) to their titles.
     """
     titles = {}
     with open(file_path, 'r') as f:
         for line in f:
-            match = re.match(r'(S\d+E\d+(-E\d+)?)\s+(.+)', line.strip(), re.IGNORECASE)
-            if match:
-                key = match.group(1).lower()
-                title = match.group(3).strip()
-                titles[key] = title
+            parsed = filenames.parse(line.strip())
+            if parsed is not None and parsed.kind == 'episode' and parsed.title:
+                titles[parsed.tag] = parsed.title
     return titles
 
-def rename_files(show_folder, debug):
+def new_episode_name(episode_file, episode_titles, debug_file=None):
+    """
+    Return the 'sXXeYY Title.ext' name for an episode file, or None when its
+    episode numbers or titles cannot be found.
+    """
+    debug = debug_file is not None
+    parsed = filenames.parse(episode_file)
+    if parsed is None or parsed.kind != 'episode':
+        if debug:
+            debug_file.write(f"No match for file: {episode_file}\n")
+        return None
+
+    episodes_key = parsed.tag
+    episode_numbers = parsed.keys
+    if debug:
+        debug_file.write(f"Matching file: {episode_file}\n")
+        debug_file.write(f"  Episodes key: {episodes_key}\n")
+        debug_file.write(f"  Episode numbers: {episode_numbers}\n")
+
+    if episodes_key in episode_titles:
+        # A double episode listed under one title
+        episode_names = episode_titles[episodes_key]
+    elif all(episode in episode_titles for episode in episode_numbers):
+        episode_names = ' & '.join([episode_titles[episode] for episode in episode_numbers])
+    else:
+        if debug:
+            debug_file.write("  Episode title(s) not found for one or more episodes.\n")
+        return None
+
+    new_filename = f"{episodes_key} {episode_names}{parsed.extension}"
+    if debug:
+        debug_file.write(f"  New filename: {new_filename}\n")
+    return new_filename
+
+def season_episode_titles(season_path, snapshot_titles=None):
+    """Episode titles for a season folder, or None if it has no episode-names.txt."""
+    if snapshot_titles is not None:
+        return snapshot_titles
+    if library.index_for(season_path).folder(season_path).has_file('episode-names.txt'):
+        return get_episode_titles(os.path.join(season_path, 'episode-names.txt'))
+    return None
+
+def rename_files(show_folder, debug, snapshot_titles=None, dry_run=False):
     """
     Renames TV show episode files in the specified show folder based on episode titles
-    from 'episode-names.txt' files within each season folder.
+    from 'episode-names.txt' files within each season folder, or from a TVDB snapshot
+    when snapshot_titles is given. All renames are planned first and applied as one
+    journaled batch (see media_common.renamer).
     """
+    moves = []
     debug_file_path = "debug.log"
     debug_file = open(debug_file_path, 'w') if debug else None
 
-    for season_folder in sorted(os.listdir(show_folder)):
+    index = library.index_for(show_folder)
+    for season_folder in index.folder(show_folder).dirs:
         season_path = os.path.join(show_folder, season_folder)
-        if os.path.isdir(season_path) and season_folder.lower().startswith('season'):
-            episode_titles_path = os.path.join(season_path, 'episode-names.txt')
-            if os.path.exists(episode_titles_path):
-                episode_titles = get_episode_titles(episode_titles_path)
+        if season_folder.lower().startswith('season'):
+            season_listing = index.folder(season_path)
+            episode_titles = season_episode_titles(season_path, snapshot_titles)
+            if episode_titles is not None:
                 if debug:
                     debug_file.write(f"Episode titles for {season_folder}:\n")
                     for key, title in episode_titles.items():
                         debug_file.write(f"  {key}: {title}\n")
                     debug_file.write("\n")
 
-                for episode_file in sorted(os.listdir(season_path)):
-                    if episode_file.lower().endswith('.mp4'):
-                        episode_file_path = os.path.join(season_path, episode_file)
-
-                        # First try to match multi-episode files
-                        episode_match = re.match(r'(s\d+e\d+(-e\d+)+).*\.mp4', episode_file, re.IGNORECASE)
-
-                        if episode_match:
-                            episodes_key = episode_match.group(1).lower()
-                            episodes_range = episodes_key.split('-')
-                            episode_numbers = [episodes_range[0]] + [
-                                's' + re.findall(r'\d+', episodes_range[i])[0] + 'e' + re.findall(r'\d+', episodes_range[i + 1])[0]
-                                for i in range(len(episodes_range) - 1)
-                            ]
-
-                            if debug:
-                                debug_file.write(f"Matching file: {episode_file}\n")
-                                debug_file.write(f"  Episodes key: {episodes_key}\n")
-                                debug_file.write(f"  Episode numbers: {episode_numbers}\n")
-
-                            if all(episode in episode_titles for episode in episode_numbers):
-                                episode_names = ' & '.join([episode_titles[episode] for episode in episode_numbers])
-                                new_filename = f"{episodes_key} {episode_names}.mp4"
-                                new_file_path = os.path.join(season_path, new_filename)
-
-                                if debug:
-                                    debug_file.write(f"  New filename: {new_filename}\n")
-                                os.rename(episode_file_path, new_file_path)
-                                print(f"Renamed: {episode_file_path} -> {new_file_path}")
-                            else:
-                                if debug:
-                                    debug_file.write("  Episode title(s) not found for one or more episodes.\n")
-                        else:
-                            # If no match, try to match single-episode files
-                            episode_match = re.match(r'(s\d+e\d+)', episode_file, re.IGNORECASE)
-                            if episode_match:
-                                episodes_key = episode_match.group(1).lower()
-                                episode_numbers = [episodes_key]
-
-                                if debug:
-                                    debug_file.write(f"Matching file (single-episode): {episode_file}\n")
-                                    debug_file.write(f"  Episodes key: {episodes_key}\n")
-                                    debug_file.write(f"  Episode numbers: {episode_numbers}\n")
-
-                                if all(episode in episode_titles for episode in episode_numbers):
-                                    episode_names = ' & '.join([episode_titles[episode] for episode in episode_numbers])
-                                    new_filename = f"{episodes_key} {episode_names}.mp4"
-                                    new_file_path = os.path.join(season_path, new_filename)
-
-                                    if debug:
-                                        debug_file.write(f"  New filename: {new_filename}\n")
-                                    os.rename(episode_file_path, new_file_path)
-                                    print(f"Renamed: {episode_file_path} -> {new_file_path}")
-                                else:
-                                    if debug:
-                                        debug_file.write("  Episode title(s) not found for the episode.\n")
-                            else:
-                                if debug:
-                                    debug_file.write(f"No match for file: {episode_file}\n")
+                for episode_file in season_listing.files:
+                    if episode_file.lower().endswith(filenames.CONTAINER_EXTENSIONS):
+                        new_filename = new_episode_name(episode_file, episode_titles, debug_file)
+                        if new_filename:
+                            moves.append((os.path.join(season_path, episode_file), os.path.join(season_path, new_filename)))
                     if debug:
                         debug_file.write("\n")
 
+    renamer.apply_moves(moves, show_folder, dry_run, exists=index.exists)
+
     if debug:
         debug_file.close()
         print(f"Debug information written to {debug_file_path}")
 
+def watch_show(show_folder, snapshot_titles=None, settle=watch.DEFAULT_SETTLE, poll=None):
+    """Rename episodes as they land in the show's season folders."""
+    def handle(job):
+        if not os.path.basename(job.folder).lower().startswith('season') or not job.video.lower().endswith(filenames.CONTAINER_EXTENSIONS):
+            return
+        episode_titles = season_episode_titles(job.folder, snapshot_titles)
+        new_filename = new_episode_name(job.video, episode_titles) if episode_titles else None
+        if new_filename and new_filename != job.video:
+            renamer.apply_moves([(job.path, os.path.join(job.folder, new_filename))], show_folder,
+                                exists=library.index_for(show_folder).exists)
+
+    return watch.Watcher(show_folder, handle, settle=settle, poll_interval=poll).run()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Rename TV show episodes based on episode titles.")
     parser.add_argument("show_folder", help="Path to the TV show folder")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument("--snapshot", help="Take episode titles from a TVDB snapshot instead of episode-names.txt")
+    parser.add_argument("--order", default="aired", help="Season order to use from the snapshot: aired, dvd or absolute (default: aired)")
+    renamer.add_arguments(parser)
+    watch.add_arguments(parser)
+    trace.add_arguments(parser)
     args = parser.parse_args()
+    trace.configure(args.trace, args.profile)
+
+    if renamer.run_journal_command(args.show_folder, args.undo, args.resume):
+        sys.exit(0)
+
+    snapshot_titles = None
+    if args.snapshot:
+        snapshot_titles = tvdb_snapshot.episode_titles(tvdb_snapshot.load_snapshot(args.snapshot), args.order)
 
-    rename_files(args.show_folder, args.debug)
+    library.open_index(args.show_folder, persist=False)
+    if args.watch:
+        sys.exit(1 if watch_show(args.show_folder, snapshot_titles, args.settle, args.poll) else 0)
+    rename_files(args.show_folder, args.debug, snapshot_titles, args.dry_run)
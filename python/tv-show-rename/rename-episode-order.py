@@ -2,9 +2,13 @@ import os
 import argparse
 import logging
 import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from media_common import filenames, library, renamer, title_match, trace, tvdb_snapshot  # noqa: E402
 
 def parse_episode_names(file_path):
-    """Parse the episode-names.txt file and return a dictionary mapping episode titles to correct season/episode numbers."""
+    """Parse the episode-names.txt file and return a dictionary mapping correct season/episode numbers to episode titles."""
     episode_dict = {}
     with open(file_path, 'r') as file:
         for line in file:
@@ -12,51 +16,86 @@ def parse_episode_names(file_path):
             match = re.match(r"(\S+)\s+(.+)", line.strip())
             if match:
                 episode_key, episode_title = match.groups()
-                episode_dict[episode_title.strip().lower()] = episode_key.strip().lower()
+                episode_dict[episode_key.strip().lower()] = episode_title.strip()
     return episode_dict
 
-def rename_and_move_episodes(folder, episode_dict, debug=False):
-    """Rename the episodes in the given folder based on the episode_dict mapping and move them to season folders."""
+def snapshot_episode_dict(snapshot, order='aired'):
+    """Build the same 'sXXeYY' -> title mapping as parse_episode_names from a TVDB snapshot."""
+    return {key: title.strip() for key, title in tvdb_snapshot.episode_titles(snapshot, order).items()}
+
+def rename_and_move_episodes(folder, episode_dict, debug=False, dry_run=False,
+                             min_score=title_match.DEFAULT_MIN_SCORE, report=False):
+    """
+    Rename the episodes in the given folder based on the episode_dict mapping and move them to season folders.
+    File titles are matched to episode titles fuzzily (see media_common.title_match), each episode going to
+    at most one file. Swapped episode numbers and name collisions are resolved by the rename planner before
+    anything moves.
+    """
     if debug:
         logging.basicConfig(filename=os.path.join(folder, 'debug.log'), level=logging.DEBUG)
 
     # Get the list of files and sort them alphabetically
-    files = sorted(os.listdir(folder))
+    index = library.index_for(folder)
+    files = index.folder(folder).files
 
+    episodes = []
     for filename in files:
-        if filename.endswith(".mp4") or filename.endswith(".mkv"):
-            parts = filename.split(' ', 1)
-            if len(parts) == 2:
-                current_key, episode_title = parts
-                episode_title, file_extension = os.path.splitext(episode_title)  # Separate the title and extension
-                correct_key = episode_dict.get(episode_title.lower())
-                if correct_key:
-                    new_filename = f"{correct_key} {episode_title}{file_extension}"
-                    season_folder = f"Season {correct_key[1:3]}"
-                    season_folder_path = os.path.join(folder, season_folder)
-
-                    # Create season folder if it does not exist
-                    if not os.path.exists(season_folder_path):
-                        os.makedirs(season_folder_path)
-
-                    if debug:
-                        logging.debug(f"Renaming '{filename}' to '{new_filename}' and moving to '{season_folder}'")
-                        print(f"Renaming '{filename}' to '{new_filename}' and moving to '{season_folder}'")
-
-                    # Rename and move the file
-                    os.rename(os.path.join(folder, filename), os.path.join(season_folder_path, new_filename))
+        parsed = filenames.parse(filename)
+        if parsed is not None and parsed.is_video and parsed.kind in ('episode', 'absolute') and parsed.title:
+            episodes.append((filename, parsed.title, parsed.extension))
+
+    result = title_match.assign([title for _, title, _ in episodes], title_match.TitleIndex(episode_dict), min_score)
+
+    moves = []
+    for match in result.matches:
+        filename, episode_title, file_extension = episodes[match.item]
+        correct_key = match.key
+        if episode_title.lower() != match.title.lower():
+            # Fuzzy match: use the episode list's spelling, minus anything that would make a path
+            episode_title = match.title.replace('/', '-')
+        new_filename = f"{correct_key} {episode_title}{file_extension}"
+        season_folder = f"Season {correct_key[1:3]}"
+        season_folder_path = os.path.join(folder, season_folder)
+
+        if debug:
+            logging.debug(f"Renaming '{filename}' to '{new_filename}' and moving to '{season_folder}' (score {match.score:.2f})")
+            print(f"Renaming '{filename}' to '{new_filename}' and moving to '{season_folder}'")
+
+        # Season folders that do not exist yet are created when the batch runs
+        moves.append((os.path.join(folder, filename), os.path.join(season_folder_path, new_filename)))
+
+    if report or debug:
+        for line in result.report():
+            print(line)
+    elif result.unmatched:
+        print(f"{len(result.unmatched)} file(s) matched no episode; use --report to list them.")
+
+    renamer.apply_moves(moves, folder, dry_run, exists=index.exists)
 
 def main():
     parser = argparse.ArgumentParser(description='Rename TV show episodes to correct season and episode numbers and move them to season folders.')
     parser.add_argument('folder', type=str, help='Folder containing the episodes to rename')
     parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('--snapshot', help='Take episode titles from a TVDB snapshot instead of episode-names.txt')
+    parser.add_argument('--order', default='aired', help='Season order to use from the snapshot: aired, dvd or absolute (default: aired)')
+    parser.add_argument('--min-score', type=float, default=title_match.DEFAULT_MIN_SCORE,
+                        help=f'Lowest title similarity (0-1) accepted as a match (default: {title_match.DEFAULT_MIN_SCORE})')
+    parser.add_argument('--report', action='store_true', help='List fuzzy matches with their scores and everything left unmatched')
+    renamer.add_arguments(parser)
+    trace.add_arguments(parser)
     args = parser.parse_args()
+    trace.configure(args.trace, args.profile)
 
-    # Get the path to the episode-names.txt file in the same directory as the episodes
-    episode_names_path = os.path.join(args.folder, 'episode-names.txt')
+    if renamer.run_journal_command(args.folder, args.undo, args.resume):
+        return
 
-    episode_dict = parse_episode_names(episode_names_path)
-    rename_and_move_episodes(args.folder, episode_dict, args.debug)
+    if args.snapshot:
+        episode_dict = snapshot_episode_dict(tvdb_snapshot.load_snapshot(args.snapshot), args.order)
+    else:
+        # Get the path to the episode-names.txt file in the same directory as the episodes
+        episode_names_path = os.path.join(args.folder, 'episode-names.txt')
+        episode_dict = parse_episode_names(episode_names_path)
+    rename_and_move_episodes(args.folder, episode_dict, args.debug, args.dry_run, args.min_score, args.report)
 
 if __name__ == "__main__":
     main()
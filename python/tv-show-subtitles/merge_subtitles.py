@@ -1,85 +1,66 @@
+import argparse
+import collections
+import functools
 import os
 import subprocess
 import sys
 import pprint
 import shlex
 
-DEBUG = False
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from media_common import probe  # noqa: E402
+from media_common import audit, faults, library, output, scheduler, subtitles, trace, watch  # noqa: E402
+from media_common.manifest import Manifest  # noqa: E402
+from media_common.probe_cache import ProbeCache  # noqa: E402
 
-def run_command(cmd):
+DEBUG = False
+PROBE_CACHE = None
+MANIFEST = None
+FORCE = False
+REPAIR_SUBTITLES = False
+OUTPUT = output.OutputStrategy()
+# Paths an audit report flagged (--from-audit) or that failed before (--retry-failed); None processes everything
+WORKLIST = None
+QUARANTINE = None
+RETRY_FAILED = False
+RETRY = faults.RetryPolicy()
+
+MERGE_OPERATION = 'merge_subtitles'
+# Anything that changes the produced file belongs here so a change re-processes the library
+MERGE_PARAMS = {'subtitle_codec': 'mov_text', 'language': 'eng'}
+
+def merge_params(subtitle_file_paths, video_file):
+    """MERGE_PARAMS with the subtitle languages the filenames give; English-only outputs keep the old params."""
+    video_base = os.path.splitext(video_file)[0]
+    languages = sorted({subtitles.subtitle_language(os.path.basename(p), video_base) for p in subtitle_file_paths})
+    return dict(MERGE_PARAMS, language=','.join(languages))
+
+def run_command(cmd, timeout=faults.PROBE_TIMEOUT):
     if DEBUG:
         print("Running command:", ' '.join(shlex.quote(arg) for arg in cmd))
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    result = trace.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True, timeout=timeout)
     if DEBUG:
         print("Command output:", result.stdout)
         print("Command error (if any):", result.stderr)
     return result
 
-def get_audio_track_count(video_file_path):
-    cmd = [
-        'ffprobe',
-        '-v', 'error',
-        '-select_streams', 'a',
-        '-show_entries', 'stream=index',
-        '-of', 'csv=p=0',
-        video_file_path
-    ]
-    result = run_command(cmd)
-    return len(result.stdout.strip().split('\n'))
-
-def get_audio_track_language(video_file_path, track_index):
-    cmd = [
-        'ffprobe',
-        '-v', 'error',
-        f'-select_streams', f'a:{track_index}',
-        '-show_entries', 'stream_tags=language',
-        '-of', 'csv=p=0',
-        video_file_path
-    ]
-    result = run_command(cmd)
-    return result.stdout.strip()
-
-def get_audio_track_title(video_file_path, track_index):
-    cmd = [
-        'ffprobe',
-        '-v', 'error',
-        f'-select_streams', f'a:{track_index}',
-        '-show_entries', 'stream_tags=title',
-        '-of', 'csv=p=0',
-        video_file_path
-    ]
-    result = run_command(cmd)
-    return result.stdout.strip()
-
-def get_audio_channels(video_file_path, track_index):
-    cmd = [
-        'ffprobe',
-        '-v', 'error',
-        f'-select_streams', f'a:{track_index}',
-        '-show_entries', 'stream=channels',
-        '-of', 'csv=p=0',
-        video_file_path
-    ]
-    result = run_command(cmd)
-    return int(result.stdout.strip())
-
-def add_audio_metadata_commands(video_file_path, command):
-    audio_count = get_audio_track_count(video_file_path)
-    if audio_count > 0:
-        print(f"Found {audio_count} audio track(s). Setting language to English.")
-        for i in range(audio_count):
-            audio_language = get_audio_track_language(video_file_path, i)
-            if audio_language == 'eng' or audio_language == 'und':
-                current_title = get_audio_track_title(video_file_path, i)
-                channels = get_audio_channels(video_file_path, i)
-                if channels == 1:
+def probe_video(video_file_path):
+    return probe.probe_file(video_file_path, runner=run_command, cache=PROBE_CACHE)
+
+def add_audio_metadata_commands(media_info, command):
+    audio_streams = media_info.audio_streams
+    if audio_streams:
+        print(f"Found {len(audio_streams)} audio track(s). Setting language to English.")
+        for i, stream in enumerate(audio_streams):
+            if stream.language in ('eng', 'und'):
+                if stream.channels == 1:
                     base_title = "Mono Audio"
-                elif channels == 2:
+                elif stream.channels == 2:
                     base_title = "Stereo Audio"
                 else:
                     base_title = "Surround Audio"
 
-                if "commentary" in current_title.lower():
+                if "commentary" in stream.title.lower():
                     base_title += " (Commentary)"
 
                 command.extend([
@@ -93,131 +74,393 @@ def add_audio_metadata_commands(video_file_path, command):
     else:
         print("No audio tracks found in the video file.")
 
-def merge_subtitles_in_season(season_folder_path):
-    files = sorted([f for f in os.listdir(season_folder_path) if f.endswith('.mp4')])
+def check_subtitles(subtitle_file_paths, video_file, normalize=True):
+    """
+    Validate the subtitles for one video before anything is remuxed. Returns
+    the checked subtitles, or None after printing why one of them is unusable.
+    """
+    video_base = os.path.splitext(video_file)[0]
+    checked = [subtitles.inspect(p, video_base, repair=REPAIR_SUBTITLES, normalize=normalize) for p in subtitle_file_paths]
+    for subtitle in checked:
+        # Warnings are printed when the file is muxed, not again while planning
+        if normalize and subtitle.ok and subtitle.warnings:
+            print(f"Subtitle warning: {subtitle.describe()}")
+    rejected = [subtitle for subtitle in checked if not subtitle.ok]
+    for subtitle in rejected:
+        print(f"Rejected subtitle {subtitle.describe()}")
+    if rejected:
+        for subtitle in checked:
+            subtitle.cleanup()
+        return None
+    return checked
+
+def verify_merge(media_info, output_file_path, added_subtitles):
+    """Check a merged file kept every stream but the dropped non-English audio, and gained the subtitles."""
+    dropped = sum(1 for stream in media_info.audio_streams if stream.language not in ('eng', 'und'))
+    layout = output.expected_layout(media_info, add={'subtitle': added_subtitles}, drop={'audio': dropped})
+    output.verify(output_file_path, layout, media_info.duration, runner=run_command)
+
+def listing(folder_path):
+    return library.index_for(folder_path).folder(folder_path)
+
+def season_video_files(season_folder_path):
+    return listing(season_folder_path).videos(('.mp4',))
+
+def episode_paths(season_folder_path, video_file):
+    base_name = os.path.splitext(video_file)[0]
+    video_file_path = os.path.join(season_folder_path, video_file)
+    subtitle_file_path = os.path.join(season_folder_path, f"{base_name}.srt")
+    output_file_path = OUTPUT.destination(video_file_path, os.path.join(season_folder_path, f"{base_name}.output.mp4"))
+    return video_file_path, subtitle_file_path, output_file_path
+
+def already_merged(media_info, checked):
+    """
+    With --replace the sidecars stay beside the merged original, so a later run
+    (or the watcher seeing the replace land) must not add the same tracks again.
+    """
+    if not OUTPUT.replaces:
+        return False
+    embedded = collections.Counter(stream.language for stream in media_info.subtitle_streams)
+    wanted = collections.Counter(subtitle.language for subtitle in checked)
+    return all(embedded[language] >= count for language, count in wanted.items())
+
+def merge_subtitles_in_episode(season_folder_path, video_file):
+    video_file_path, subtitle_file_path, output_file_path = episode_paths(season_folder_path, video_file)
+
+    if not os.path.isfile(subtitle_file_path):
+        print(f"Subtitle file not found for {video_file}. Skipping.")
+        return
 
-    for video_file in files:
-        base_name = os.path.splitext(video_file)[0]
-        video_file_path = os.path.join(season_folder_path, video_file)
-        subtitle_file_path = os.path.join(season_folder_path, f"{base_name}.srt")
-        output_file_path = os.path.join(season_folder_path, f"{base_name}.output.mp4")
+    checked = check_subtitles([subtitle_file_path], video_file)
+    if checked is None:
+        raise subtitles.SubtitleError(f"Unusable subtitle for {video_file}")
+    subtitle = checked[0]
+
+    command = [
+        'ffmpeg',
+        '-y',  # Overwrite output files without asking
+        '-i', video_file_path,
+        '-i', subtitle.path,
+        '-map', '0',
+        '-map', '1',
+        '-c:v', 'copy',
+        '-c:a', 'copy',
+        '-c:s', 'mov_text',
+        '-metadata:s:v:0', 'language=eng',
+        '-metadata:s:s:0', f'language={subtitle.language}'
+    ]
 
-        if not os.path.isfile(subtitle_file_path):
-            print(f"Subtitle file not found for {video_file}. Skipping.")
-            continue
+    try:
+        media_info = probe_video(video_file_path)
+        if already_merged(media_info, checked):
+            print(f"{video_file} already has {subtitle.language} subtitles. Skipping.")
+            return
+        add_audio_metadata_commands(media_info, command)
 
-        command = [
-            'ffmpeg',
-            '-y',  # Overwrite output files without asking
-            '-i', video_file_path,
-            '-i', subtitle_file_path,
-            '-map', '0',
-            '-map', '1',
-            '-c:v', 'copy',
-            '-c:a', 'copy',
-            '-c:s', 'mov_text',
-            '-metadata:s:v:0', 'language=eng',
-            '-metadata:s:s:0', 'language=eng'
-        ]
+        needed = os.path.getsize(video_file_path) + os.path.getsize(subtitle.path)
+        with OUTPUT.writing(video_file_path, output_file_path, needed) as partial_path:
+            command.extend(output.ffmpeg_output_args(partial_path))
 
-        add_audio_metadata_commands(video_file_path, command)
+            print("Executing ffmpeg command:")
+            pprint.pprint(command)
 
-        command.append(output_file_path)
+            run_command(command, timeout=faults.subprocess_timeout(needed))
+            if OUTPUT.replaces:
+                verify_merge(media_info, partial_path, 1)
+    finally:
+        subtitle.cleanup()
+    print(f"Processed {video_file} successfully in {season_folder_path}.")
 
-        print("Executing ffmpeg command:")
-        pprint.pprint(command)
+def merge_subtitles_in_season(season_folder_path):
+    for video_file in season_video_files(season_folder_path):
+        merge_subtitles_in_episode(season_folder_path, video_file)
 
-        run_command(command)
-        print(f"Processed {video_file} successfully in {season_folder_path}.")
+def movie_folder_files(movie_folder_path):
+    folder = listing(movie_folder_path)
+    files = folder.videos(('.mp4',))
+    return (files[0] if files else None), folder.subtitles()
+
+def movie_output_path(movie_folder_path, video_file):
+    video_file_path = os.path.join(movie_folder_path, video_file)
+    return OUTPUT.destination(video_file_path, os.path.join(movie_folder_path, f"{os.path.splitext(video_file)[0]}.output.mp4"))
 
 def merge_subtitles_in_movie_folder(movie_folder_path):
-    files = [f for f in os.listdir(movie_folder_path) if f.endswith('.mp4')]
-    if not files:
+    video_file, subtitle_files = movie_folder_files(movie_folder_path)
+    if video_file is None:
         print(f"No MP4 files found in {movie_folder_path}.")
         return
 
-    video_file = files[0]
     video_file_path = os.path.join(movie_folder_path, video_file)
-    subtitle_files = [f for f in os.listdir(movie_folder_path) if f.endswith('.srt')]
     if not subtitle_files:
         print(f"No subtitle files found in {movie_folder_path}. Skipping {video_file}.")
         return
 
-    base_name = os.path.splitext(video_file)[0]
-    output_file_path = os.path.join(movie_folder_path, f"{base_name}.output.mp4")
+    output_file_path = movie_output_path(movie_folder_path, video_file)
+
+    # Languages and SDH/Forced/CC track names come from the same pass that validates each file
+    checked = check_subtitles([os.path.join(movie_folder_path, f) for f in subtitle_files], video_file)
+    if checked is None:
+        raise subtitles.SubtitleError(f"Unusable subtitle for {video_file}")
 
     command = ['ffmpeg', '-y', '-i', video_file_path]
 
-    for subtitle_file in subtitle_files:
-        subtitle_file_path = os.path.join(movie_folder_path, subtitle_file)
-        command.extend(['-i', subtitle_file_path])
+    for subtitle in checked:
+        command.extend(['-i', subtitle.path])
 
     command.extend(['-map', '0', '-c:v', 'copy', '-c:a', 'copy'])
 
-    for i, subtitle_file in enumerate(subtitle_files):
+    for i, subtitle in enumerate(checked):
         map_command = ['-map', str(i + 1)]
-        language_command = ['-metadata:s:s:' + str(i), 'language=eng']
-
-        if 'sdh' in subtitle_file.lower():
-            track_name = 'Subtitle Track [SDH]'
-        elif 'forced' in subtitle_file.lower():
-            track_name = 'Subtitle Track [Forced]'
-        elif 'cc' in subtitle_file.lower():
-            track_name = 'Subtitle Track [CC]'
-        else:
-            track_name = 'Subtitle Track'
-
-        metadata_command = ['-metadata:s:s:' + str(i), f'title={track_name}']
+        language_command = ['-metadata:s:s:' + str(i), f'language={subtitle.language}']
+        metadata_command = ['-metadata:s:s:' + str(i), f'title={subtitle.track_name}']
         command.extend(map_command + language_command + metadata_command)
 
-    add_audio_metadata_commands(video_file_path, command)
-
-    command.extend(['-metadata:s:v:0', 'language=eng', '-metadata:s:a:0', 'language=eng', '-c:s', 'mov_text'])
-    command.append(output_file_path)
+    try:
+        media_info = probe_video(video_file_path)
+        if already_merged(media_info, checked):
+            print(f"{video_file} already has its subtitles. Skipping.")
+            return
+        add_audio_metadata_commands(media_info, command)
 
-    print("Executing ffmpeg command:")
-    pprint.pprint(command)
+        command.extend(['-metadata:s:v:0', 'language=eng', '-metadata:s:a:0', 'language=eng', '-c:s', 'mov_text'])
 
-    run_command(command)
-    print(f"Processed {video_file} successfully in {movie_folder_path}.")
+        needed = os.path.getsize(video_file_path) + sum(os.path.getsize(s.path) for s in checked)
+        with OUTPUT.writing(video_file_path, output_file_path, needed) as partial_path:
+            command.extend(output.ffmpeg_output_args(partial_path))
 
-def process_tv_show_folder(tv_show_folder_path):
-    season_folders = sorted([os.path.join(tv_show_folder_path, d) for d in os.listdir(tv_show_folder_path) if os.path.isdir(os.path.join(tv_show_folder_path, d))])
+            print("Executing ffmpeg command:")
+            pprint.pprint(command)
 
-    for season_folder in season_folders:
-        print(f"Processing season folder: {season_folder}")
-        merge_subtitles_in_season(season_folder)
+            run_command(command, timeout=faults.subprocess_timeout(needed))
+            if OUTPUT.replaces:
+                verify_merge(media_info, partial_path, len(checked))
+    finally:
+        for subtitle in checked:
+            subtitle.cleanup()
+    print(f"Processed {video_file} successfully in {movie_folder_path}.")
 
-    print("All season folders processed successfully.")
+def subfolders(folder_path):
+    return [os.path.join(folder_path, d) for d in listing(folder_path).dirs]
 
-def process_movie_folder(movie_folder_path):
-    movie_folders = sorted([os.path.join(movie_folder_path, d) for d in os.listdir(movie_folder_path) if os.path.isdir(os.path.join(movie_folder_path, d))])
+def in_worklist(video_file_path):
+    return WORKLIST is None or os.path.abspath(video_file_path) in WORKLIST
 
-    for movie_folder in movie_folders:
-        print(f"Processing movie folder: {movie_folder}")
-        merge_subtitles_in_movie_folder(movie_folder)
+def held_back(video_file_path):
+    """Failed deterministically on an earlier run and unchanged since; --retry-failed runs it anyway."""
+    return QUARANTINE is not None and not RETRY_FAILED and QUARANTINE.holds(video_file_path, MERGE_OPERATION)
 
-    print("All movie folders processed successfully.")
+def quarantine_results(results):
+    """Record this run's failures in the quarantine and take the files that now worked out of it."""
+    if QUARANTINE is None:
+        return
+    for result in results:
+        if result.ok:
+            QUARANTINE.clear(result.job.path, MERGE_OPERATION)
+        elif not result.skipped:
+            QUARANTINE.add(result.job.path, result.error, MERGE_OPERATION)
+    QUARANTINE.save()
+    if QUARANTINE.paths(MERGE_OPERATION):
+        print(QUARANTINE.summary(MERGE_OPERATION))
+
+def is_up_to_date(video_file_path, inputs, output_file_path, params=MERGE_PARAMS):
+    if MANIFEST is None or FORCE:
+        return False
+    return MANIFEST.is_done(MERGE_OPERATION, video_file_path, inputs, params, output_file_path)
+
+def recorded(video_file_path, inputs, output_file_path, func, params=MERGE_PARAMS):
+    """Wrap a job so a successful run is written to the manifest."""
+    def run():
+        func()
+        if MANIFEST is not None:
+            MANIFEST.record(MERGE_OPERATION, video_file_path, inputs, params, output_file_path)
+    return run
+
+def run_work(work, skipped, jobs, per_volume, fail_fast, plan, rejected=0, held=0):
+    if skipped:
+        print(f"Skipping {skipped} file(s) already up to date (use --force to redo them).")
+    if held:
+        print(f"Holding back {held} file(s) that failed before and have not changed (use --retry-failed to try them again).")
+    if rejected:
+        print(f"Skipping {rejected} file(s) with unusable subtitles"
+              + ("." if REPAIR_SUBTITLES else " (use --repair-subtitles to fix what can be fixed)."))
+    if plan:
+        print(f"{len(work)} file(s) pending:")
+        for job in work:
+            print(f"  {job.path}")
+        return True
+    try:
+        results = scheduler.run_jobs(work, max_workers=jobs, per_volume=per_volume, fail_fast=fail_fast, retry=RETRY)
+    except Exception as e:
+        # --fail-fast re-raises the first failure; what ran until then is still recorded
+        quarantine_results(getattr(e, 'results', []))
+        raise
+    quarantine_results(results)
+    return scheduler.summarize(results) == 0 and not rejected
+
+def process_tv_show_folder(tv_show_folder_path, jobs=1, per_volume=1, fail_fast=False, plan=False):
+    work = []
+    skipped = rejected = held = 0
+    for season_folder in subfolders(tv_show_folder_path):
+        print(f"Processing season folder: {season_folder}")
+        for video_file in season_video_files(season_folder):
+            video_file_path, subtitle_file_path, output_file_path = episode_paths(season_folder, video_file)
+            if not in_worklist(video_file_path):
+                continue
+            if held_back(video_file_path):
+                held += 1
+                continue
+            if not listing(season_folder).has_file(os.path.basename(subtitle_file_path)):
+                print(f"Subtitle file not found for {video_file}. Skipping.")
+                continue
+            inputs = [video_file_path, subtitle_file_path]
+            params = merge_params([subtitle_file_path], video_file)
+            if is_up_to_date(video_file_path, inputs, output_file_path, params):
+                skipped += 1
+                continue
+            if check_subtitles([subtitle_file_path], video_file, normalize=False) is None:
+                rejected += 1
+                continue
+            work.append(scheduler.Job(
+                label=os.path.join(os.path.basename(season_folder), video_file),
+                path=video_file_path,
+                func=recorded(video_file_path, inputs, output_file_path,
+                              functools.partial(merge_subtitles_in_episode, season_folder, video_file), params)
+            ))
+
+    if not run_work(work, skipped, jobs, per_volume, fail_fast, plan, rejected, held):
+        return False
+    if not plan:
+        print("All season folders processed successfully.")
+    return True
+
+def process_movie_folder(movie_folder_path, jobs=1, per_volume=1, fail_fast=False, plan=False):
+    work = []
+    skipped = rejected = held = 0
+    for movie_folder in subfolders(movie_folder_path):
+        video_file, subtitle_files = movie_folder_files(movie_folder)
+        if WORKLIST is not None and (video_file is None or not in_worklist(os.path.join(movie_folder, video_file))):
+            continue
+        if video_file is not None and subtitle_files:
+            video_file_path = os.path.join(movie_folder, video_file)
+            if held_back(video_file_path):
+                held += 1
+                continue
+            inputs = [video_file_path] + [os.path.join(movie_folder, f) for f in subtitle_files]
+            output_file_path = movie_output_path(movie_folder, video_file)
+            params = merge_params(inputs[1:], video_file)
+            if is_up_to_date(video_file_path, inputs, output_file_path, params):
+                skipped += 1
+                continue
+            if check_subtitles(inputs[1:], video_file, normalize=False) is None:
+                rejected += 1
+                continue
+            func = recorded(video_file_path, inputs, output_file_path,
+                            functools.partial(merge_subtitles_in_movie_folder, movie_folder), params)
+        else:
+            # Let the folder job report what is missing
+            video_file_path = movie_folder
+            func = functools.partial(merge_subtitles_in_movie_folder, movie_folder)
+        work.append(scheduler.Job(label=os.path.basename(movie_folder), path=video_file_path, func=func))
+
+    if not run_work(work, skipped, jobs, per_volume, fail_fast, plan, rejected, held):
+        return False
+    if not plan:
+        print("All movie folders processed successfully.")
+    return True
+
+def watch_folder(mode, folder_path, workers=1, settle=watch.DEFAULT_SETTLE, poll=None):
+    """Merge subtitles into episodes (or movies) as soon as the video and its .srt files have landed."""
+    def handle(job):
+        if not job.video.endswith('.mp4') or not job.subtitles:
+            return
+        if mode == 'tv':
+            video_file_path, subtitle_file_path, output_file_path = episode_paths(job.folder, job.video)
+            if os.path.basename(subtitle_file_path) not in job.subtitles:
+                return
+            inputs = [video_file_path, subtitle_file_path]
+            params = merge_params([subtitle_file_path], job.video)
+            func = functools.partial(merge_subtitles_in_episode, job.folder, job.video)
+        else:
+            video_file, subtitle_files = movie_folder_files(job.folder)
+            if video_file != job.video:
+                return
+            video_file_path = job.path
+            inputs = [video_file_path] + [os.path.join(job.folder, f) for f in subtitle_files]
+            output_file_path = movie_output_path(job.folder, video_file)
+            params = merge_params(inputs[1:], video_file)
+            func = functools.partial(merge_subtitles_in_movie_folder, job.folder)
+        if is_up_to_date(video_file_path, inputs, output_file_path, params):
+            return
+        faults.quarantined_call(RETRY, QUARANTINE, MERGE_OPERATION, video_file_path,
+                                recorded(video_file_path, inputs, output_file_path, func, params))
+
+    watcher = watch.Watcher(folder_path, handle, settle=settle, workers=workers, poll_interval=poll,
+                            ignore=lambda name: name.endswith('.output.mp4'))
+    return watcher.run() == 0
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python merge_subtitles.py <tv|movies> <folder_path> [--debug]")
-        sys.exit(1)
-
-    mode = sys.argv[1]
-    folder_path = sys.argv[2]
-
-    if len(sys.argv) == 4 and sys.argv[3] == '--debug':
-        DEBUG = True
-
-    if not os.path.isdir(folder_path):
+    parser = argparse.ArgumentParser(description="Merge .srt subtitles into MP4 files and label their audio tracks.")
+    parser.add_argument("mode", choices=['tv', 'movies'], help="Process a TV show folder or a folder of movie folders")
+    parser.add_argument("folder_path", help="Path to the TV show or movies folder")
+    parser.add_argument("--debug", action="store_true", help="Print every command and its output")
+    parser.add_argument("--no-probe-cache", action="store_true", help="Always run ffprobe instead of using the probe cache")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of files to process concurrently (default: 1)")
+    parser.add_argument("--per-volume", type=int, default=1, help="Maximum concurrent jobs on the same disk (default: 1)")
+    parser.add_argument("--fail-fast", action="store_true", help="Stop starting new files after the first failure")
+    # Continuing past failures is the default now; kept so existing command lines still work
+    parser.add_argument("--keep-going", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--force", action="store_true", help="Re-process files the manifest says are up to date")
+    parser.add_argument("--plan", action="store_true", help="List the files that would be processed and exit")
+    parser.add_argument("--hash", action="store_true", help="Also compare a fast partial hash of inputs, not just size and mtime")
+    parser.add_argument("--no-manifest", action="store_true", help="Do not read or write the library manifest")
+    parser.add_argument("--repair-subtitles", action="store_true", help="Fix bad subtitle timings in a temporary copy instead of skipping the file")
+    parser.add_argument("--no-index-cache", action="store_true", help="Walk the whole library instead of reusing the saved directory index")
+    parser.add_argument("--from-audit", metavar="REPORT", help="Only process the files an audit report (python -m media_common.audit) flags as needing subtitles")
+    output.add_arguments(parser)
+    faults.add_arguments(parser)
+    watch.add_arguments(parser)
+    trace.add_arguments(parser)
+    args = parser.parse_args()
+    if args.failure_report and not args.retry_failed:
+        parser.error("--failure-report only applies with --retry-failed")
+
+    DEBUG = args.debug
+    OUTPUT = output.from_args(args)
+    trace.configure(args.trace, args.profile)
+    FORCE = args.force
+    REPAIR_SUBTITLES = args.repair_subtitles
+    RETRY = faults.RetryPolicy(attempts=args.retries)
+    if args.from_audit:
+        WORKLIST = audit.load_worklist(args.from_audit, 'needs_merge')
+
+    if not args.no_probe_cache:
+        PROBE_CACHE = ProbeCache()
+
+    if not os.path.isdir(args.folder_path):
         print("Invalid folder path provided.")
         sys.exit(1)
 
-    if mode == 'tv':
-        process_tv_show_folder(folder_path)
-    elif mode == 'movies':
-        process_movie_folder(folder_path)
+    library.open_index(args.folder_path, persist=not args.no_index_cache)
+
+    if not args.no_manifest:
+        MANIFEST = Manifest(args.folder_path, use_hash=args.hash)
+    QUARANTINE = faults.Quarantine(args.folder_path)
+    if args.retry_failed:
+        RETRY_FAILED = True
+        failed = faults.failed_paths([QUARANTINE], MERGE_OPERATION, args.failure_report)
+        WORKLIST = failed if WORKLIST is None else WORKLIST & failed
+
+    options = dict(jobs=args.jobs, per_volume=args.per_volume, fail_fast=args.fail_fast, plan=args.plan)
+    if args.watch:
+        succeeded = watch_folder(args.mode, args.folder_path, workers=args.jobs, settle=args.settle, poll=args.poll)
+    elif args.mode == 'tv':
+        succeeded = process_tv_show_folder(args.folder_path, **options)
     else:
-        print("Invalid mode provided. Use 'tv' or 'movies'.")
-        sys.exit(1)
+        succeeded = process_movie_folder(args.folder_path, **options)
+
+    if PROBE_CACHE is not None:
+        stats = PROBE_CACHE.stats()
+        print(f"Probe cache: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['entries']} entries.")
+        PROBE_CACHE.close()
+
+    sys.exit(0 if succeeded else 1)